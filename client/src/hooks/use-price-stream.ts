@@ -0,0 +1,36 @@
+import { useEffect } from "react"
+import { useQueryClient } from "@tanstack/react-query"
+
+import type { AvailableAsset } from "@shared/schema"
+
+type PriceFrame = {
+  version: number
+  prices: Record<string, number>
+}
+
+export function usePriceStream() {
+  const queryClient = useQueryClient()
+
+  useEffect(() => {
+    if (typeof EventSource === "undefined") return
+
+    const source = new EventSource("/api/assets/stream")
+
+    const onPrices = (event: MessageEvent<string>) => {
+      const frame: PriceFrame = JSON.parse(event.data)
+      queryClient.setQueryData<AvailableAsset[]>(["/api/assets"], (assets) =>
+        assets?.map((asset) =>
+          asset.symbol in frame.prices
+            ? { ...asset, currentPrice: String(frame.prices[asset.symbol]) }
+            : asset
+        )
+      )
+    }
+
+    source.addEventListener("prices", onPrices as EventListener)
+    return () => {
+      source.removeEventListener("prices", onPrices as EventListener)
+      source.close()
+    }
+  }, [queryClient])
+}
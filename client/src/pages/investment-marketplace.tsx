@@ -12,6 +12,7 @@ import { formatCurrency } from "@/lib/financial-utils";
 import { apiRequest } from "@/lib/queryClient";
 import { ShoppingCart, TrendingUp, Building2, Zap, DollarSign } from "lucide-react";
 import { useToast } from "@/hooks/use-toast";
+import { usePriceStream } from "@/hooks/use-price-stream";
 import type { AvailableAsset, Account } from "@shared/schema";
 
 const DEMO_USER_ID = "demo-user-123";
@@ -26,8 +27,8 @@ export default function InvestmentMarketplace() {
 
   const { data: assets, isLoading: assetsLoading } = useQuery<AvailableAsset[]>({
     queryKey: ["/api/assets"],
-    refetchInterval: 30000,
   });
+  usePriceStream();
 
   const { data: accounts } = useQuery<Account[]>({
     queryKey: ["/api/accounts", DEMO_USER_ID],
@@ -1,14 +1,11 @@
 
 
 import os
-import threading
-import time
-import random
 import re
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from datetime import datetime
 from uuid import uuid4
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from marshmallow import ValidationError
 from pathlib import Path
@@ -16,13 +13,16 @@ from pathlib import Path
 from container import container
 from data_seeder import seed_data
 from flask_swagger import setup_swagger_ui
+from models.order import InvestmentOrder
+from services.market_data import MarketDataRunner, TickFileWriter, create_market_data_feed
 
 
 from models.schemas import (
     UserSchema, CreateUserSchema, AccountSchema, CreateAccountSchema,
     InvestmentSchema, AvailableAssetSchema, BuyInvestmentSchema, SellInvestmentSchema,
     LoanSchema, LoanApplicationSchema, CreateLoanSchema, TransactionSchema, CreateTransactionSchema,
-    NotificationSchema, CreateNotificationSchema
+    NotificationSchema, CreateNotificationSchema, RestingOrderSchema, PlaceRestingOrderSchema,
+    RealizedGainSchema, BasketOrderSchema
 )
 
 
@@ -125,9 +125,17 @@ def register_routes(app: Flask) -> None:
     account_service = container.get('account_service')
     investment_service = container.get('investment_service')
     loan_service = container.get('loan_service')
+    loan_repayment_service = container.get('loan_repayment_service')
     transaction_service = container.get('transaction_service')
     notification_service = container.get('notification_service')
     dashboard_service = container.get('dashboard_service')
+    price_history_repository = container.get('price_history_repository')
+    simulation_service = container.get('simulation_service')
+    risk_service = container.get('risk_service')
+    portfolio_optimizer = container.get('portfolio_optimizer')
+    order_pipeline = container.get('order_pipeline')
+    resting_order_service = container.get('resting_order_service')
+    price_stream = container.get('price_stream')
     
     def resolve_user_id(user_identifier: str) -> str:
         
@@ -152,6 +160,8 @@ def register_routes(app: Flask) -> None:
     loan_application_schema = LoanApplicationSchema()
     transaction_schema = TransactionSchema()
     notification_schema = NotificationSchema()
+    resting_order_schema = RestingOrderSchema()
+    realized_gain_schema = RealizedGainSchema()
     
     
     @app.route('/')
@@ -190,6 +200,32 @@ def register_routes(app: Flask) -> None:
         summary = dashboard_service.get_dashboard_summary(resolved_user_id)
         return json_camel(summary)
     
+    @app.route('/api/reports/dashboard-summaries', methods=['GET'])
+    def get_dashboard_summaries_report():
+        
+        # in streaming da un solo processo: niente fork da un thread di richiesta
+        user_ids = [resolve_user_id(user_id) for user_id in request.args.getlist('userId')] or None
+        return Response(
+            dashboard_service.iter_batch_summaries_ndjson(user_ids),
+            mimetype='application/x-ndjson'
+        )
+    
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        
+        return json_camel({
+            "dashboard_cache": dashboard_service.get_cache_stats(),
+            "order_pipeline": order_pipeline.get_stats(),
+            "resting_orders": resting_order_service.get_stats(),
+            "price_stream": price_stream.get_stats(),
+            "market_data": container.get('market_data_runner').get_stats() if container.has('market_data_runner') else None,
+            "risk_trackers": risk_service.get_tracked_counts(),
+            "amortization_cache": loan_service.amortization_engine.get_cache_stats(),
+            "loan_evaluations": loan_service.evaluation_queue.get_stats(),
+            "loan_repayments": loan_repayment_service.get_stats(),
+            "cash_flow_features": container.get('cash_flow_features').get_stats()
+        })
+    
     
     @app.route('/api/users', methods=['POST'])
     def create_user():
@@ -208,6 +244,11 @@ def register_routes(app: Flask) -> None:
             return jsonify({"error": "User not found"}), 404
         return json_camel(user_schema.dump(user))
     
+    @app.route('/api/users/<user_id>/cash-flow', methods=['GET'])
+    def get_cash_flow_features(user_id: str):
+        
+        return json_camel(container.get('cash_flow_features').get_features(resolve_user_id(user_id)))
+    
     
     @app.route('/api/accounts/<user_id>', methods=['GET'])
     def get_accounts(user_id: str):
@@ -244,6 +285,8 @@ def register_routes(app: Flask) -> None:
     @app.route('/api/assets', methods=['GET'])
     def get_available_assets():
         
+        # uno snapshot per richiesta: tutti i prezzi restituiti appartengono alla stessa versione
+        price_snapshot = investment_service.get_price_snapshot()
         assets = investment_service.get_available_assets()
         
         
@@ -254,8 +297,11 @@ def register_routes(app: Flask) -> None:
             fixed_data = dict(asset_data)
             
             if 'current_price' in fixed_data:
-                fixed_data['currentPrice'] = float(str(fixed_data['current_price']))
+                price = price_snapshot.get(asset.symbol)
+                fixed_data['currentPrice'] = float(price) if price is not None else float(str(fixed_data['current_price']))
+                fixed_data['priceVersion'] = price_snapshot.version
                 del fixed_data['current_price']  
+            fixed_data['risk'] = risk_service.get_asset_risk(asset.symbol)
             
             if 'created_at' in fixed_data:
                 fixed_data['createdAt'] = fixed_data.pop('created_at')
@@ -265,6 +311,40 @@ def register_routes(app: Flask) -> None:
         
         return json_camel(result)
     
+    @app.route('/api/assets/stream', methods=['GET'])
+    def stream_asset_prices():
+        
+        subscription = price_stream.subscribe()
+        if subscription is None:
+            return jsonify({"error": "Too many price stream connections"}), 503
+        response = Response(
+            price_stream.stream(subscription, investment_service.get_price_snapshot()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # il posto si libera alla chiusura della risposta anche se il generatore non parte mai (HEAD, client caduto)
+        response.call_on_close(lambda: price_stream.unsubscribe(subscription))
+        return response
+    
+    @app.route('/api/assets/<symbol>/history', methods=['GET'])
+    def get_asset_price_history(symbol: str):
+        
+        resolution = request.args.get('resolution', '1m')
+        limit = request.args.get('limit', 120, type=int)
+        return json_camel({
+            "symbol": symbol,
+            "resolution": resolution,
+            "bars": price_history_repository.get_bars(symbol, resolution, limit)
+        })
+    
+    @app.route('/api/assets/<symbol>/risk', methods=['GET'])
+    def get_asset_risk(symbol: str):
+        
+        return json_camel({
+            "symbol": symbol,
+            "risk": risk_service.get_asset_risk(symbol)
+        })
+    
     @app.route('/api/investments/<user_id>', methods=['GET'])
     def get_investments(user_id: str):
         
@@ -287,25 +367,65 @@ def register_routes(app: Flask) -> None:
                 inv_data['purchaseDate'] = inv_data.pop('purchase_date')
             if 'updated_at' in inv_data:
                 inv_data['updatedAt'] = inv_data.pop('updated_at')
+            inv_data['risk'] = risk_service.get_asset_risk(inv.symbol)
             result.append(inv_data)
         
         return json_camel(result)
     
+    @app.route('/api/investments/<user_id>/valuation', methods=['GET'])
+    def get_portfolio_valuation(user_id: str):
+        
+        resolved_user_id = resolve_user_id(user_id)
+        valuation = investment_service.get_portfolio_valuation(resolved_user_id)
+        valuation['risk'] = risk_service.get_portfolio_risk(resolved_user_id)
+        return json_camel(valuation)
+    
+    @app.route('/api/investments/<user_id>/risk', methods=['GET'])
+    def get_portfolio_risk(user_id: str):
+        
+        resolved_user_id = resolve_user_id(user_id)
+        return json_camel({
+            "user_id": resolved_user_id,
+            "risk": risk_service.get_portfolio_risk(resolved_user_id)
+        })
+    
+    @app.route('/api/investments/<user_id>/pnl', methods=['GET'])
+    def get_profit_and_loss(user_id: str):
+        
+        resolved_user_id = resolve_user_id(user_id)
+        limit = request.args.get('limit', 20, type=int)
+        pnl = investment_service.get_profit_and_loss(resolved_user_id, max(1, min(limit, 500)))
+        pnl['recent_sales'] = [realized_gain_schema.dump(gain) for gain in pnl['recent_sales']]
+        return json_camel(pnl)
+    
+    @app.route('/api/investments/<user_id>/lots/<symbol>', methods=['GET'])
+    def get_open_lots(user_id: str, symbol: str):
+        
+        resolved_user_id = resolve_user_id(user_id)
+        return json_camel({
+            "symbol": symbol,
+            "lots": investment_service.get_open_lots(resolved_user_id, symbol)
+        })
+    
     @app.route('/api/investments/buy', methods=['POST'])
     def buy_investment():
         
         schema = BuyInvestmentSchema()
         data = schema.load(request.json)
-        result = investment_service.buy_investment(
+        result = order_pipeline.execute(
+            side='buy',
             user_id=resolve_user_id(data['userId']),
             symbol=data['symbol'],
             shares=data['shares'],
             account_id=data['accountId']
         )
+        if result["status"] != 'filled':
+            return json_camel(result, 202 if result["status"] == 'pending' else 503)
         return json_camel({
             "message": result["message"],
             "investment": investment_schema.dump(result["investment"]),
-            "transaction": transaction_schema.dump(result["transaction"])
+            "transaction": transaction_schema.dump(result["transaction"]),
+            "price_version": result["price_version"]
         })
     
     @app.route('/api/investments/sell', methods=['POST'])
@@ -313,19 +433,79 @@ def register_routes(app: Flask) -> None:
         
         schema = SellInvestmentSchema()
         data = schema.load(request.json)
-        result = investment_service.sell_investment(
+        result = order_pipeline.execute(
+            side='sell',
             user_id=resolve_user_id(data['userId']),
             symbol=data['symbol'],
             shares=data['shares'],
-            account_id=data['accountId']
+            account_id=data['accountId'],
+            lot_method=data['lotMethod']
         )
+        if result["status"] != 'filled':
+            return json_camel(result, 202 if result["status"] == 'pending' else 503)
         return json_camel({
             "message": result["message"],
             "investment": investment_schema.dump(result["investment"]) if result["investment"] else None,
-            "transaction": transaction_schema.dump(result["transaction"])
+            "transaction": transaction_schema.dump(result["transaction"]),
+            "realized_gain": realized_gain_schema.dump(result["realized_gain"]),
+            "price_version": result["price_version"]
         })
     
     
+    @app.route('/api/investments/basket', methods=['POST'])
+    def execute_basket_order():
+        
+        schema = BasketOrderSchema()
+        data = schema.load(request.json)
+        user_id = resolve_user_id(data['userId'])
+        legs = [
+            InvestmentOrder(leg['side'], user_id, leg['symbol'], Decimal(leg['shares']), data['accountId'],
+                            lot_method=data['lotMethod'])
+            for leg in data['orders']
+        ]
+        result = investment_service.execute_basket(user_id, data['accountId'], legs)
+        for leg in result['orders']:
+            leg['investment'] = investment_schema.dump(leg['investment']) if leg['investment'] else None
+            leg['transaction'] = transaction_schema.dump(leg['transaction'])
+            leg['realized_gain'] = realized_gain_schema.dump(leg['realized_gain']) if leg['realized_gain'] else None
+        return json_camel(result)
+    
+    
+    @app.route('/api/orders', methods=['POST'])
+    def place_resting_order():
+        
+        schema = PlaceRestingOrderSchema()
+        data = schema.load(request.json)
+        try:
+            trigger_price, shares = Decimal(data['triggerPrice']), Decimal(data['shares'])
+        except InvalidOperation:
+            raise ValueError("Trigger price and shares must be numbers")
+        order = resting_order_service.place_order(
+            user_id=resolve_user_id(data['userId']),
+            account_id=data['accountId'],
+            symbol=data['symbol'],
+            side=data['side'],
+            order_type=data['orderType'],
+            trigger_price=trigger_price,
+            shares=shares
+        )
+        return json_camel(resting_order_schema.dump(order), 201)
+    
+    @app.route('/api/orders/<user_id>', methods=['GET'])
+    def get_resting_orders(user_id: str):
+        
+        resolved_user_id = resolve_user_id(user_id)
+        orders = resting_order_service.get_user_orders(resolved_user_id, request.args.get('status'))
+        return json_camel([resting_order_schema.dump(order) for order in orders])
+    
+    @app.route('/api/orders/<order_id>/cancel', methods=['POST'])
+    def cancel_resting_order(order_id: str):
+        
+        data = request.json or {}
+        order = resting_order_service.cancel_order(order_id, resolve_user_id(data.get('userId', 'demo-user-123')))
+        return json_camel(resting_order_schema.dump(order))
+    
+    
     @app.route('/api/loans/<user_id>', methods=['GET'])
     def get_loans(user_id: str):
         
@@ -355,12 +535,41 @@ def register_routes(app: Flask) -> None:
         
         return json_camel(result)
     
+    @app.route('/api/loans/<user_id>/<loan_id>/schedule', methods=['GET'])
+    def get_loan_schedule(user_id: str, loan_id: str):
+        
+        resolved_user_id = resolve_user_id(user_id)
+        schedule = loan_service.get_loan_schedule(
+            resolved_user_id,
+            loan_id,
+            exact=request.args.get('exact', '1') != '0'
+        )
+        return json_camel(schedule.to_dict(
+            start=max(0, request.args.get('start', 0, type=int)),
+            limit=request.args.get('limit', type=int)
+        ))
+    
+    @app.route('/api/loans/<user_id>/<loan_id>/what-if', methods=['POST'])
+    def simulate_loan_what_if(user_id: str, loan_id: str):
+        
+        scenarios = (request.json or {}).get('scenarios')
+        if not isinstance(scenarios, list) or not all(isinstance(scenario, dict) for scenario in scenarios):
+            raise ValueError("scenarios must be a list of objects")
+        return json_camel(loan_service.simulate_loan_scenarios(resolve_user_id(user_id), loan_id, scenarios))
+    
     @app.route('/api/loans', methods=['POST'])
     def create_loan():
         
         schema = CreateLoanSchema()
         data = schema.load(request.json)
-        loan = loan_service.create_loan(**data)
+        loan = loan_service.create_loan(
+            user_id=resolve_user_id(data['user_id']),
+            loan_type=data['type'],
+            amount=data['amount'],
+            interest_rate=data['interest_rate'],
+            term_months=data['term_months'],
+            rate_type=data['rate_type']
+        )
         return json_camel(loan_schema.dump(loan), 201)
     
     
@@ -448,6 +657,7 @@ def register_routes(app: Flask) -> None:
         
         user_id = data.get('userId', 'demo-user-123')
         data['userId'] = resolve_user_id(user_id)
+        data['rateType'] = data.get('rateType', 'fixed')
         
         from decimal import Decimal
         application = loan_service.create_loan_application(
@@ -457,9 +667,18 @@ def register_routes(app: Flask) -> None:
             purpose=data.get('purpose', f"{data['type']} loan"),
             income=Decimal(str(data['income'])),
             employment_status=data['employmentStatus'],
-            term_months=int(data.get('termMonths', 60))
+            term_months=int(data.get('termMonths', 60)),
+            rate_type=data['rateType']
         )
         
+        # limite di ammissione raggiunto: la richiesta non viene registrata
+        if not loan_service.process_loan_application_async(data, application.id):
+            loan_service.loan_application_repository.delete(application.id)
+            response = jsonify({"error": "Too many loan applications pending evaluation, retry later"})
+            response.headers['Retry-After'] = str(max(1, int(loan_service.evaluation_delay)))
+            return response, 503
+        
+        
         notification_service.create_notification(
             user_id=data['userId'],
             title="📋 Richiesta Prestito Ricevuta",
@@ -467,9 +686,6 @@ def register_routes(app: Flask) -> None:
             notification_type="info"
         )
         
-        
-        loan_service.process_loan_application_async(data, application.id)
-        
         # Return immediate response with saved application details
         return json_camel({
             "id": application.id,
@@ -478,6 +694,7 @@ def register_routes(app: Flask) -> None:
             "purpose": application.purpose,
             "income": str(application.income),
             "employmentStatus": application.employment_status,
+            "rateType": application.rate_type,
             "creditScore": application.credit_score,
             "status": application.status,
             "submittedDate": application.submitted_date.isoformat(),
@@ -488,74 +705,163 @@ def register_routes(app: Flask) -> None:
         }, 201)
     
     
-    @app.route('/api/calculate/loan', methods=['POST'])
-    def calculate_loan():
-        
-        data = request.json or {}
+    @app.route('/api/loan-workflow/evaluate-batch', methods=['POST'])
+    def evaluate_loan_applications_batch():
         
-        amount = float(data.get('amount', 0))
-        rate = float(data.get('rate', 5.0))
-        term_years = float(data.get('termYears', 5))
+        applications = (request.json or {}).get('applications')
+        if not isinstance(applications, list) or not applications:
+            raise ValueError("applications must be a non-empty list")
+        if len(applications) > 100000:
+            raise ValueError("At most 100000 applications per batch")
+        if not all(isinstance(application, dict) for application in applications):
+            raise ValueError("Each application must be an object")
+        results = loan_service.evaluate_loan_applications(applications)
+        approved = sum(1 for result in results if result['approved'])
+        return json_camel({
+            "results": results,
+            "summary": {
+                "count": len(results),
+                "approved": approved,
+                "rejected": len(results) - approved
+            }
+        })
+    
+    
+    @app.route('/api/loan-workflow/stress-test', methods=['POST'])
+    def run_loan_stress_test():
         
+        # griglia rateShocksBp × incomeShocksPct; processes (al più i core disponibili) distribuisce gli scenari su un pool
+        data = (request.json or {}) if request.is_json else {}
+        report = container.get('loan_stress_test_service').run(
+            rate_shocks_bp=[int(shock) for shock in data['rateShocksBp']] if 'rateShocksBp' in data else None,
+            income_shocks_pct=[float(shock) for shock in data['incomeShocksPct']] if 'incomeShocksPct' in data else None,
+            max_dti=data.get('maxDti'),
+            processes=int(data.get('processes', 0))
+        )
+        return json_camel(report)
+    
+    @app.route('/api/loan-workflow/repayments/run', methods=['POST'])
+    def run_loan_repayments():
         
-        monthly_rate = rate / 100 / 12
-        num_payments = term_years * 12
+        # asOf opzionale (ISO 8601): addebita tutte le rate scadute fino a quella data
+        as_of = (request.json or {}).get('asOf') if request.is_json else None
+        if as_of is not None:
+            as_of = datetime.fromisoformat(str(as_of)).replace(tzinfo=None)
+        return json_camel(loan_repayment_service.run_repayments(as_of))
+    
+    
+    @app.route('/api/calculate/loan', methods=['POST'])
+    def calculate_loan():
         
-        if monthly_rate == 0:
-            monthly_payment = amount / num_payments
-        else:
-            monthly_payment = (amount * monthly_rate * (1 + monthly_rate) ** num_payments) / ((1 + monthly_rate) ** num_payments - 1)
+        data = request.json or {}
         
-        total_payment = monthly_payment * num_payments
-        total_interest = total_payment - amount
+        schedule = loan_service.get_amortization_schedule(
+            Decimal(str(data.get('amount', 0))),
+            Decimal(str(data.get('rate', 5.0))),
+            round(float(data.get('termYears', 5)) * 12)
+        )
         
         result = {
-            "monthlyPayment": round(monthly_payment, 2),
-            "totalPayment": round(total_payment, 2),
-            "totalInterest": round(total_interest, 2)
+            "monthlyPayment": round(schedule.payment, 2),
+            "totalPayment": round(schedule.total_payment, 2),
+            "totalInterest": round(schedule.total_interest, 2)
         }
         
         return json_camel(result)
     
+    @app.route('/api/calculate/loan/grid', methods=['POST'])
+    def calculate_loan_quote_grid():
+        
+        data = request.json or {}
+        amounts = data.get('amounts') or [data.get('amount', 0)]
+        rates = data.get('rates') or [data.get('rate', 5.0)]
+        terms = data.get('termsMonths')
+        if not terms:
+            terms = [round(float(years) * 12) for years in (data.get('termsYears') or [data.get('termYears', 5)])]
+        grid = loan_service.get_quote_grid(
+            [Decimal(str(amount)) for amount in amounts],
+            [Decimal(str(rate)) for rate in rates],
+            [int(term) for term in terms]
+        )
+        return json_camel(grid.to_dict())
+    
+    @app.route('/api/calculate/loan/schedule', methods=['POST'])
+    def calculate_loan_schedule():
+        
+        data = request.json or {}
+        term_months = data.get('termMonths')
+        if term_months is None:
+            term_months = round(float(data.get('termYears', 5)) * 12)
+        term_months = int(term_months)
+        # durata limitata prima di costruire il piano: la risposta cresce con il numero di periodi
+        max_term = loan_service.amortization_engine.MAX_TERM_MONTHS
+        if not 1 <= term_months <= max_term:
+            raise ValueError(f"Term months must be between 1 and {max_term}")
+        schedule = loan_service.get_amortization_schedule(
+            Decimal(str(data.get('amount', 0))),
+            Decimal(str(data.get('rate', 5.0))),
+            term_months,
+            exact=bool(data.get('exact', False))
+        )
+        return json_camel(schedule.to_dict(
+            start=max(0, int(data.get('start', 0))),
+            limit=int(data['limit']) if data.get('limit') is not None else None
+        ))
+    
+    
+    def simulation_to_dict(simulation):
+        
+        return {
+            "id": simulation.id,
+            "asset": simulation.asset,
+            "amount": str(simulation.amount),
+            "initialAmount": str(simulation.amount),
+            "monthlyContribution": "0",
+            "strategy": simulation.strategy,
+            "riskLevel": simulation.risk_level,
+            "expectedReturn": f"{simulation.expected_return * 100:.2f}%",
+            "timeframe": f"{simulation.timeframe_years} years",
+            "timeHorizon": str(simulation.timeframe_years),
+            "submittedDate": simulation.submitted_date.isoformat(),
+            "createdDate": simulation.submitted_date.isoformat(),
+            "status": simulation.status,
+            "method": simulation.method,
+            "paths": simulation.paths,
+            "seed": simulation.seed,
+            "projectedReturns": simulation.projected_returns,
+            "riskMetrics": simulation.risk_metrics
+        }
     
     @app.route('/api/investment-workflow/simulations/<user_id>', methods=['GET'])
     def get_investment_simulations(user_id: str):
         
-        
-        return json_camel([
-            {
-                "id": "sim-123",
-                "asset": "S&P 500 ETF",
-                "amount": "10000",
-                "strategy": "moderate",
-                "riskLevel": "medium",
-                "expectedReturn": "8.5%",
-                "timeframe": "5 years",
-                "submittedDate": "2025-09-20T00:00:00",
-                "status": "completed",
-                "projectedReturns": [
-                    {"year": 1, "value": "10850", "annualReturn": "8.5"},
-                    {"year": 2, "value": "11772", "annualReturn": "8.5"},
-                    {"year": 3, "value": "12773", "annualReturn": "8.5"},
-                    {"year": 4, "value": "13859", "annualReturn": "8.5"},
-                    {"year": 5, "value": "15037", "annualReturn": "8.5"}
-                ],
-                "riskMetrics": {
-                    "volatility": "12.5",
-                    "sharpeRatio": "0.68",
-                    "maxDrawdown": "15.2"
-                }
-            }
-        ])
+        resolved_user_id = resolve_user_id(user_id)
+        simulations = simulation_service.get_user_simulations(resolved_user_id)
+        return json_camel([simulation_to_dict(simulation) for simulation in simulations])
     
     @app.route('/api/validation/investment-limits', methods=['GET'])
     def get_investment_limits():
         
         return json_camel({
-            "min_amount": 500,
-            "max_amount": 100000
+            "min_amount": int(investment_service.MIN_INVESTMENT_AMOUNT),
+            "max_amount": int(investment_service.MAX_INVESTMENT_AMOUNT)
         })
     
+    @app.route('/api/investment-workflow/optimize', methods=['POST'])
+    def optimize_portfolio():
+        
+        data = request.json or {}
+        target_volatility = data.get('targetVolatility')
+        result = portfolio_optimizer.optimize(
+            user_id=resolve_user_id(data.get('userId', 'demo-user-123')),
+            amount=Decimal(str(data.get('amount', 0))),
+            mode=data.get('mode', 'max_sharpe'),
+            target_volatility=float(target_volatility) if target_volatility is not None else None,
+            max_weight=float(data.get('maxWeight', 1.0)),
+            points=int(data.get('points', 20))
+        )
+        return json_camel(result)
+    
     @app.route('/api/investment-workflow/simulate', methods=['POST'])
     def simulate_investment():
         
@@ -567,51 +873,24 @@ def register_routes(app: Flask) -> None:
             if not data.get(field):
                 return json_camel({"error": f"{field} is required"}, 400)
         
-        amount = float(data['amount'])
-        timeframe = int(data.get('timeframe', 5))
-        
-        
-        # rendimenti attesi per livello di rischio
-        risk_returns = {
-            "conservative": 5.5,
-            "moderate": 8.5,
-            "aggressive": 12.0
-        }
-        expected_return = risk_returns.get(data['riskLevel'], 8.5)
-        
-        
-        # calcola proiezioni anno per anno
-        projected_returns = []
-        current_value = amount
-        for year in range(1, timeframe + 1):
-            current_value *= (1 + expected_return / 100)
-            projected_returns.append({
-                "year": year,
-                "value": str(round(current_value, 2)),
-                "annualReturn": str(expected_return)
-            })
-        
-        
-        # crea la simulazione
-        simulation = {
-            "id": str(uuid4()),
-            "asset": data['asset'],
-            "amount": data['amount'],
-            "strategy": data['strategy'],
-            "riskLevel": data['riskLevel'],
-            "expectedReturn": f"{expected_return}%",
-            "timeframe": f"{timeframe} years",
-            "submittedDate": datetime.now().isoformat(),
-            "status": "completed",
-            "projectedReturns": projected_returns,
-            "riskMetrics": {
-                "volatility": "12.5" if data['riskLevel'] == 'moderate' else ("8.2" if data['riskLevel'] == 'conservative' else "18.7"),
-                "sharpeRatio": "0.68" if data['riskLevel'] == 'moderate' else ("0.52" if data['riskLevel'] == 'conservative' else "0.81"),
-                "maxDrawdown": "15.2" if data['riskLevel'] == 'moderate' else ("8.5" if data['riskLevel'] == 'conservative' else "25.8")
-            }
-        }
+        try:
+            amount = Decimal(str(data['amount']))
+        except InvalidOperation:
+            raise ValueError("Amount must be a number")
+        seed = data.get('seed')
+        simulation = simulation_service.run_simulation(
+            user_id=resolve_user_id(data.get('userId', 'demo-user-123')),
+            asset=data['asset'],
+            amount=amount,
+            strategy=data['strategy'],
+            risk_level=data['riskLevel'],
+            timeframe_years=int(data.get('timeframe', 5)),
+            paths=int(data.get('paths', 10000)),
+            seed=int(seed) if seed is not None else None,
+            method=data.get('method', 'auto')
+        )
         
-        return json_camel(simulation, 201)
+        return json_camel(simulation_to_dict(simulation), 201)
     
     @app.route('/api/investment-workflow/execute', methods=['POST'])
     def execute_investment():
@@ -809,39 +1088,40 @@ def register_routes(app: Flask) -> None:
 
 def start_background_tasks():
     
-    
-    def update_investment_prices():
-        
-        while True:
-            try:
-                time.sleep(30)  
-                
-                
-                investment_service = container.get('investment_service')
-                available_asset_repository = container.get('available_asset_repository')
-                
-                
-                assets = available_asset_repository.get_all()
-                
-                
-                price_updates = {}
-                for asset in assets:
-                    
-                    variation = random.uniform(-0.02, 0.02)
-                    new_price = asset.current_price * (1 + Decimal(str(variation)))
-                    new_price = new_price.quantize(Decimal('0.01'))
-                    price_updates[asset.symbol] = new_price
-                
-                
-                investment_service.update_prices(price_updates)
-                
-            except Exception as e:
-                print(f"Error updating prices: {e}")
-                time.sleep(60)  
-    
-    
-    price_thread = threading.Thread(target=update_investment_prices, daemon=True)
-    price_thread.start()
+    # feed prezzi configurabile: MARKET_DATA_FEED = random_walk (predefinito) | gbm | replay | ingest | off
+    available_asset_repository = container.get('available_asset_repository')
+    investment_service = container.get('investment_service')
+    seed = os.environ.get('MARKET_DATA_SEED')
+    interval = os.environ.get('MARKET_DATA_INTERVAL')
+    feed = create_market_data_feed(
+        os.environ.get('MARKET_DATA_FEED', 'random_walk'),
+        available_asset_repository,
+        interval=float(interval) if interval else None,
+        seed=int(seed) if seed else None,
+        path=os.environ.get('MARKET_DATA_FILE'),
+        speed=float(os.environ.get('MARKET_DATA_SPEED', '1')),
+        loop=os.environ.get('MARKET_DATA_LOOP', '0') == '1',
+        time_scale=float(os.environ.get('MARKET_DATA_TIME_SCALE', '1'))
+    )
+    
+    record_path = os.environ.get('MARKET_DATA_RECORD')
+    if record_path:
+        recorder = TickFileWriter(record_path, list(available_asset_repository.price_snapshot().prices))
+        investment_service.add_price_listener(recorder.record_prices)
+    
+    if feed is not None:
+        runner = MarketDataRunner(feed, investment_service)
+        container.register('market_data_runner', runner)
+        runner.start()
+    
+    # valutazioni persistite da un'esecuzione precedente; non nel processo di controllo del reloader Flask
+    if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        container.get('loan_service').evaluation_queue.start()
+    
+    # addebito rate a orologio: LOAN_REPAYMENT_INTERVAL in secondi (predefinito un'ora, 0 = disattivato)
+    repayment_interval = float(os.environ.get('LOAN_REPAYMENT_INTERVAL', '3600'))
+    if repayment_interval > 0:
+        container.get('loan_repayment_service').start(repayment_interval)
 
 
 
@@ -1,5 +1,6 @@
 
 
+import os
 from typing import Dict, Any, TypeVar, Type
 from repositories.user_repository import UserRepository
 from repositories.account_repository import AccountRepository
@@ -9,14 +10,28 @@ from repositories.loan_application_repository import LoanApplicationRepository
 from repositories.transaction_repository import TransactionRepository
 from repositories.transaction_repository import TransactionRepository
 from repositories.notification_repository import NotificationRepository
+from repositories.price_history_repository import PriceHistoryRepository
+from repositories.simulation_repository import SimulationRepository
+from repositories.resting_order_repository import RestingOrderRepository
+from repositories.realized_gain_repository import RealizedGainRepository
 
 from services.user_service import UserService
 from services.account_service import AccountService
 from services.investment_service import InvestmentService
+from services.amortization import AmortizationEngine
+from services.cash_flow_features import CashFlowFeatureStore
 from services.loan_service import LoanService
+from services.loan_repayment_service import LoanRepaymentService
+from services.loan_stress_test import LoanStressTestService
 from services.transaction_service import TransactionService
 from services.notification_service import NotificationService
 from services.dashboard_service import DashboardService
+from services.simulation_service import SimulationService
+from services.risk_service import RiskMetricsService
+from services.portfolio_optimizer import PortfolioOptimizationService
+from services.order_pipeline import OrderPipeline
+from services.resting_order_service import RestingOrderService
+from services.price_stream import PriceStreamBroadcaster
 
 
 T = TypeVar('T')
@@ -38,6 +53,10 @@ class Container:
         
         self._services[name] = service
     
+    def has(self, name: str) -> bool:
+        
+        return name in self._services
+    
     def get(self, name: str) -> Any:
         
         if name not in self._services:
@@ -58,6 +77,10 @@ class Container:
         loan_application_repository = LoanApplicationRepository()
         transaction_repository = TransactionRepository()
         notification_repository = NotificationRepository()
+        price_history_repository = PriceHistoryRepository()
+        simulation_repository = SimulationRepository()
+        resting_order_repository = RestingOrderRepository()
+        realized_gain_repository = RealizedGainRepository()
         
         
         
@@ -69,6 +92,10 @@ class Container:
         self.register('loan_application_repository', loan_application_repository)
         self.register('transaction_repository', transaction_repository)
         self.register('notification_repository', notification_repository)
+        self.register('price_history_repository', price_history_repository)
+        self.register('simulation_repository', simulation_repository)
+        self.register('resting_order_repository', resting_order_repository)
+        self.register('realized_gain_repository', realized_gain_repository)
         
         
         
@@ -83,15 +110,40 @@ class Container:
             available_asset_repository,
             account_repository,
             transaction_repository,
+            realized_gain_repository,
+            notification_service
+        )
+        risk_service = RiskMetricsService(investment_repository, available_asset_repository)
+        investment_service.add_price_listener(price_history_repository.record_prices)
+        investment_service.add_price_listener(risk_service.record_prices)
+        resting_order_service = RestingOrderService(
+            resting_order_repository,
+            investment_service,
             notification_service
         )
+        investment_service.add_price_listener(resting_order_service.on_prices)
+        price_stream = PriceStreamBroadcaster()
+        investment_service.add_price_listener(price_stream.publish)
+        amortization_engine = AmortizationEngine()
+        cash_flow_features = CashFlowFeatureStore(account_repository, transaction_repository)
         loan_service = LoanService(
             loan_repository,
             loan_application_repository,
             account_repository,
             transaction_repository,
+            notification_service,
+            amortization_engine,
+            cash_flow_features,
+            user_repository,
+            evaluation_queue_path=os.environ.get('LOAN_JOB_QUEUE_PATH', 'loan_jobs.sqlite3')
+        )
+        loan_repayment_service = LoanRepaymentService(
+            loan_repository,
+            account_repository,
+            transaction_repository,
             notification_service
         )
+        loan_stress_test_service = LoanStressTestService(loan_repository, cash_flow_features)
         transaction_service = TransactionService(
             transaction_repository,
             account_repository,
@@ -103,14 +155,36 @@ class Container:
             loan_repository,
             transaction_repository
         )
+        simulation_service = SimulationService(
+            simulation_repository,
+            price_history_repository
+        )
+        order_pipeline = OrderPipeline(investment_service)
+        portfolio_optimizer = PortfolioOptimizationService(
+            price_history_repository,
+            available_asset_repository,
+            investment_repository,
+            InvestmentService.MIN_INVESTMENT_AMOUNT,
+            InvestmentService.MAX_INVESTMENT_AMOUNT
+        )
         
         
         self.register('user_service', user_service)
         self.register('account_service', account_service)
         self.register('investment_service', investment_service)
         self.register('loan_service', loan_service)
+        self.register('amortization_engine', amortization_engine)
+        self.register('cash_flow_features', cash_flow_features)
+        self.register('loan_repayment_service', loan_repayment_service)
+        self.register('loan_stress_test_service', loan_stress_test_service)
         self.register('transaction_service', transaction_service)
         self.register('dashboard_service', dashboard_service)
+        self.register('simulation_service', simulation_service)
+        self.register('risk_service', risk_service)
+        self.register('portfolio_optimizer', portfolio_optimizer)
+        self.register('order_pipeline', order_pipeline)
+        self.register('resting_order_service', resting_order_service)
+        self.register('price_stream', price_stream)
         
         self._initialized = True
     
@@ -0,0 +1,69 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict
+
+
+@dataclass
+class DashboardMetrics:
+    """
+    Rappresenta le metriche aggregate della dashboard per un singolo utente.
+    Raccoglie saldi, valore del portafoglio, spese mensili ed esposizione prestiti.
+    I widget aggiuntivi sono raccolti in un dizionario indicizzato per chiave.
+    """
+    
+    user_id: str
+    total_balance: Decimal = Decimal('0')
+    total_investments: Decimal = Decimal('0')
+    investments_cost_basis: Decimal = Decimal('0')
+    monthly_expenses: Decimal = Decimal('0')
+    previous_month_expenses: Decimal = Decimal('0')
+    active_loan_balance: Decimal = Decimal('0')
+    active_loans_count: int = 0
+    price_version: int = 0
+    widgets: Dict[str, Any] = field(default_factory=dict)
+    
+    @property
+    def investment_growth(self) -> float:
+        
+        if self.investments_cost_basis == 0:
+            return 0.0
+        growth = ((self.total_investments - self.investments_cost_basis) / self.investments_cost_basis) * 100
+        return float(growth)
+    
+    @property
+    def expense_variation(self) -> float:
+        
+        if self.previous_month_expenses == 0:
+            return 0.0 if self.monthly_expenses == 0 else 100.0
+        variation = ((self.monthly_expenses - self.previous_month_expenses) / self.previous_month_expenses) * 100
+        return float(variation)
+    
+    def to_summary(self) -> Dict[str, Any]:
+        
+        summary = {
+            "totalBalance": float(self.total_balance),
+            "totalInvestments": float(self.total_investments),
+            "monthlyExpenses": float(self.monthly_expenses),
+            "activeLoanBalance": float(self.active_loan_balance),
+            "investmentGrowth": f"{self.investment_growth:+.1f}%",
+            "expenseVariation": f"{self.expense_variation:+.1f}%",
+            "activeLoansCount": self.active_loans_count,
+            "priceVersion": self.price_version
+        }
+        summary.update(self.widgets)
+        return summary
+    
+    def to_record(self) -> Dict[str, Any]:
+        
+        return {
+            "userId": self.user_id,
+            "totalBalance": float(self.total_balance),
+            "totalInvestments": float(self.total_investments),
+            "investmentsCostBasis": float(self.investments_cost_basis),
+            "investmentGrowth": round(self.investment_growth, 4),
+            "monthlyExpenses": float(self.monthly_expenses),
+            "previousMonthExpenses": float(self.previous_month_expenses),
+            "expenseVariation": round(self.expense_variation, 4),
+            "activeLoanBalance": float(self.active_loan_balance),
+            "activeLoansCount": self.active_loans_count
+        }
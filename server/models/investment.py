@@ -1,8 +1,97 @@
 
 
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
+from typing import Deque, Iterator, List, Optional
+
+
+@dataclass(slots=True)
+class TaxLot:
+    """
+    Rappresenta un lotto fiscale di una posizione: quote acquistate a un prezzo in una data.
+    Le vendite consumano i lotti interamente o in parte secondo il metodo scelto.
+    Struttura compatta per reggere migliaia di piccoli acquisti ricorrenti.
+    """
+    
+    shares: Decimal
+    price: Decimal
+    acquired_at: datetime
+
+
+class TaxLotQueue:
+    """
+    Coda dei lotti fiscali di una posizione con totali correnti di quote e costo.
+    Gli acquisti si aggiungono in coda, le vendite consumano dalla testa (FIFO) o dalla coda (LIFO).
+    Una vendita che tocca k lotti costa O(k), indipendentemente dal numero di lotti aperti.
+    """
+    
+    METHODS = ('fifo', 'lifo')
+    
+    
+    def __init__(self):
+        self._lots: Deque[TaxLot] = deque()
+        self.shares = Decimal('0')
+        self.cost = Decimal('0')
+    
+    def __len__(self) -> int:
+        
+        return len(self._lots)
+    
+    def __iter__(self) -> Iterator[TaxLot]:
+        
+        return iter(self._lots)
+    
+    @property
+    def average_price(self) -> Decimal:
+        
+        return self.cost / self.shares if self.shares else Decimal('0')
+    
+    def copy(self) -> 'TaxLotQueue':
+        
+        # lotti duplicati: add e consume modificano in place l'ultimo lotto toccato
+        queue = TaxLotQueue()
+        queue._lots = deque(TaxLot(lot.shares, lot.price, lot.acquired_at) for lot in self._lots)
+        queue.shares = self.shares
+        queue.cost = self.cost
+        return queue
+    
+    def add(self, shares: Decimal, price: Decimal, acquired_at: datetime) -> None:
+        
+        # acquisti allo stesso prezzo nello stesso giorno confluiscono nell'ultimo lotto
+        last = self._lots[-1] if self._lots else None
+        if last is not None and last.price == price and last.acquired_at.date() == acquired_at.date():
+            last.shares += shares
+        else:
+            self._lots.append(TaxLot(shares, price, acquired_at))
+        self.shares += shares
+        self.cost += shares * price
+    
+    def consume(self, shares: Decimal, method: str = 'fifo') -> List[TaxLot]:
+        
+        # restituisce le porzioni consumate; l'ultimo lotto toccato può restare aperto in parte
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown lot method {method}")
+        if shares > self.shares:
+            raise ValueError("Insufficient shares to sell")
+        take = self._lots.popleft if method == 'fifo' else self._lots.pop
+        peek = 0 if method == 'fifo' else -1
+        consumed = []
+        remaining = shares
+        while remaining > 0:
+            lot = self._lots[peek]
+            if lot.shares <= remaining:
+                take()
+                consumed.append(lot)
+                remaining -= lot.shares
+            else:
+                lot.shares -= remaining
+                consumed.append(TaxLot(remaining, lot.price, lot.acquired_at))
+                remaining = Decimal('0')
+        self.shares -= shares
+        self.cost = self.cost - sum(lot.shares * lot.price for lot in consumed) if self.shares else Decimal('0')
+        return consumed
 
 
 @dataclass
@@ -22,6 +111,7 @@ class Investment:
     current_price: Decimal
     purchase_date: datetime
     updated_at: datetime
+    lots: Optional[TaxLotQueue] = field(default=None, repr=False, compare=False)
 
     def __post_init__(self):
         
@@ -33,6 +123,10 @@ class Investment:
             raise ValueError("Shares must be positive")
         if self.purchase_price <= 0:
             raise ValueError("Purchase price must be positive")
+        if self.lots is None:
+            # posizione senza storico: un unico lotto al prezzo medio di carico
+            self.lots = TaxLotQueue()
+            self.lots.add(self.shares, self.purchase_price, self.purchase_date)
 
     @property
     def current_value(self) -> Decimal:
@@ -78,4 +172,30 @@ class AvailableAsset:
         if not self.name:
             raise ValueError("Name is required")
         if self.current_price <= 0:
-            raise ValueError("Current price must be positive")
\ No newline at end of file
+            raise ValueError("Current price must be positive")
+
+@dataclass
+class RealizedGain:
+    """
+    Rappresenta il risultato realizzato di una vendita sui lotti consumati.
+    Registra ricavo, costo dei lotti, metodo di scarico e date di acquisto coinvolte.
+    Resta disponibile anche dopo la chiusura completa della posizione.
+    """
+    
+    id: str
+    user_id: str
+    symbol: str
+    shares: Decimal
+    proceeds: Decimal
+    cost_basis: Decimal
+    lot_method: str
+    lots_consumed: int
+    first_acquired_at: datetime
+    last_acquired_at: datetime
+    sold_at: datetime
+    transaction_id: Optional[str] = None
+    
+    @property
+    def realized_profit_loss(self) -> Decimal:
+        
+        return self.proceeds - self.cost_basis
@@ -8,6 +8,7 @@ from typing import Literal, Optional
 
 LoanType = Literal['personal', 'mortgage', 'auto', 'business']
 LoanStatus = Literal['active', 'paid_off', 'defaulted', 'pending']
+LoanRateType = Literal['fixed', 'variable']
 LoanApplicationStatus = Literal['pending', 'evaluating', 'approved', 'rejected', 'requires_documents']
 
 
@@ -31,6 +32,9 @@ class Loan:
     status: LoanStatus
     created_at: datetime
     updated_at: datetime
+    # ultima rata addebitata (1..term_months): rende idempotente il rimborso per periodo
+    last_paid_period: int = 0
+    rate_type: LoanRateType = 'fixed'
 
     def __post_init__(self):
         # validazioni base
@@ -44,6 +48,8 @@ class Loan:
             raise ValueError("Interest rate cannot be negative")
         if self.term_months <= 0:
             raise ValueError("Term months must be positive")
+        if self.rate_type not in ['fixed', 'variable']:
+            raise ValueError("Invalid rate type")
 
     @property
     def progress_percentage(self) -> float:
@@ -78,6 +84,7 @@ class LoanApplication:
     submitted_date: datetime
     approved_date: Optional[datetime] = None
     rejection_reason: Optional[str] = None
+    rate_type: LoanRateType = 'fixed'
 
     def __post_init__(self):
         """Validate loan application data after initialization."""
@@ -88,4 +95,6 @@ class LoanApplication:
         if self.amount <= 0:
             raise ValueError("Loan amount must be positive")
         if self.income <= 0:
-            raise ValueError("Income must be positive")
\ No newline at end of file
+            raise ValueError("Income must be positive")
+        if self.rate_type not in ['fixed', 'variable']:
+            raise ValueError("Invalid rate type")
\ No newline at end of file
@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+from uuid import uuid4
+
+
+@dataclass
+class InvestmentOrder:
+    """
+    Rappresenta un ordine di acquisto o vendita di un asset.
+    Viene accodato alla pipeline ordini ed eseguito in micro-batch.
+    Ogni ordine produce il proprio eseguito e la propria transazione.
+    """
+    
+    side: str
+    user_id: str
+    symbol: str
+    shares: Decimal
+    account_id: str
+    id: str = field(default_factory=lambda: str(uuid4()))
+    submitted_at: datetime = field(default_factory=datetime.now)
+    # metodo di scarico dei lotti per le vendite; None usa quello del servizio
+    lot_method: Optional[str] = None
+    
+    def __post_init__(self):
+        
+        if self.side not in ('buy', 'sell'):
+            raise ValueError("Order side must be buy or sell")
+        if not self.symbol:
+            raise ValueError("Symbol is required")
+        if not self.shares.is_finite():
+            raise ValueError("Shares must be a finite number")
+        if self.lot_method is not None and self.lot_method not in ('fifo', 'lifo'):
+            raise ValueError("Lot method must be fifo or lifo")
+
+
+@dataclass
+class RestingOrder:
+    """
+    Rappresenta un ordine limite o stop in attesa su un simbolo.
+    Scatta quando un tick di prezzo attraversa la soglia di attivazione.
+    Conserva stato, prezzo di esecuzione ed eventuale motivo di rifiuto.
+    """
+    
+    id: str
+    user_id: str
+    account_id: str
+    symbol: str
+    side: str
+    order_type: str
+    trigger_price: Decimal
+    shares: Decimal
+    created_at: datetime
+    status: str = 'open'
+    triggered_at: Optional[datetime] = None
+    fill_price: Optional[Decimal] = None
+    price_version: Optional[int] = None
+    transaction_id: Optional[str] = None
+    rejection_reason: Optional[str] = None
+    
+    def __post_init__(self):
+        
+        if not self.user_id:
+            raise ValueError("User ID is required")
+        if not self.symbol:
+            raise ValueError("Symbol is required")
+        if self.side not in ('buy', 'sell'):
+            raise ValueError("Order side must be buy or sell")
+        if self.order_type not in ('limit', 'stop'):
+            raise ValueError("Order type must be limit or stop")
+        if not self.trigger_price.is_finite() or not self.shares.is_finite():
+            raise ValueError("Trigger price and shares must be finite numbers")
+        if self.trigger_price <= 0:
+            raise ValueError("Trigger price must be positive")
+        if self.shares <= 0:
+            raise ValueError("Shares must be positive")
+    
+    @property
+    def fires_at_or_below(self) -> bool:
+        
+        # buy-limit e sell-stop scattano con prezzo <= soglia; sell-limit e buy-stop con prezzo >= soglia
+        return (self.side, self.order_type) in (('buy', 'limit'), ('sell', 'stop'))
+    
+    def is_triggered_by(self, price: Decimal) -> bool:
+        
+        return price <= self.trigger_price if self.fires_at_or_below else price >= self.trigger_price
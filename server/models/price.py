@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Mapping, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """
+    Rappresenta una versione immutabile della tabella prezzi degli asset.
+    Ogni tick produce una nuova istanza con numero di versione crescente.
+    Permette letture coerenti senza lock e confronti rapidi tra versioni.
+    """
+    
+    version: int
+    prices: Mapping[str, Decimal]
+    created_at: datetime
+    
+    def get(self, symbol: str) -> Optional[Decimal]:
+        
+        return self.prices.get(symbol)
+    
+    def diff(self, other: 'PriceSnapshot') -> Dict[str, Tuple[Optional[Decimal], Optional[Decimal]]]:
+        
+        # simboli variati passando da questa versione a other: {simbolo: (prezzo vecchio, prezzo nuovo)}
+        if other.prices is self.prices:
+            return {}
+        changes = {}
+        for symbol in self.prices.keys() | other.prices.keys():
+            old_price = self.prices.get(symbol)
+            new_price = other.prices.get(symbol)
+            if old_price != new_price:
+                changes[symbol] = (old_price, new_price)
+        return changes
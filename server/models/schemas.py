@@ -84,6 +84,7 @@ class SellInvestmentSchema(Schema):
     symbol = fields.String(required=True)
     shares = fields.Raw(required=True)  
     accountId = fields.String(required=True)
+    lotMethod = fields.String(load_default=None, validate=validate.OneOf(['fifo', 'lifo']))
     
     def load(self, json_data, **kwargs):
         
@@ -119,6 +120,8 @@ class LoanSchema(Schema):
     term_months = fields.Integer(required=True)
     monthly_payment = fields.Decimal(places=2, as_string=False, dump_only=True)
     remaining_balance = fields.Decimal(places=2, as_string=False, dump_only=True)
+    last_paid_period = fields.Integer(dump_only=True)
+    rate_type = fields.String(dump_only=True, validate=validate.OneOf(['fixed', 'variable']))
     status = fields.String(dump_only=True, validate=validate.OneOf(['active', 'paid_off', 'defaulted', 'pending']))
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
@@ -131,6 +134,7 @@ class CreateLoanSchema(Schema):
     amount = fields.Decimal(places=2, required=True, validate=validate.Range(min=100))
     interest_rate = fields.Decimal(places=2, required=True, validate=validate.Range(min=0, max=50))
     term_months = fields.Integer(required=True, validate=validate.Range(min=6, max=360))
+    rate_type = fields.String(load_default='fixed', validate=validate.OneOf(['fixed', 'variable']))
 
 
 class LoanApplicationSchema(Schema):
@@ -143,6 +147,7 @@ class LoanApplicationSchema(Schema):
     income = fields.String(required=True)
     employmentStatus = fields.String(required=True)
     termMonths = fields.String(required=True)
+    rateType = fields.String(load_default='fixed', validate=validate.OneOf(['fixed', 'variable']))
     status = fields.String(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
 
@@ -158,6 +163,7 @@ class TransactionSchema(Schema):
     transaction_date = fields.DateTime(required=True)
     created_at = fields.DateTime(dump_only=True)
     reference_number = fields.String(dump_only=True)
+    price_version = fields.Integer(dump_only=True, allow_none=True)
 
 
 class CreateTransactionSchema(Schema):
@@ -186,4 +192,79 @@ class CreateNotificationSchema(Schema):
     user_id = fields.String(required=True)
     title = fields.String(required=True, validate=validate.Length(min=1, max=100))
     message = fields.String(required=True, validate=validate.Length(min=1, max=500))
-    notification_type = fields.String(required=True, validate=validate.OneOf(['info', 'success', 'warning', 'error']))
\ No newline at end of file
+    notification_type = fields.String(required=True, validate=validate.OneOf(['info', 'success', 'warning', 'error']))
+
+class RestingOrderSchema(Schema):
+    
+    id = fields.String(dump_only=True)
+    user_id = fields.String(dump_only=True)
+    account_id = fields.String(dump_only=True)
+    symbol = fields.String(dump_only=True)
+    side = fields.String(dump_only=True)
+    order_type = fields.String(dump_only=True)
+    trigger_price = fields.Decimal(places=2, as_string=False, dump_only=True)
+    shares = fields.Decimal(places=4, as_string=False, dump_only=True)
+    status = fields.String(dump_only=True)
+    created_at = fields.DateTime(dump_only=True)
+    triggered_at = fields.DateTime(dump_only=True, allow_none=True)
+    fill_price = fields.Decimal(places=2, as_string=False, dump_only=True, allow_none=True)
+    price_version = fields.Integer(dump_only=True, allow_none=True)
+    transaction_id = fields.String(dump_only=True, allow_none=True)
+    rejection_reason = fields.String(dump_only=True, allow_none=True)
+
+
+class BasketLegSchema(Schema):
+    
+    side = fields.String(required=True, validate=validate.OneOf(['buy', 'sell']))
+    symbol = fields.String(required=True)
+    shares = fields.Raw(required=True)
+    
+    def load(self, json_data, **kwargs):
+        
+        data = super().load(json_data, **kwargs)
+        
+        data['shares'] = str(data['shares'])
+        return data
+
+
+class BasketOrderSchema(Schema):
+    
+    userId = fields.String(required=True)
+    accountId = fields.String(required=True)
+    orders = fields.List(fields.Nested(BasketLegSchema), required=True, validate=validate.Length(min=1, max=100))
+    lotMethod = fields.String(load_default=None, validate=validate.OneOf(['fifo', 'lifo']))
+
+
+class RealizedGainSchema(Schema):
+    
+    id = fields.String(dump_only=True)
+    symbol = fields.String(dump_only=True)
+    shares = fields.Decimal(places=4, as_string=False, dump_only=True)
+    proceeds = fields.Decimal(places=2, as_string=False, dump_only=True)
+    cost_basis = fields.Decimal(places=2, as_string=False, dump_only=True)
+    realized_profit_loss = fields.Decimal(places=2, as_string=False, dump_only=True)
+    lot_method = fields.String(dump_only=True)
+    lots_consumed = fields.Integer(dump_only=True)
+    first_acquired_at = fields.DateTime(dump_only=True)
+    last_acquired_at = fields.DateTime(dump_only=True)
+    sold_at = fields.DateTime(dump_only=True)
+    transaction_id = fields.String(dump_only=True, allow_none=True)
+
+
+class PlaceRestingOrderSchema(Schema):
+    
+    userId = fields.String(required=True)
+    accountId = fields.String(required=True)
+    symbol = fields.String(required=True)
+    side = fields.String(required=True, validate=validate.OneOf(['buy', 'sell']))
+    orderType = fields.String(required=True, validate=validate.OneOf(['limit', 'stop']))
+    triggerPrice = fields.Raw(required=True)
+    shares = fields.Raw(required=True)
+    
+    def load(self, json_data, **kwargs):
+        
+        data = super().load(json_data, **kwargs)
+        
+        data['triggerPrice'] = str(data['triggerPrice'])
+        data['shares'] = str(data['shares'])
+        return data
@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class InvestmentSimulation:
+    """
+    Rappresenta una simulazione Monte Carlo salvata per un utente.
+    Conserva parametri di input, seme e metodo per la riproducibilità.
+    Include bande percentili annuali e metriche di rischio calcolate sui percorsi.
+    """
+    
+    id: str
+    user_id: str
+    asset: str
+    amount: Decimal
+    strategy: str
+    risk_level: str
+    timeframe_years: int
+    method: str
+    paths: int
+    seed: int
+    expected_return: float
+    volatility: float
+    projected_returns: List[Dict[str, Any]]
+    risk_metrics: Dict[str, Any]
+    submitted_date: datetime
+    status: str = 'completed'
+    symbol: Optional[str] = None
+    
+    def __post_init__(self):
+        
+        if not self.user_id:
+            raise ValueError("User ID is required")
+        if self.amount <= 0:
+            raise ValueError("Amount must be positive")
+        if self.timeframe_years <= 0:
+            raise ValueError("Timeframe must be positive")
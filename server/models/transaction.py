@@ -22,6 +22,7 @@ class Transaction:
     transaction_date: datetime
     created_at: datetime
     reference_number: Optional[str] = None
+    price_version: Optional[int] = None
 
     def __post_init__(self):
         # controlli base
@@ -1,6 +1,7 @@
 
 
-from typing import List, Optional
+import threading
+from typing import Dict, List, Optional, Set
 from decimal import Decimal
 from models.account import Account, AccountType
 from .base import BaseRepository
@@ -14,6 +15,10 @@ class AccountRepository(BaseRepository[Account]):
     """
     
     
+    def __init__(self):
+        super().__init__()
+        self._balance_lock = threading.Lock()
+    
     def find_by_user_id(self, user_id: str) -> List[Account]:
         
         return [acc for acc in self._data.values() if acc.user_id == user_id]
@@ -25,6 +30,15 @@ class AccountRepository(BaseRepository[Account]):
             if acc.user_id == user_id and acc.type == account_type
         ]
     
+    def find_first_by_type(self, user_ids: Set[str], account_type: AccountType) -> Dict[str, Account]:
+        
+        # come find_by_type(...)[0] per molti utenti con un solo passaggio sui conti
+        first: Dict[str, Account] = {}
+        for acc in self._data.values():
+            if acc.type == account_type and acc.user_id in user_ids and acc.user_id not in first:
+                first[acc.user_id] = acc
+        return first
+    
     def find_by_account_number(self, account_number: str) -> Optional[Account]:
         
         for account in self._data.values():
@@ -45,9 +59,32 @@ class AccountRepository(BaseRepository[Account]):
         if account:
             account.balance = new_balance
             account.updated_at = account.updated_at
+            self._notify('updated', account)
             return account
         return None
     
+    def adjust_balance(self, account_id: str, delta: Decimal) -> Optional[Account]:
+        
+        # variazione applicata al saldo corrente sotto lock: non sovrascrive le scritture concorrenti
+        with self._balance_lock:
+            account = self.get_by_id(account_id)
+            if not account:
+                return None
+            account.balance += delta
+        self._notify('updated', account)
+        return account
+    
+    def withdraw(self, account_id: str, amount: Decimal) -> Optional[Account]:
+        
+        # addebito solo se il saldo lo copre: verifica e scrittura nello stesso passo sotto lock
+        with self._balance_lock:
+            account = self.get_by_id(account_id)
+            if not account or account.balance < amount:
+                return None
+            account.balance -= amount
+        self._notify('updated', account)
+        return account
+    
     def create_account(self, user_id: str, name: str, account_type: AccountType, 
                       initial_balance: Decimal = Decimal('0.00')) -> Account:
         
@@ -1,12 +1,14 @@
 
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, TypeVar, Generic
+from typing import Callable, Dict, List, Optional, TypeVar, Generic
 from uuid import uuid4
 
 
 T = TypeVar('T')
 
+RepositoryListener = Callable[[str, Optional[T]], None]
+
 
 class BaseRepository(Generic[T], ABC):
     """
@@ -18,6 +20,17 @@ class BaseRepository(Generic[T], ABC):
     
     def __init__(self):
         self._data: Dict[str, T] = {}
+        self._listeners: List[RepositoryListener] = []
+    
+    def add_listener(self, listener: RepositoryListener) -> None:
+        
+        # i listener ricevono ('created' | 'updated' | 'deleted' | 'cleared', entità)
+        self._listeners.append(listener)
+    
+    def _notify(self, event: str, entity: Optional[T]) -> None:
+        
+        for listener in self._listeners:
+            listener(event, entity)
     
     def get_by_id(self, entity_id: str) -> Optional[T]:
         
@@ -26,19 +39,22 @@ class BaseRepository(Generic[T], ABC):
     def create(self, entity: T) -> T:
         
         self._data[entity.id] = entity
+        self._notify('created', entity)
         return entity
     
     def update(self, entity_id: str, entity: T) -> Optional[T]:
         
         if entity_id in self._data:
             self._data[entity_id] = entity
+            self._notify('updated', entity)
             return entity
         return None
     
     def delete(self, entity_id: str) -> bool:
         
         if entity_id in self._data:
-            del self._data[entity_id]
+            entity = self._data.pop(entity_id)
+            self._notify('deleted', entity)
             return True
         return False
     
@@ -49,6 +65,7 @@ class BaseRepository(Generic[T], ABC):
     def clear_all(self):
         
         self._data.clear()
+        self._notify('cleared', None)
     
     def count(self) -> int:
         
@@ -1,65 +1,272 @@
 
 
-from typing import List, Optional
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
 from decimal import Decimal
+from datetime import datetime
 from models.investment import Investment, AvailableAsset
+from models.price import PriceSnapshot
 from .base import BaseRepository
+from .price_table import PriceTable
 
 
 class InvestmentRepository(BaseRepository[Investment]):
     """
     Repository per la gestione del portafoglio investimenti dell'utente.
-    Implementa operazioni per calcolare valore totale e cost basis.
-    Gestisce aggiornamenti di prezzo e ricerche per simbolo e utente.
+    Mantiene indici per utente e simbolo e totali correnti di valore e cost basis.
+    Gestisce aggiornamenti di prezzo per delta sui soli detentori del simbolo.
     """
     
     
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._by_user: Dict[str, Dict[str, None]] = {}
+        self._by_symbol: Dict[str, Dict[str, None]] = {}
+        # contributo corrente di ogni posizione: (user_id, symbol, valore di mercato, cost basis)
+        self._contributions: Dict[str, Tuple[str, str, Decimal, Decimal]] = {}
+        # totali correnti per utente: [valore di mercato, cost basis]
+        self._totals: Dict[str, List[Decimal]] = {}
+        # versione della tabella prezzi riflessa dai totali
+        self._price_version = 0
+    
+    def create(self, entity: Investment) -> Investment:
+        
+        with self._lock:
+            self._index(entity)
+            return super().create(entity)
+    
+    def update(self, entity_id: str, entity: Investment) -> Optional[Investment]:
+        
+        with self._lock:
+            if entity_id not in self._data:
+                return None
+            self._unindex(entity_id)
+            self._index(entity)
+            return super().update(entity_id, entity)
+    
+    def delete(self, entity_id: str) -> bool:
+        
+        with self._lock:
+            if entity_id not in self._data:
+                return False
+            self._unindex(entity_id)
+            return super().delete(entity_id)
+    
+    def clear_all(self):
+        
+        with self._lock:
+            self._by_user.clear()
+            self._by_symbol.clear()
+            self._contributions.clear()
+            self._totals.clear()
+            super().clear_all()
+    
     def find_by_user_id(self, user_id: str) -> List[Investment]:
         
-        return [inv for inv in self._data.values() if inv.user_id == user_id]
+        with self._lock:
+            return [self._data[inv_id] for inv_id in self._by_user.get(user_id, ())]
     
     def find_by_symbol(self, user_id: str, symbol: str) -> Optional[Investment]:
         
-        for investment in self._data.values():
-            if investment.user_id == user_id and investment.symbol == symbol:
-                return investment
+        with self._lock:
+            for inv_id in self._by_user.get(user_id, ()):
+                investment = self._data[inv_id]
+                if investment.symbol == symbol:
+                    return investment
         return None
     
+    def find_holders(self, symbol: str) -> List[Investment]:
+        
+        with self._lock:
+            return [self._data[inv_id] for inv_id in self._by_symbol.get(symbol, ())]
+    
     def get_total_value(self, user_id: str) -> Decimal:
         
-        investments = self.find_by_user_id(user_id)
-        return sum(inv.current_value for inv in investments)
+        return self.get_portfolio_totals(user_id)[0]
     
     def get_total_cost_basis(self, user_id: str) -> Decimal:
         
-        investments = self.find_by_user_id(user_id)
-        return sum(inv.shares * inv.purchase_price for inv in investments)
+        return self.get_portfolio_totals(user_id)[1]
+    
+    def get_portfolio_totals(self, user_id: str) -> Tuple[Decimal, Decimal]:
+        
+        return self.get_portfolio_snapshot(user_id)[:2]
+    
+    def get_portfolio_snapshot(self, user_id: str) -> Tuple[Decimal, Decimal, int]:
+        
+        # valore, cost basis e versione prezzi letti insieme sotto lo stesso lock
+        with self._lock:
+            totals = self._totals.get(user_id)
+            if totals is None:
+                return Decimal('0'), Decimal('0'), self._price_version
+            return totals[0], totals[1], self._price_version
+    
+    def iter_portfolio_totals(self) -> Iterator[Tuple[str, Decimal, Decimal]]:
+        
+        with self._lock:
+            snapshot = [(user_id, totals[0], totals[1]) for user_id, totals in self._totals.items()]
+        return iter(snapshot)
     
     def update_current_price(self, investment_id: str, new_price: Decimal) -> Optional[Investment]:
         
-        investment = self.get_by_id(investment_id)
-        if investment:
-            investment.current_price = new_price
-            from datetime import datetime
-            investment.updated_at = datetime.now()
-            return investment
+        with self._lock:
+            investment = self.get_by_id(investment_id)
+            if investment:
+                self._unindex(investment_id)
+                investment.current_price = new_price
+                investment.updated_at = datetime.now()
+                self._index(investment)
+                self._notify('updated', investment)
+                return investment
         return None
+    
+    def apply_prices(self, price_updates: Dict[str, Decimal], price_version: Optional[int] = None) -> List[Investment]:
+        
+        # aggiorna solo i detentori dei simboli: delta = Δprezzo × quote sul totale dell'utente
+        updated = []
+        with self._lock:
+            now = datetime.now()
+            for symbol, new_price in price_updates.items():
+                for inv_id in self._by_symbol.get(symbol, ()):
+                    investment = self._data[inv_id]
+                    user_id, _, market_value, cost_basis = self._contributions[inv_id]
+                    new_market_value = investment.shares * new_price
+                    self._totals[user_id][0] += new_market_value - market_value
+                    self._contributions[inv_id] = (user_id, symbol, new_market_value, cost_basis)
+                    investment.current_price = new_price
+                    investment.updated_at = now
+                    updated.append(investment)
+            if price_version is not None:
+                self._price_version = price_version
+            for investment in updated:
+                self._notify('updated', investment)
+        return updated
+    
+    def reconcile_totals(self, tolerance: Decimal = Decimal('0.000001')) -> Dict[str, Dict[str, Decimal]]:
+        
+        # confronta i totali correnti con un ricalcolo completo; restituisce solo le discrepanze.
+        # la tolleranza assorbe l'arrotondamento a 28 cifre dei prezzi medi ponderati
+        with self._lock:
+            expected: Dict[str, List[Decimal]] = {}
+            for investment in self._data.values():
+                totals = expected.setdefault(investment.user_id, [Decimal('0'), Decimal('0')])
+                totals[0] += investment.shares * investment.current_price
+                totals[1] += investment.shares * investment.purchase_price
+            
+            mismatches = {}
+            for user_id in set(expected) | set(self._totals):
+                running = self._totals.get(user_id, [Decimal('0'), Decimal('0')])
+                recomputed = expected.get(user_id, [Decimal('0'), Decimal('0')])
+                if abs(running[0] - recomputed[0]) > tolerance or abs(running[1] - recomputed[1]) > tolerance:
+                    mismatches[user_id] = {
+                        "market_value": running[0],
+                        "expected_market_value": recomputed[0],
+                        "cost_basis": running[1],
+                        "expected_cost_basis": recomputed[1]
+                    }
+            return mismatches
+    
+    def _index(self, investment: Investment) -> None:
+        
+        market_value = investment.shares * investment.current_price
+        cost_basis = investment.shares * investment.purchase_price
+        self._by_user.setdefault(investment.user_id, {})[investment.id] = None
+        self._by_symbol.setdefault(investment.symbol, {})[investment.id] = None
+        self._contributions[investment.id] = (investment.user_id, investment.symbol, market_value, cost_basis)
+        totals = self._totals.setdefault(investment.user_id, [Decimal('0'), Decimal('0')])
+        totals[0] += market_value
+        totals[1] += cost_basis
+    
+    def _unindex(self, investment_id: str) -> None:
+        
+        contribution = self._contributions.pop(investment_id, None)
+        if contribution is None:
+            return
+        user_id, symbol, market_value, cost_basis = contribution
+        
+        user_holdings = self._by_user.get(user_id, {})
+        user_holdings.pop(investment_id, None)
+        symbol_holders = self._by_symbol.get(symbol, {})
+        symbol_holders.pop(investment_id, None)
+        if not symbol_holders:
+            self._by_symbol.pop(symbol, None)
+        
+        if user_holdings:
+            totals = self._totals[user_id]
+            totals[0] -= market_value
+            totals[1] -= cost_basis
+        else:
+            # nessuna posizione residua: azzera i totali senza accumulare residui
+            self._by_user.pop(user_id, None)
+            self._totals.pop(user_id, None)
 
 
 class AvailableAssetRepository(BaseRepository[AvailableAsset]):
     """
     Repository per la gestione degli asset finanziari disponibili per trading.
     Implementa ricerche per simbolo, mercato e tipo di asset.
-    Gestisce il catalogo di strumenti finanziari negoziabili nel sistema.
+    Pubblica i prezzi correnti in una tabella versionata copy-on-write.
     """
     
     
+    def __init__(self):
+        super().__init__()
+        self.price_table = PriceTable()
+        self._by_symbol: Dict[str, str] = {}
+    
+    def create(self, entity: AvailableAsset) -> AvailableAsset:
+        
+        self._by_symbol[entity.symbol] = entity.id
+        self.price_table.publish({entity.symbol: entity.current_price})
+        return super().create(entity)
+    
+    def update(self, entity_id: str, entity: AvailableAsset) -> Optional[AvailableAsset]:
+        
+        if entity_id not in self._data:
+            return None
+        self._by_symbol[entity.symbol] = entity.id
+        if self.price_table.snapshot().get(entity.symbol) != entity.current_price:
+            self.price_table.publish({entity.symbol: entity.current_price})
+        return super().update(entity_id, entity)
+    
+    def delete(self, entity_id: str) -> bool:
+        
+        asset = self._data.get(entity_id)
+        if asset is None:
+            return False
+        self._by_symbol.pop(asset.symbol, None)
+        self.price_table.remove(asset.symbol)
+        return super().delete(entity_id)
+    
+    def clear_all(self):
+        
+        for symbol in list(self._by_symbol):
+            self.price_table.remove(symbol)
+        self._by_symbol.clear()
+        super().clear_all()
+    
+    def price_snapshot(self) -> PriceSnapshot:
+        
+        return self.price_table.snapshot()
+    
+    def apply_prices(self, price_updates: Dict[str, Decimal]) -> PriceSnapshot:
+        
+        # un solo scambio di riferimento rende visibile l'intero tick ai lettori
+        known_updates = {symbol: price for symbol, price in price_updates.items() if symbol in self._by_symbol}
+        snapshot = self.price_table.publish(known_updates)
+        now = datetime.now()
+        for symbol, new_price in known_updates.items():
+            asset = self._data[self._by_symbol[symbol]]
+            asset.current_price = new_price
+            asset.updated_at = now
+            self._notify('updated', asset)
+        return snapshot
+    
     def find_by_symbol(self, symbol: str) -> Optional[AvailableAsset]:
         
-        for asset in self._data.values():
-            if asset.symbol == symbol:
-                return asset
-        return None
+        asset_id = self._by_symbol.get(symbol)
+        return self._data.get(asset_id) if asset_id else None
     
     def find_by_market(self, market: str) -> List[AvailableAsset]:
         
@@ -67,4 +274,4 @@ class AvailableAssetRepository(BaseRepository[AvailableAsset]):
     
     def find_by_type(self, asset_type: str) -> List[AvailableAsset]:
         
-        return [asset for asset in self._data.values() if asset.asset_type == asset_type]
\ No newline at end of file
+        return [asset for asset in self._data.values() if asset.asset_type == asset_type]
@@ -1,6 +1,6 @@
 
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from decimal import Decimal
 from models.loan import Loan, LoanType, LoanStatus
 from .base import BaseRepository
@@ -29,6 +29,15 @@ class LoanRepository(BaseRepository[Loan]):
         
         return self.find_by_status(user_id, 'active')
     
+    def group_active_by_user(self) -> Dict[str, List[Loan]]:
+        
+        # un solo passaggio su tutti i prestiti attivi, raggruppati per utente
+        grouped: Dict[str, List[Loan]] = {}
+        for loan in self._data.values():
+            if loan.status == 'active':
+                grouped.setdefault(loan.user_id, []).append(loan)
+        return grouped
+    
     def find_by_type(self, user_id: str, loan_type: LoanType) -> List[Loan]:
         
         return [
@@ -57,5 +66,6 @@ class LoanRepository(BaseRepository[Loan]):
                 loan.remaining_balance = Decimal('0.00')
             from datetime import datetime
             loan.updated_at = datetime.now()
+            self._notify('updated', loan)
             return loan
         return None
\ No newline at end of file
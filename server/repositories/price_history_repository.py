@@ -0,0 +1,228 @@
+import threading
+from array import array
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from models.price import PriceSnapshot
+
+
+class PriceRingBuffer:
+    """
+    Buffer circolare a capacità fissa dei tick di prezzo di un simbolo.
+    Memorizza timestamp e prezzi in array contigui preallocati.
+    L'inserimento è O(1) e la lettura restituisce slice senza copie.
+    """
+    
+    
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self._next = 0
+        self.size = 0
+        self.total_appended = 0
+    
+    def append(self, timestamp: float, price: float) -> None:
+        
+        index = self._next
+        self.timestamps[index] = timestamp
+        self.prices[index] = price
+        self._next = index + 1 if index + 1 < self.capacity else 0
+        if self.size < self.capacity:
+            self.size += 1
+        self.total_appended += 1
+    
+    def last(self) -> Optional[Tuple[float, float]]:
+        
+        if self.size == 0:
+            return None
+        index = self._next - 1 if self._next > 0 else self.capacity - 1
+        return self.timestamps[index], self.prices[index]
+    
+    def segments(self, column: array, limit: Optional[int] = None) -> List[memoryview]:
+        
+        # al più due slice in ordine cronologico (prima e dopo il punto di wrap)
+        count = self.size if limit is None else max(0, min(limit, self.size))
+        if count == 0:
+            return []
+        view = memoryview(column)
+        start = (self._next - count) % self.capacity
+        if start + count <= self.capacity:
+            return [view[start:start + count]]
+        return [view[start:], view[:self._next]]
+    
+    def tolist(self, column: array, limit: Optional[int] = None) -> List[float]:
+        
+        values: List[float] = []
+        for segment in self.segments(column, limit):
+            values.extend(segment.tolist())
+        return values
+
+
+class OHLCBarSeries:
+    """
+    Serie di barre OHLC a risoluzione fissa alimentata tick per tick.
+    Ogni tick aggiorna la barra corrente o ne apre una nuova in O(1).
+    Conserva un numero limitato di barre in array circolari.
+    """
+    
+    
+    def __init__(self, resolution_seconds: int, capacity: int):
+        self.resolution_seconds = resolution_seconds
+        self.capacity = capacity
+        self.starts = array('d', bytes(8 * capacity))
+        self.opens = array('d', bytes(8 * capacity))
+        self.highs = array('d', bytes(8 * capacity))
+        self.lows = array('d', bytes(8 * capacity))
+        self.closes = array('d', bytes(8 * capacity))
+        self.ticks = array('q', bytes(8 * capacity))
+        self._current = -1
+        self.size = 0
+        self.late_ticks = 0
+    
+    def add(self, timestamp: float, price: float) -> None:
+        
+        bar_start = timestamp - (timestamp % self.resolution_seconds)
+        current = self._current
+        if current >= 0 and bar_start == self.starts[current]:
+            if price > self.highs[current]:
+                self.highs[current] = price
+            if price < self.lows[current]:
+                self.lows[current] = price
+            self.closes[current] = price
+            self.ticks[current] += 1
+            return
+        if current >= 0 and bar_start < self.starts[current]:
+            # tick fuori ordine rispetto alla barra aperta: non riscrive barre già chiuse
+            self.late_ticks += 1
+            return
+        
+        current = current + 1 if current + 1 < self.capacity else 0
+        self.starts[current] = bar_start
+        self.opens[current] = price
+        self.highs[current] = price
+        self.lows[current] = price
+        self.closes[current] = price
+        self.ticks[current] = 1
+        self._current = current
+        if self.size < self.capacity:
+            self.size += 1
+    
+    def bars(self, limit: Optional[int] = None) -> Dict[str, List[Any]]:
+        
+        count = self.size if limit is None else max(0, min(limit, self.size))
+        columns = {
+            "timestamp": self.starts,
+            "open": self.opens,
+            "high": self.highs,
+            "low": self.lows,
+            "close": self.closes,
+            "ticks": self.ticks
+        }
+        if count == 0:
+            return {name: [] for name in columns}
+        end = self._current + 1
+        start = (end - count) % self.capacity
+        result = {}
+        for name, column in columns.items():
+            view = memoryview(column)
+            if start + count <= self.capacity:
+                result[name] = view[start:start + count].tolist()
+            else:
+                result[name] = view[start:].tolist() + view[:end].tolist()
+        return result
+
+
+class SymbolPriceHistory:
+    """
+    Storico prezzi di un singolo simbolo: tick grezzi e barre aggregate.
+    Ogni tick viene scritto nel buffer e propagato a tutte le risoluzioni.
+    La memoria occupata è costante e fissata alla creazione.
+    """
+    
+    
+    def __init__(self, tick_capacity: int, bar_capacity: int, resolutions: Dict[str, int]):
+        self.ticks = PriceRingBuffer(tick_capacity)
+        self.series = {
+            name: OHLCBarSeries(seconds, bar_capacity)
+            for name, seconds in resolutions.items()
+        }
+    
+    def add(self, timestamp: float, price: float) -> None:
+        
+        self.ticks.append(timestamp, price)
+        for series in self.series.values():
+            series.add(timestamp, price)
+
+
+class PriceHistoryRepository:
+    """
+    Repository dello storico prezzi per simbolo con memoria limitata.
+    Registra i tick pubblicati dal servizio investimenti e li aggrega in barre OHLC.
+    Espone una versione incrementale per invalidare i calcoli derivati dallo storico.
+    """
+    
+    RESOLUTIONS = {
+        "1m": 60,
+        "1h": 3600,
+        "1d": 86400
+    }
+    
+    
+    def __init__(self, tick_capacity: int = 4096, bar_capacity: int = 1440):
+        self.tick_capacity = tick_capacity
+        self.bar_capacity = bar_capacity
+        self._histories: Dict[str, SymbolPriceHistory] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+    
+    def _history(self, symbol: str) -> SymbolPriceHistory:
+        
+        history = self._histories.get(symbol)
+        if history is None:
+            history = SymbolPriceHistory(self.tick_capacity, self.bar_capacity, self.RESOLUTIONS)
+            self._histories[symbol] = history
+        return history
+    
+    def record_tick(self, symbol: str, price: Decimal, timestamp: float) -> None:
+        
+        with self._lock:
+            self._history(symbol).add(timestamp, float(price))
+            self.version += 1
+    
+    def record_prices(self, snapshot: PriceSnapshot, price_updates: Dict[str, Decimal]) -> None:
+        
+        # listener dei tick: un incremento di versione per l'intero batch
+        timestamp = snapshot.created_at.timestamp()
+        with self._lock:
+            for symbol, price in price_updates.items():
+                if snapshot.get(symbol) is not None:
+                    self._history(symbol).add(timestamp, float(price))
+            self.version += 1
+    
+    def symbols(self) -> List[str]:
+        
+        with self._lock:
+            return list(self._histories)
+    
+    def get_ticks(self, symbol: str, limit: Optional[int] = None) -> Dict[str, List[float]]:
+        
+        with self._lock:
+            history = self._histories.get(symbol)
+            if history is None:
+                return {"timestamp": [], "price": []}
+            return {
+                "timestamp": history.ticks.tolist(history.ticks.timestamps, limit),
+                "price": history.ticks.tolist(history.ticks.prices, limit)
+            }
+    
+    def get_bars(self, symbol: str, resolution: str = "1m", limit: Optional[int] = None) -> Dict[str, List[Any]]:
+        
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution {resolution}")
+        with self._lock:
+            history = self._histories.get(symbol)
+            if history is None:
+                return {name: [] for name in ("timestamp", "open", "high", "low", "close", "ticks")}
+            return history.series[resolution].bars(limit)
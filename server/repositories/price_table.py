@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Deque, Dict, Optional
+from models.price import PriceSnapshot
+
+
+class PriceTable:
+    """
+    Tabella prezzi versionata con semantica copy-on-write.
+    Ogni pubblicazione crea un nuovo snapshot e lo sostituisce con un solo scambio di riferimento.
+    I lettori acquisiscono lo snapshot corrente senza alcun lock.
+    """
+    
+    
+    def __init__(self, history_size: int = 64):
+        self._snapshot = PriceSnapshot(version=0, prices=MappingProxyType({}), created_at=datetime.now())
+        self._history: Deque[PriceSnapshot] = deque([self._snapshot], maxlen=history_size)
+        # serializza solo gli scrittori; la lettura di self._snapshot è atomica
+        self._write_lock = threading.Lock()
+    
+    def snapshot(self) -> PriceSnapshot:
+        
+        return self._snapshot
+    
+    @property
+    def version(self) -> int:
+        
+        return self._snapshot.version
+    
+    def publish(self, price_updates: Dict[str, Decimal]) -> PriceSnapshot:
+        
+        with self._write_lock:
+            current = self._snapshot
+            prices = dict(current.prices)
+            prices.update(price_updates)
+            snapshot = PriceSnapshot(
+                version=current.version + 1,
+                prices=MappingProxyType(prices),
+                created_at=datetime.now()
+            )
+            self._history.append(snapshot)
+            self._snapshot = snapshot
+            return snapshot
+    
+    def remove(self, symbol: str) -> PriceSnapshot:
+        
+        with self._write_lock:
+            current = self._snapshot
+            if symbol not in current.prices:
+                return current
+            prices = dict(current.prices)
+            del prices[symbol]
+            snapshot = PriceSnapshot(
+                version=current.version + 1,
+                prices=MappingProxyType(prices),
+                created_at=datetime.now()
+            )
+            self._history.append(snapshot)
+            self._snapshot = snapshot
+            return snapshot
+    
+    def get_version(self, version: int) -> Optional[PriceSnapshot]:
+        
+        for snapshot in reversed(self._history):
+            if snapshot.version == version:
+                return snapshot
+        return None
+    
+    def diff_since(self, version: int) -> Optional[Dict[str, tuple]]:
+        
+        # None se la versione richiesta non è più nello storico recente
+        base = self.get_version(version)
+        if base is None:
+            return None
+        return base.diff(self._snapshot)
@@ -0,0 +1,64 @@
+import threading
+from decimal import Decimal
+from typing import Dict, List, Optional
+from models.investment import RealizedGain
+from .base import BaseRepository
+
+
+class RealizedGainRepository(BaseRepository[RealizedGain]):
+    """
+    Repository dei risultati realizzati dalle vendite di lotti fiscali.
+    Indicizza le vendite per utente in ordine di registrazione.
+    Mantiene totali correnti del realizzato per utente e simbolo.
+    """
+    
+    
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._by_user: Dict[str, List[str]] = {}
+        self._totals: Dict[str, Dict[str, Decimal]] = {}
+    
+    def create(self, entity: RealizedGain) -> RealizedGain:
+        
+        with self._lock:
+            self._by_user.setdefault(entity.user_id, []).append(entity.id)
+            totals = self._totals.setdefault(entity.user_id, {})
+            totals[entity.symbol] = totals.get(entity.symbol, Decimal('0')) + entity.realized_profit_loss
+            return super().create(entity)
+    
+    def delete(self, entity_id: str) -> bool:
+        
+        with self._lock:
+            gain = self._data.get(entity_id)
+            if gain is None:
+                return False
+            self._by_user[gain.user_id].remove(entity_id)
+            self._totals[gain.user_id][gain.symbol] -= gain.realized_profit_loss
+            return super().delete(entity_id)
+    
+    def clear_all(self):
+        
+        with self._lock:
+            self._by_user.clear()
+            self._totals.clear()
+            super().clear_all()
+    
+    def find_by_user_id(self, user_id: str, symbol: Optional[str] = None,
+                        limit: Optional[int] = None) -> List[RealizedGain]:
+        
+        # più recenti per prime; con un limite si scorrono solo le ultime vendite
+        with self._lock:
+            gains = []
+            for gain_id in reversed(self._by_user.get(user_id, ())):
+                gain = self._data[gain_id]
+                if symbol is None or gain.symbol == symbol:
+                    gains.append(gain)
+                    if limit and len(gains) >= limit:
+                        break
+            return gains
+    
+    def get_realized_totals(self, user_id: str) -> Dict[str, Decimal]:
+        
+        with self._lock:
+            return dict(self._totals.get(user_id, {}))
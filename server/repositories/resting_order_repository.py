@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import threading
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from models.order import RestingOrder
+from .base import BaseRepository
+
+
+class RestingOrderRepository(BaseRepository[RestingOrder]):
+    """
+    Repository degli ordini limite e stop in attesa di attivazione.
+    Indicizza gli ordini aperti per simbolo in due heap ordinati per soglia di attivazione.
+    A ogni tick estrae solo gli ordini la cui soglia è stata attraversata.
+    """
+    
+    
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        # per simbolo: (heap max di chi scatta con prezzo <= soglia, heap min di chi scatta con prezzo >= soglia)
+        self._books: Dict[str, Tuple[List[Tuple[Decimal, int, str]], List[Tuple[Decimal, int, str]]]] = {}
+        # voci annullate ancora presenti negli heap: rimosse in modo pigro
+        self._stale: Dict[str, int] = {}
+        self._sequence = itertools.count()
+    
+    def create(self, entity: RestingOrder) -> RestingOrder:
+        
+        with self._lock:
+            if entity.status == 'open':
+                self._push(entity)
+            return super().create(entity)
+    
+    def delete(self, entity_id: str) -> bool:
+        
+        with self._lock:
+            order = self._data.get(entity_id)
+            if order is not None and order.status == 'open':
+                self._stale[order.symbol] = self._stale.get(order.symbol, 0) + 1
+            return super().delete(entity_id)
+    
+    def clear_all(self):
+        
+        with self._lock:
+            self._books.clear()
+            self._stale.clear()
+            super().clear_all()
+    
+    def find_by_user_id(self, user_id: str, status: Optional[str] = None) -> List[RestingOrder]:
+        
+        with self._lock:
+            orders = [
+                order for order in self._data.values()
+                if order.user_id == user_id and (status is None or order.status == status)
+            ]
+        orders.sort(key=lambda x: x.created_at, reverse=True)
+        return orders
+    
+    def cancel(self, order_id: str) -> Optional[RestingOrder]:
+        
+        with self._lock:
+            order = self._data.get(order_id)
+            if order is None or order.status != 'open':
+                return None
+            order.status = 'cancelled'
+            self._stale[order.symbol] = self._stale.get(order.symbol, 0) + 1
+            self._compact(order.symbol)
+            self._notify('updated', order)
+            return order
+    
+    def pop_triggered(self, symbol: str, price: Decimal) -> List[RestingOrder]:
+        
+        # O(1) se nessuna soglia è attraversata: si confronta solo la cima di ciascun heap
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None:
+                return []
+            at_or_below, at_or_above = book
+            triggered = []
+            while at_or_below and -at_or_below[0][0] >= price:
+                self._collect(symbol, heapq.heappop(at_or_below)[2], triggered)
+            while at_or_above and at_or_above[0][0] <= price:
+                self._collect(symbol, heapq.heappop(at_or_above)[2], triggered)
+            if not at_or_below and not at_or_above:
+                self._books.pop(symbol, None)
+                self._stale.pop(symbol, None)
+            for order in triggered:
+                order.status = 'triggered'
+            return triggered
+    
+    def count_open(self) -> int:
+        
+        with self._lock:
+            return sum(len(below) + len(above) for below, above in self._books.values()) - sum(self._stale.values())
+    
+    def _push(self, order: RestingOrder) -> None:
+        
+        at_or_below, at_or_above = self._books.setdefault(order.symbol, ([], []))
+        if order.fires_at_or_below:
+            heapq.heappush(at_or_below, (-order.trigger_price, next(self._sequence), order.id))
+        else:
+            heapq.heappush(at_or_above, (order.trigger_price, next(self._sequence), order.id))
+    
+    def _collect(self, symbol: str, order_id: str, triggered: List[RestingOrder]) -> None:
+        
+        order = self._data.get(order_id)
+        if order is not None and order.status == 'open':
+            triggered.append(order)
+        elif self._stale.get(symbol):
+            self._stale[symbol] -= 1
+    
+    def _compact(self, symbol: str) -> None:
+        
+        # ricostruisce gli heap quando più di metà delle voci è annullata
+        book = self._books.get(symbol)
+        if book is None:
+            return
+        size = len(book[0]) + len(book[1])
+        if self._stale.get(symbol, 0) * 2 <= size:
+            return
+        rebuilt = tuple(
+            [entry for entry in heap if entry[2] in self._data and self._data[entry[2]].status == 'open']
+            for heap in book
+        )
+        for heap in rebuilt:
+            heapq.heapify(heap)
+        self._stale[symbol] = 0
+        if rebuilt[0] or rebuilt[1]:
+            self._books[symbol] = rebuilt
+        else:
+            self._books.pop(symbol, None)
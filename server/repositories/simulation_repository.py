@@ -0,0 +1,18 @@
+from typing import List
+from models.simulation import InvestmentSimulation
+from .base import BaseRepository
+
+
+class SimulationRepository(BaseRepository[InvestmentSimulation]):
+    """
+    Repository per le simulazioni di investimento salvate dagli utenti.
+    Implementa la ricerca per utente in ordine cronologico inverso.
+    Gestisce lo storico delle simulazioni Monte Carlo eseguite.
+    """
+    
+    
+    def find_by_user_id(self, user_id: str) -> List[InvestmentSimulation]:
+        
+        simulations = [sim for sim in self._data.values() if sim.user_id == user_id]
+        simulations.sort(key=lambda x: x.submitted_date, reverse=True)
+        return simulations
@@ -1,6 +1,6 @@
 
 
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
 from models.transaction import Transaction
@@ -15,6 +15,16 @@ class TransactionRepository(BaseRepository[Transaction]):
     """
     
     
+    def create_many(self, transactions: Iterable[Transaction]) -> List[Transaction]:
+        
+        # inserimento in blocco: tutte le transazioni sono visibili prima di notificare i listener
+        transactions = list(transactions)
+        for transaction in transactions:
+            self._data[transaction.id] = transaction
+        for transaction in transactions:
+            self._notify('created', transaction)
+        return transactions
+    
     def find_by_account_id(self, account_id: str, limit: Optional[int] = None) -> List[Transaction]:
         
         transactions = [txn for txn in self._data.values() if txn.account_id == account_id]
@@ -36,6 +46,11 @@ class TransactionRepository(BaseRepository[Transaction]):
             transactions = transactions[:limit]
         return transactions
     
+    def iter_by_account_ids(self, account_ids: Iterable[str]) -> Iterator[Transaction]:
+        
+        account_ids = account_ids if isinstance(account_ids, (set, frozenset)) else set(account_ids)
+        return (txn for txn in list(self._data.values()) if txn.account_id in account_ids)
+    
     def find_by_category(self, account_id: str, category: str) -> List[Transaction]:
         
         return [
@@ -0,0 +1,365 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+CENTS = 100
+CENT = Decimal('0.01')
+
+
+@dataclass(frozen=True, eq=False)
+class AmortizationSchedule:
+    """
+    Piano di ammortamento a rata costante con quota interessi, quota capitale e debito residuo per periodo.
+    In modalità esatta gli importi sono centesimi interi arrotondati periodo per periodo come da contratto.
+    Gli array sono condivisi dalla cache e quindi in sola lettura.
+    """
+    
+    amount: Decimal
+    annual_rate: Decimal
+    term_months: int
+    exact: bool
+    payment: Union[Decimal, float]
+    payments: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray
+    
+    def _total(self, values: np.ndarray) -> Union[Decimal, float]:
+        
+        if self.exact:
+            return Decimal(int(values.sum())) / CENTS
+        return float(values.sum())
+    
+    @property
+    def total_payment(self) -> Union[Decimal, float]:
+        
+        return self._total(self.payments)
+    
+    @property
+    def total_interest(self) -> Union[Decimal, float]:
+        
+        return self._total(self.interest)
+    
+    def rows(self, start: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        
+        stop = self.term_months if limit is None else min(self.term_months, start + limit)
+        columns = [array[start:stop].tolist() for array in (self.payments, self.interest, self.principal, self.balance)]
+        if self.exact:
+            columns = [[Decimal(value) / CENTS for value in column] for column in columns]
+        return [
+            {"period": start + index + 1, "payment": payment, "interest": interest,
+             "principal": principal, "balance": balance}
+            for index, (payment, interest, principal, balance) in enumerate(zip(*columns))
+        ]
+    
+    def to_dict(self, start: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        
+        return {
+            "amount": self.amount,
+            "annual_rate": self.annual_rate,
+            "term_months": self.term_months,
+            "exact": self.exact,
+            "payment": self.payment,
+            "total_payment": self.total_payment,
+            "total_interest": self.total_interest,
+            "periods": self.rows(start, limit)
+        }
+
+
+@dataclass(frozen=True, eq=False)
+class QuoteGrid:
+    """
+    Griglia di preventivi per combinazioni di importo, tasso e durata.
+    Ogni matrice ha forma (importi, tassi, durate) con valori arrotondati al centesimo.
+    Calcolata una volta per combinazione di assi e condivisa dalla cache.
+    """
+    
+    amounts: Tuple[Decimal, ...]
+    rates: Tuple[Decimal, ...]
+    terms: Tuple[int, ...]
+    monthly_payment: np.ndarray
+    total_payment: np.ndarray
+    total_interest: np.ndarray
+    
+    def to_dict(self) -> Dict[str, Any]:
+        
+        return {
+            "amounts": list(self.amounts),
+            "rates": list(self.rates),
+            "terms": list(self.terms),
+            "monthly_payment": self.monthly_payment.tolist(),
+            "total_payment": self.total_payment.tolist(),
+            "total_interest": self.total_interest.tolist()
+        }
+
+
+class AmortizationCache:
+    """
+    Cache LRU condivisa da rate, piani di ammortamento e griglie di preventivi.
+    Il limite è in celle: ogni voce pesa quanto i valori che conserva, una rata una cella, un piano i suoi periodi.
+    Traccia hit, miss e voci presenti per tipo, più le evizioni complessive.
+    """
+    
+    
+    def __init__(self, max_cells: int):
+        if max_cells <= 0:
+            raise ValueError("Cache size must be positive")
+        self.max_cells = max_cells
+        self._entries: "OrderedDict[Tuple[Any, ...], Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cells = 0
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.entries: Dict[str, int] = {}
+        self.evictions = 0
+    
+    def get_or_compute(self, key: Tuple[Any, ...], compute: Callable[[], Any], weight: int) -> Any:
+        
+        # la chiave inizia con il tipo di voce ('payment', 'schedule', 'grid')
+        kind = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits[kind] = self.hits.get(kind, 0) + 1
+                return entry[0]
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+        
+        value = compute()
+        if weight > self.max_cells:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, weight)
+                self.cells += weight
+                self.entries[kind] = self.entries.get(kind, 0) + 1
+                while self.cells > self.max_cells:
+                    evicted_key, (_, evicted_weight) = self._entries.popitem(last=False)
+                    self.cells -= evicted_weight
+                    self.entries[evicted_key[0]] -= 1
+                    self.evictions += 1
+        return value
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "entries": dict(self.entries),
+                "cells": self.cells,
+                "max_cells": self.max_cells,
+                "evictions": self.evictions
+            }
+
+
+class AmortizationEngine:
+    """
+    Motore di calcolo di rate e piani di ammortamento alla francese.
+    Il piano indicativo è calcolato in forma chiusa con array NumPy, quello contrattuale in centesimi interi.
+    Rate, piani e griglie di preventivi condividono una sola cache LRU per (importo, tasso, durata).
+    """
+    
+    MAX_GRID_CELLS = 100000
+    MAX_TERM_MONTHS = 600
+    
+    
+    def __init__(self, cache_cells: int = 4000000):
+        self.cache = AmortizationCache(cache_cells)
+    
+    def monthly_payment(self, amount: Decimal, annual_rate: Decimal, term_months: int) -> Decimal:
+        
+        return self.cache.get_or_compute(
+            ('payment', amount, annual_rate, term_months),
+            lambda: self._monthly_payment(amount, annual_rate, term_months),
+            1
+        )
+    
+    def schedule(self, amount: Decimal, annual_rate: Decimal, term_months: int,
+                 exact: bool = False) -> AmortizationSchedule:
+        
+        if not Decimal(amount).is_finite() or not Decimal(annual_rate).is_finite():
+            raise ValueError("Loan amount and interest rate must be finite numbers")
+        if amount <= 0:
+            raise ValueError("Loan amount must be positive")
+        if annual_rate < 0:
+            raise ValueError("Interest rate cannot be negative")
+        if not 1 <= term_months <= self.MAX_TERM_MONTHS:
+            raise ValueError(f"Term months must be between 1 and {self.MAX_TERM_MONTHS}")
+        key = ('schedule', Decimal(amount), Decimal(annual_rate), int(term_months), exact)
+        return self.cache.get_or_compute(key, lambda: self._build_schedule(*key[1:]), 4 * int(term_months))
+    
+    def _monthly_payment(self, amount: Decimal, annual_rate: Decimal, term_months: int) -> Decimal:
+        
+        # rata contrattuale al centesimo: formula dell'annualità con precisione estesa, una sola potenza
+        if not 1 <= term_months <= self.MAX_TERM_MONTHS:
+            raise ValueError(f"Term months must be between 1 and {self.MAX_TERM_MONTHS}")
+        with localcontext() as context:
+            context.prec = 40
+            monthly_rate = Decimal(annual_rate) / 1200
+            if monthly_rate == 0:
+                payment = Decimal(amount) / term_months
+            else:
+                payment = Decimal(amount) * monthly_rate / (1 - (1 + monthly_rate) ** -term_months)
+            return payment.quantize(CENT, rounding=ROUND_HALF_UP)
+    
+    def _build_schedule(self, amount: Decimal, annual_rate: Decimal, term_months: int,
+                        exact: bool) -> AmortizationSchedule:
+        
+        if exact:
+            payment = self.monthly_payment(amount, annual_rate, term_months)
+            columns = self._exact_columns(amount, annual_rate, term_months, payment)
+        else:
+            payment, columns = self._vector_columns(float(amount), float(annual_rate) / 1200, term_months)
+        for column in columns:
+            column.setflags(write=False)
+        return AmortizationSchedule(amount, annual_rate, term_months, exact, payment, *columns)
+    
+    @staticmethod
+    def _vector_columns(amount: float, monthly_rate: float, term_months: int):
+        
+        # debito residuo in forma chiusa: B_k = P·(1+r)^k − A·((1+r)^k − 1)/r, senza cicli Python
+        if monthly_rate == 0:
+            payment = amount / term_months
+            principal = np.full(term_months, payment)
+            balance = amount - payment * np.arange(1, term_months + 1)
+            interest = np.zeros(term_months)
+        else:
+            growth = (1.0 + monthly_rate) ** np.arange(1, term_months + 1)
+            payment = amount * monthly_rate / (1.0 - 1.0 / growth[-1])
+            balance = amount * growth - payment * (growth - 1.0) / monthly_rate
+            interest = np.empty(term_months)
+            interest[0] = amount * monthly_rate
+            np.multiply(balance[:-1], monthly_rate, out=interest[1:])
+            principal = payment - interest
+        np.maximum(balance, 0.0, out=balance)
+        balance[-1] = 0.0
+        return payment, (np.full(term_months, payment), interest, principal, balance)
+    
+    @staticmethod
+    def _exact_columns(amount: Decimal, annual_rate: Decimal, term_months: int, payment: Decimal):
+        
+        # aritmetica a virgola fissa in centesimi interi: interessi arrotondati al centesimo (metà per eccesso)
+        # e ultima rata che chiude il debito residuo
+        numerator, denominator = Decimal(annual_rate).as_integer_ratio()
+        denominator *= 1200
+        balance = int((Decimal(amount) * CENTS).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        payment_cents = int(payment * CENTS)
+        payments, interest, principal, balances = [], [], [], []
+        for period in range(term_months):
+            period_interest = (2 * balance * numerator + denominator) // (2 * denominator)
+            period_payment = payment_cents
+            if period == term_months - 1 or period_payment - period_interest >= balance:
+                period_payment = balance + period_interest
+            balance -= period_payment - period_interest
+            payments.append(period_payment)
+            interest.append(period_interest)
+            principal.append(period_payment - period_interest)
+            balances.append(balance)
+            if balance == 0:
+                break
+        # periodi residui dopo un'estinzione anticipata per arrotondamento: rate nulle
+        padding = [0] * (term_months - len(payments))
+        return tuple(np.array(column + padding, dtype=np.int64) for column in (payments, interest, principal, balances))
+    
+    def quote_grid(self, amounts: List[Decimal], rates: List[Decimal], terms: List[int]) -> QuoteGrid:
+        
+        if not amounts or not rates or not terms:
+            raise ValueError("Amounts, rates and terms must not be empty")
+        if len(amounts) * len(rates) * len(terms) > self.MAX_GRID_CELLS:
+            raise ValueError(f"Quote grid cannot exceed {self.MAX_GRID_CELLS} cells")
+        # infiniti e NaN prima dei confronti: NaN solleverebbe InvalidOperation, Infinity passerebbe
+        if any(not Decimal(value).is_finite() for value in (*amounts, *rates)):
+            raise ValueError("Loan amount and interest rate must be finite numbers")
+        if any(amount <= 0 for amount in amounts):
+            raise ValueError("Loan amount must be positive")
+        if any(rate < 0 for rate in rates):
+            raise ValueError("Interest rate cannot be negative")
+        if any(not 1 <= term <= self.MAX_TERM_MONTHS for term in terms):
+            raise ValueError(f"Term months must be between 1 and {self.MAX_TERM_MONTHS}")
+        key = (
+            'grid',
+            tuple(Decimal(amount) for amount in amounts),
+            tuple(Decimal(rate) for rate in rates),
+            tuple(int(term) for term in terms)
+        )
+        return self.cache.get_or_compute(key, lambda: self._build_grid(*key[1:]),
+                                         3 * len(amounts) * len(rates) * len(terms))
+    
+    def _build_grid(self, amounts: Tuple[Decimal, ...], rates: Tuple[Decimal, ...], terms: Tuple[int, ...]) -> QuoteGrid:
+        
+        # fattore di annualità su (tassi, durate) per broadcasting, poi scalato per ogni importo
+        monthly_rate = np.array([float(rate) for rate in rates])[:, None] / 1200
+        term = np.array(terms, dtype=np.float64)[None, :]
+        annuity = np.divide(monthly_rate, -np.expm1(-term * np.log1p(monthly_rate)),
+                            out=np.broadcast_to(1.0 / term, (len(rates), len(terms))).copy(),
+                            where=monthly_rate > 0)
+        principal = np.array([float(amount) for amount in amounts])[:, None, None]
+        # arrotondamento al centesimo per eccesso a metà, come la rata contrattuale
+        payment_cents = principal * annuity * 100
+        monthly_payment = np.floor(payment_cents + 0.5) / 100
+        # celle a ridosso del mezzo centesimo: l'errore binario può cambiare l'arrotondamento, si usa la rata esatta
+        for index in zip(*np.nonzero(np.abs(payment_cents % 1 - 0.5) < 1e-6)):
+            amount, rate, term_months = amounts[index[0]], rates[index[1]], terms[index[2]]
+            monthly_payment[index] = float(self.monthly_payment(amount, rate, term_months))
+        total_payment = np.floor(payment_cents * term + 0.5) / 100
+        total_interest = np.floor((total_payment - principal) * 100 + 0.5) / 100
+        for array in (monthly_payment, total_payment, total_interest):
+            array.setflags(write=False)
+        return QuoteGrid(amounts, rates, terms, monthly_payment, total_payment, total_interest)
+    
+    @staticmethod
+    def annuity_payment(balance: np.ndarray, annual_rate: np.ndarray, term_months: np.ndarray) -> np.ndarray:
+        
+        # rata costante per molti debiti insieme: fattore di annualità con expm1/log1p, 1/n a tasso nullo
+        monthly_rate = np.asarray(annual_rate, dtype=np.float64) / 1200
+        term = np.asarray(term_months, dtype=np.float64)
+        annuity = np.divide(monthly_rate, -np.expm1(-term * np.log1p(monthly_rate)),
+                            out=np.divide(1.0, term, out=np.zeros_like(term * monthly_rate), where=term > 0),
+                            where=(monthly_rate > 0) & (term > 0))
+        return np.asarray(balance, dtype=np.float64) * annuity
+    
+    @staticmethod
+    def payoff(balance: np.ndarray, annual_rate: np.ndarray, payment: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        
+        # mesi all'estinzione e totale pagato con rata costante, in forma chiusa per molti scenari insieme:
+        # n = ⌈−log(1 − r·B/A) / log(1 + r)⌉, ultima rata pari al residuo B_{n−1} più gli interessi del mese
+        balance = np.asarray(balance, dtype=np.float64)
+        monthly_rate = np.asarray(annual_rate, dtype=np.float64) / 1200
+        payment = np.asarray(payment, dtype=np.float64)
+        if np.any((balance > 0) & (payment <= balance * monthly_rate)):
+            raise ValueError("Monthly payment must exceed the monthly interest")
+        positive = monthly_rate > 0
+        safe_rate = np.where(positive, monthly_rate, 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            periods = np.where(positive, -np.log1p(-safe_rate * balance / payment) / np.log1p(safe_rate),
+                               balance / payment)
+        # tolleranza sugli arrotondamenti: un residuo di frazioni di centesimo non vale una rata in più
+        months = np.where(balance > 0, np.ceil(periods - 1e-9), 0.0)
+        growth = (1.0 + monthly_rate) ** np.maximum(months - 1, 0)
+        before_last = np.where(positive, balance * growth - payment * (growth - 1.0) / safe_rate,
+                               balance - payment * np.maximum(months - 1, 0))
+        total = np.where(months > 0, payment * (months - 1) + before_last * (1.0 + monthly_rate), 0.0)
+        return months.astype(np.int64), total
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        
+        stats = self.cache.get_stats()
+        return {
+            "payment_hits": stats["hits"].get('payment', 0),
+            "payment_misses": stats["misses"].get('payment', 0),
+            "schedule_hits": stats["hits"].get('schedule', 0),
+            "schedule_misses": stats["misses"].get('schedule', 0),
+            "schedules_cached": stats["entries"].get('schedule', 0),
+            "grid_hits": stats["hits"].get('grid', 0),
+            "grid_misses": stats["misses"].get('grid', 0),
+            "entries": sum(stats["entries"].values()),
+            "cells": stats["cells"],
+            "max_cells": stats["max_cells"],
+            "evictions": stats["evictions"]
+        }
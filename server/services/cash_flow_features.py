@@ -0,0 +1,284 @@
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.account import Account
+from models.transaction import Transaction
+from repositories.account_repository import AccountRepository
+from repositories.transaction_repository import TransactionRepository
+
+
+CENTS = 100
+WINDOWS = (30, 90, 365)
+
+DebitKey = Tuple[str, int]
+
+
+class _DayBucket:
+    """
+    Movimenti di un utente in un giorno: entrate, uscite e uscite per categoria in centesimi.
+    Conserva le chiavi degli addebiti per aggiornare i ricorrenti quando il giorno esce da una finestra.
+    """
+    
+    __slots__ = ('income', 'expenses', 'count', 'categories', 'debits')
+    
+    
+    def __init__(self):
+        self.income = 0
+        self.expenses = 0
+        self.count = 0
+        self.categories: Dict[str, int] = {}
+        self.debits: List[DebitKey] = []
+    
+    def add(self, cents: int, category: str, key: DebitKey, sign: int) -> None:
+        
+        self.count += sign
+        if cents > 0:
+            self.income += sign * cents
+            return
+        self.expenses -= sign * cents
+        self.categories[category] = self.categories.get(category, 0) - sign * cents
+        if sign > 0:
+            self.debits.append(key)
+        else:
+            self.debits.remove(key)
+
+
+class _WindowTotals:
+    """
+    Aggregati di una finestra mobile di giorni, aggiornati per differenza quando i giorni entrano o escono.
+    Un addebito è ricorrente se la stessa descrizione con lo stesso importo compare almeno due volte nella finestra.
+    """
+    
+    __slots__ = ('income', 'expenses', 'transactions', 'categories', 'debit_counts', 'recurring')
+    
+    
+    def __init__(self):
+        self.income = 0
+        self.expenses = 0
+        self.transactions = 0
+        self.categories: Dict[str, int] = {}
+        self.debit_counts: Dict[DebitKey, int] = {}
+        self.recurring = 0
+    
+    def add(self, cents: int, category: str, key: DebitKey, sign: int) -> None:
+        
+        self.transactions += sign
+        if cents > 0:
+            self.income += sign * cents
+            return
+        self.expenses -= sign * cents
+        self._add_category(category, -sign * cents)
+        self._count_debit(key, sign)
+    
+    def apply(self, bucket: _DayBucket, sign: int) -> None:
+        
+        self.income += sign * bucket.income
+        self.expenses += sign * bucket.expenses
+        self.transactions += sign * bucket.count
+        for category, cents in bucket.categories.items():
+            self._add_category(category, sign * cents)
+        for key in bucket.debits:
+            self._count_debit(key, sign)
+    
+    def _add_category(self, category: str, cents: int) -> None:
+        
+        total = self.categories.get(category, 0) + cents
+        if total:
+            self.categories[category] = total
+        else:
+            self.categories.pop(category, None)
+    
+    def _count_debit(self, key: DebitKey, sign: int) -> None:
+        
+        count = self.debit_counts.get(key, 0) + sign
+        # la chiave diventa (o smette di essere) ricorrente passando per due occorrenze
+        if sign > 0 and count == 2:
+            self.recurring += 1
+        elif sign < 0 and count == 1:
+            self.recurring -= 1
+        if count:
+            self.debit_counts[key] = count
+        else:
+            self.debit_counts.pop(key, None)
+
+
+class _UserCashFlow:
+    """
+    Stato dei flussi di cassa di un utente: secchi giornalieri e totali per ciascuna finestra mobile.
+    Il giorno corrente avanza in modo pigro alla prima lettura o scrittura di una nuova giornata.
+    """
+    
+    __slots__ = ('today', 'days', 'windows')
+    
+    
+    def __init__(self, today: int):
+        self.today = today
+        self.days: Dict[int, _DayBucket] = {}
+        self.windows = {window: _WindowTotals() for window in WINDOWS}
+
+
+class CashFlowFeatureStore:
+    """
+    Archivio delle caratteristiche di flusso di cassa per utente su finestre mobili di 30, 90 e 365 giorni.
+    Ogni transazione inserita aggiorna in modo incrementale il secchio del suo giorno e i totali delle finestre.
+    Le letture costano O(1) rispetto allo storico: il solo lavoro è l'avanzamento dei giorni trascorsi.
+    """
+    
+    
+    def __init__(self, account_repository: AccountRepository, transaction_repository: TransactionRepository):
+        self._lock = threading.Lock()
+        self._users: Dict[str, _UserCashFlow] = {}
+        self._account_users: Dict[str, str] = {}
+        self.updates = 0
+        self.ignored = 0
+        for account in account_repository.get_all():
+            self._account_users[account.id] = account.user_id
+        for transaction in transaction_repository.get_all():
+            self._apply(transaction, 1)
+        account_repository.add_listener(self._on_account_event)
+        transaction_repository.add_listener(self._on_transaction_event)
+    
+    def _on_account_event(self, event: str, account: Optional[Account]) -> None:
+        
+        with self._lock:
+            if event == 'created':
+                self._account_users[account.id] = account.user_id
+            elif event == 'cleared':
+                self._account_users.clear()
+    
+    def _on_transaction_event(self, event: str, transaction: Optional[Transaction]) -> None:
+        
+        # le transazioni non cambiano importo o data dopo l'inserimento: contano creazioni e cancellazioni
+        if event == 'created':
+            self._apply(transaction, 1)
+        elif event == 'deleted':
+            self._apply(transaction, -1)
+        elif event == 'cleared':
+            with self._lock:
+                self._users.clear()
+    
+    def _apply(self, transaction: Transaction, sign: int) -> None:
+        
+        today = date.today().toordinal()
+        day = transaction.transaction_date.toordinal()
+        cents = int(transaction.amount * CENTS)
+        with self._lock:
+            user_id = self._account_users.get(transaction.account_id)
+            # fuori da tutte le finestre (o conto sconosciuto): non entrerà mai nelle caratteristiche
+            if user_id is None or day <= today - WINDOWS[-1]:
+                self.ignored += 1
+                return
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = _UserCashFlow(today)
+            self._advance(state, today)
+            
+            bucket = state.days.get(day)
+            if bucket is None:
+                bucket = state.days[day] = _DayBucket()
+            key = (transaction.description, cents)
+            bucket.add(cents, transaction.category, key, sign)
+            # i giorni futuri entrano nelle finestre solo quando il giorno corrente li raggiunge
+            if day <= today:
+                for window, totals in state.windows.items():
+                    if day > today - window:
+                        totals.add(cents, transaction.category, key, sign)
+            self.updates += 1
+    
+    @staticmethod
+    def _advance(state: _UserCashFlow, today: int) -> None:
+        
+        # ogni finestra è (today - window, today]: entrano i giorni raggiunti, escono quelli superati
+        if today <= state.today:
+            return
+        for window, totals in state.windows.items():
+            if today - state.today >= window:
+                totals = state.windows[window] = _WindowTotals()
+                for day, bucket in state.days.items():
+                    if today - window < day <= today:
+                        totals.apply(bucket, 1)
+                continue
+            for day in range(state.today + 1, today + 1):
+                bucket = state.days.get(day)
+                if bucket is not None:
+                    totals.apply(bucket, 1)
+            for day in range(state.today - window + 1, today - window + 1):
+                bucket = state.days.get(day)
+                if bucket is not None:
+                    totals.apply(bucket, -1)
+        # i secchi usciti dalla finestra più lunga non servono più
+        oldest = today - WINDOWS[-1]
+        if today - state.today >= WINDOWS[-1]:
+            state.days = {day: bucket for day, bucket in state.days.items() if day > oldest}
+        else:
+            for day in range(state.today - WINDOWS[-1] + 1, oldest + 1):
+                state.days.pop(day, None)
+        state.today = today
+    
+    def get_features(self, user_id: str) -> Dict[str, Any]:
+        
+        today = date.today()
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._advance(state, today.toordinal())
+            windows = {}
+            for window in WINDOWS:
+                totals = state.windows[window] if state is not None else _WindowTotals()
+                windows[f"{window}d"] = {
+                    "days": window,
+                    "income": Decimal(totals.income) / CENTS,
+                    "expenses": Decimal(totals.expenses) / CENTS,
+                    "net": Decimal(totals.income - totals.expenses) / CENTS,
+                    "transactions": totals.transactions,
+                    "expenses_by_category": {
+                        category: Decimal(cents) / CENTS
+                        for category, cents in sorted(totals.categories.items(), key=lambda item: -item[1])
+                    },
+                    "recurring_debits": totals.recurring
+                }
+        return {"user_id": user_id, "as_of": today.isoformat(), "windows": windows}
+    
+    def get_monthly_expenses(self, user_id: str) -> Decimal:
+        
+        # spesa mensile media sugli ultimi 90 giorni: non dipende dal giorno del mese
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                return Decimal('0.00')
+            self._advance(state, date.today().toordinal())
+            return (Decimal(state.windows[90].expenses) / CENTS / 3).quantize(Decimal('0.01'))
+    
+    def get_monthly_flows(self, user_ids: List[str], window: int = 90,
+                          exclude_category: Optional[str] = None) -> List[Tuple[float, float]]:
+        
+        # (entrate, uscite) mensili medie per molti utenti con un solo lock, per i calcoli vettoriali
+        if window not in WINDOWS:
+            raise ValueError(f"Window must be one of {WINDOWS}")
+        today = date.today().toordinal()
+        months = window / 30
+        flows = []
+        with self._lock:
+            for user_id in user_ids:
+                state = self._users.get(user_id)
+                if state is None:
+                    flows.append((0.0, 0.0))
+                    continue
+                self._advance(state, today)
+                totals = state.windows[window]
+                expenses = totals.expenses - (totals.categories.get(exclude_category, 0) if exclude_category else 0)
+                flows.append((totals.income / CENTS / months, expenses / CENTS / months))
+        return flows
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "accounts": len(self._account_users),
+                "updates": self.updates,
+                "ignored": self.ignored,
+                "day_buckets": sum(len(state.days) for state in self._users.values())
+            }
@@ -0,0 +1,430 @@
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+from models.dashboard import DashboardMetrics
+
+
+@dataclass(frozen=True)
+class AggregationContext:
+    """
+    Parametri condivisi da tutti gli accumulatori durante un'aggregazione.
+    Fissa una sola volta l'istante di riferimento e i confini dei mesi.
+    Garantisce che tutte le metriche usino la stessa finestra temporale.
+    """
+    
+    now: datetime
+    current_month: datetime
+    next_month: datetime
+    previous_month: datetime
+    
+    @classmethod
+    def at(cls, now: Optional[datetime] = None) -> 'AggregationContext':
+        
+        now = now or datetime.now()
+        current_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        next_month = (current_month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        previous_month = (current_month - timedelta(days=1)).replace(day=1)
+        return cls(now, current_month, next_month, previous_month)
+
+
+class DashboardAccumulator(ABC):
+    """
+    Accumulatore base per una metrica o un widget della dashboard.
+    Le sottoclassi ridefiniscono solo gli hook delle entità che le interessano.
+    Il motore invoca ogni hook durante l'unico passaggio sul tipo di entità.
+    """
+    
+    # conti dell'utente non di tipo prestito, valorizzati dal motore dopo il passaggio sui conti
+    spending_account_ids: FrozenSet[str] = frozenset()
+    
+    def __init__(self, context: AggregationContext):
+        self.context = context
+    
+    def add_account(self, account) -> None:
+        pass
+    
+    def add_investment(self, investment) -> None:
+        pass
+    
+    def add_transaction(self, transaction) -> None:
+        pass
+    
+    def add_loan(self, loan) -> None:
+        pass
+    
+    @abstractmethod
+    def apply(self, metrics: DashboardMetrics) -> None:
+        
+        pass
+
+
+class BalanceAccumulator(DashboardAccumulator):
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.total_balance = Decimal('0')
+    
+    def add_account(self, account) -> None:
+        if account.type != 'loan':
+            self.total_balance += account.balance
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        metrics.total_balance = self.total_balance
+
+
+class PortfolioAccumulator(DashboardAccumulator):
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.market_value = Decimal('0')
+        self.cost_basis = Decimal('0')
+    
+    def add_investment(self, investment) -> None:
+        self.market_value += investment.shares * investment.current_price
+        self.cost_basis += investment.shares * investment.purchase_price
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        metrics.total_investments = self.market_value
+        metrics.investments_cost_basis = self.cost_basis
+
+
+class ExpenseAccumulator(DashboardAccumulator):
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.current_expenses = Decimal('0')
+        self.previous_expenses = Decimal('0')
+    
+    def add_transaction(self, transaction) -> None:
+        if transaction.amount >= 0 or transaction.account_id not in self.spending_account_ids:
+            return
+        if self.context.current_month <= transaction.transaction_date < self.context.next_month:
+            self.current_expenses += transaction.amount
+        elif self.context.previous_month <= transaction.transaction_date < self.context.current_month:
+            self.previous_expenses += transaction.amount
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        metrics.monthly_expenses = abs(self.current_expenses)
+        metrics.previous_month_expenses = abs(self.previous_expenses)
+
+
+class LoanExposureAccumulator(DashboardAccumulator):
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.remaining_balance = Decimal('0')
+        self.active_count = 0
+    
+    def add_loan(self, loan) -> None:
+        if loan.status == 'active':
+            self.remaining_balance += loan.remaining_balance
+            self.active_count += 1
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        metrics.active_loan_balance = self.remaining_balance
+        metrics.active_loans_count = self.active_count
+
+
+class SavingsRateAccumulator(DashboardAccumulator):
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.income = Decimal('0')
+        self.expenses = Decimal('0')
+    
+    def add_transaction(self, transaction) -> None:
+        if transaction.account_id not in self.spending_account_ids:
+            return
+        if not (self.context.current_month <= transaction.transaction_date < self.context.next_month):
+            return
+        if transaction.amount > 0:
+            self.income += transaction.amount
+        else:
+            self.expenses -= transaction.amount
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        rate = 0.0 if self.income == 0 else float((self.income - self.expenses) / self.income * 100)
+        metrics.widgets["savingsRate"] = f"{rate:+.1f}%"
+
+
+class AccountBreakdownAccumulator(DashboardAccumulator):
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.accounts: Dict[str, Dict[str, Any]] = {}
+    
+    def add_account(self, account) -> None:
+        self.accounts[account.id] = {
+            "accountId": account.id,
+            "name": account.name,
+            "type": account.type,
+            "balance": account.balance,
+            "monthlyIncome": Decimal('0'),
+            "monthlyExpenses": Decimal('0')
+        }
+    
+    def add_transaction(self, transaction) -> None:
+        entry = self.accounts.get(transaction.account_id)
+        if entry is None:
+            return
+        if not (self.context.current_month <= transaction.transaction_date < self.context.next_month):
+            return
+        if transaction.amount > 0:
+            entry["monthlyIncome"] += transaction.amount
+        else:
+            entry["monthlyExpenses"] -= transaction.amount
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        metrics.widgets["accountBreakdown"] = [
+            {key: float(value) if isinstance(value, Decimal) else value for key, value in entry.items()}
+            for entry in self.accounts.values()
+        ]
+
+
+class TopCategoriesAccumulator(DashboardAccumulator):
+    
+    limit = 5
+    
+    def __init__(self, context: AggregationContext):
+        super().__init__(context)
+        self.by_category: Dict[str, Decimal] = {}
+    
+    def add_transaction(self, transaction) -> None:
+        if transaction.amount >= 0 or transaction.account_id not in self.spending_account_ids:
+            return
+        if not (self.context.current_month <= transaction.transaction_date < self.context.next_month):
+            return
+        self.by_category[transaction.category] = self.by_category.get(transaction.category, Decimal('0')) - transaction.amount
+    
+    def apply(self, metrics: DashboardMetrics) -> None:
+        ranked = sorted(self.by_category.items(), key=lambda item: item[1], reverse=True)[:self.limit]
+        metrics.widgets["topCategories"] = [
+            {"category": category, "amount": float(amount)} for category, amount in ranked
+        ]
+
+
+AccumulatorFactory = Callable[[AggregationContext], DashboardAccumulator]
+
+# il valore del portafoglio viene letto dai totali correnti del repository;
+# PortfolioAccumulator resta disponibile per ricalcolarlo dalle singole posizioni
+CORE_ACCUMULATORS: List[AccumulatorFactory] = [
+    BalanceAccumulator,
+    ExpenseAccumulator,
+    LoanExposureAccumulator
+]
+
+DEFAULT_WIDGET_ACCUMULATORS: List[AccumulatorFactory] = [
+    SavingsRateAccumulator,
+    AccountBreakdownAccumulator,
+    TopCategoriesAccumulator
+]
+
+
+class AccumulatorSet:
+    """
+    Insieme degli accumulatori attivi per un utente in un'aggregazione.
+    Pre-calcola per ogni tipo di entità la lista degli hook effettivamente ridefiniti.
+    Distribuisce ogni entità una sola volta a tutti gli accumulatori interessati.
+    """
+    
+    def __init__(self, user_id: str, context: AggregationContext, factories: List[AccumulatorFactory]):
+        self.user_id = user_id
+        self.accumulators = [factory(context) for factory in factories]
+        self.account_hooks = self._hooks('add_account')
+        self.investment_hooks = self._hooks('add_investment')
+        self.transaction_hooks = self._hooks('add_transaction')
+        self.loan_hooks = self._hooks('add_loan')
+        self._spending_account_ids = set()
+    
+    def _hooks(self, name: str) -> List[Callable[[Any], None]]:
+        
+        base_hook = getattr(DashboardAccumulator, name)
+        return [
+            getattr(accumulator, name) for accumulator in self.accumulators
+            if getattr(type(accumulator), name) is not base_hook
+        ]
+    
+    def add_account(self, account) -> None:
+        
+        if account.type != 'loan':
+            self._spending_account_ids.add(account.id)
+        for hook in self.account_hooks:
+            hook(account)
+    
+    def add_investment(self, investment) -> None:
+        
+        for hook in self.investment_hooks:
+            hook(investment)
+    
+    def add_transaction(self, transaction) -> None:
+        
+        for hook in self.transaction_hooks:
+            hook(transaction)
+    
+    def add_loan(self, loan) -> None:
+        
+        for hook in self.loan_hooks:
+            hook(loan)
+    
+    def close_accounts(self) -> None:
+        
+        spending_account_ids = frozenset(self._spending_account_ids)
+        for accumulator in self.accumulators:
+            accumulator.spending_account_ids = spending_account_ids
+    
+    def build(self, metrics: Optional[DashboardMetrics] = None) -> DashboardMetrics:
+        
+        metrics = metrics or DashboardMetrics(user_id=self.user_id)
+        for accumulator in self.accumulators:
+            accumulator.apply(metrics)
+        return metrics
+
+
+class DashboardAggregationEngine:
+    """
+    Motore di aggregazione delle metriche dashboard in un solo passaggio per entità.
+    Legge conti, investimenti, transazioni e prestiti una volta sola per utente.
+    Nuovi widget si aggiungono come accumulatori senza introdurre scansioni.
+    """
+    
+    def __init__(self,
+                 account_repository,
+                 investment_repository,
+                 loan_repository,
+                 transaction_repository,
+                 accumulators: Optional[List[AccumulatorFactory]] = None):
+        self.account_repository = account_repository
+        self.investment_repository = investment_repository
+        self.loan_repository = loan_repository
+        self.transaction_repository = transaction_repository
+        self.accumulators = list(accumulators if accumulators is not None
+                                 else CORE_ACCUMULATORS + DEFAULT_WIDGET_ACCUMULATORS)
+    
+    def register_accumulator(self, factory: AccumulatorFactory) -> None:
+        
+        self.accumulators.append(factory)
+    
+    def aggregate(self, user_id: str, context: Optional[AggregationContext] = None) -> DashboardMetrics:
+        
+        accumulator_set = AccumulatorSet(user_id, context or AggregationContext.at(), self.accumulators)
+        
+        accounts = self.account_repository.find_by_user_id(user_id)
+        for account in accounts:
+            accumulator_set.add_account(account)
+        accumulator_set.close_accounts()
+        
+        if accumulator_set.investment_hooks:
+            for investment in self.investment_repository.find_by_user_id(user_id):
+                accumulator_set.add_investment(investment)
+        
+        if accumulator_set.transaction_hooks and accounts:
+            for transaction in self.transaction_repository.iter_by_account_ids({acc.id for acc in accounts}):
+                accumulator_set.add_transaction(transaction)
+        
+        for loan in self.loan_repository.find_by_user_id(user_id):
+            accumulator_set.add_loan(loan)
+        
+        metrics = DashboardMetrics(user_id=user_id)
+        metrics.total_investments, metrics.investments_cost_basis, metrics.price_version = \
+            self.investment_repository.get_portfolio_snapshot(user_id)
+        return accumulator_set.build(metrics)
+
+
+class BatchDashboardAggregator:
+    """
+    Aggregatore delle metriche dashboard per molti utenti in un'unica passata.
+    Raggruppa ogni repository una sola volta per user_id su accumulatori compatti.
+    Calcola le metriche principali (saldi, AUM, spese, esposizione prestiti).
+    """
+    
+    # posizioni nel vettore di accumulo per utente
+    BALANCE, MARKET_VALUE, COST_BASIS, CURRENT_EXPENSES, PREVIOUS_EXPENSES, LOAN_BALANCE, LOAN_COUNT = range(7)
+    
+    def __init__(self,
+                 account_repository,
+                 investment_repository,
+                 loan_repository,
+                 transaction_repository):
+        self.account_repository = account_repository
+        self.investment_repository = investment_repository
+        self.loan_repository = loan_repository
+        self.transaction_repository = transaction_repository
+    
+    def aggregate(self,
+                  user_ids: Optional[Iterable[str]] = None,
+                  context: Optional[AggregationContext] = None,
+                  shard: Optional[Tuple[int, int]] = None) -> Iterator[DashboardMetrics]:
+        
+        context = context or AggregationContext.at()
+        selected = set(user_ids) if user_ids is not None else None
+        
+        def accepts(user_id: str) -> bool:
+            if selected is not None and user_id not in selected:
+                return False
+            # shard = (indice, totale): ogni processo del pool riduce solo i propri utenti
+            return shard is None or zlib.crc32(user_id.encode()) % shard[1] == shard[0]
+        
+        totals: Dict[str, List[Any]] = {}
+        
+        def slots(user_id: str) -> List[Any]:
+            row = totals.get(user_id)
+            if row is None:
+                row = [Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0'), 0]
+                totals[user_id] = row
+            return row
+        
+        if selected is not None:
+            for user_id in selected:
+                if accepts(user_id):
+                    slots(user_id)
+        
+        spending_accounts: Dict[str, List[Any]] = {}
+        for account in self.account_repository.get_all():
+            if not accepts(account.user_id):
+                continue
+            row = slots(account.user_id)
+            if account.type != 'loan':
+                row[self.BALANCE] += account.balance
+                spending_accounts[account.id] = row
+        
+        for user_id, market_value, cost_basis in self.investment_repository.iter_portfolio_totals():
+            if not accepts(user_id):
+                continue
+            row = slots(user_id)
+            row[self.MARKET_VALUE] += market_value
+            row[self.COST_BASIS] += cost_basis
+        
+        current_month, next_month, previous_month = context.current_month, context.next_month, context.previous_month
+        for transaction in self.transaction_repository.get_all():
+            if transaction.amount >= 0:
+                continue
+            row = spending_accounts.get(transaction.account_id)
+            if row is None:
+                continue
+            if current_month <= transaction.transaction_date < next_month:
+                row[self.CURRENT_EXPENSES] += transaction.amount
+            elif previous_month <= transaction.transaction_date < current_month:
+                row[self.PREVIOUS_EXPENSES] += transaction.amount
+        
+        for loan in self.loan_repository.get_all():
+            if not accepts(loan.user_id):
+                continue
+            row = slots(loan.user_id)
+            if loan.status == 'active':
+                row[self.LOAN_BALANCE] += loan.remaining_balance
+                row[self.LOAN_COUNT] += 1
+        
+        for user_id, row in totals.items():
+            yield DashboardMetrics(
+                user_id=user_id,
+                total_balance=row[self.BALANCE],
+                total_investments=row[self.MARKET_VALUE],
+                investments_cost_basis=row[self.COST_BASIS],
+                monthly_expenses=abs(row[self.CURRENT_EXPENSES]),
+                previous_month_expenses=abs(row[self.PREVIOUS_EXPENSES]),
+                active_loan_balance=row[self.LOAN_BALANCE],
+                active_loans_count=row[self.LOAN_COUNT]
+            )
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class DashboardSummaryCache:
+    """
+    Cache LRU per-utente dei riepiloghi dashboard con dimensione limitata.
+    Le voci vengono invalidate dagli eventi di scrittura dei repository.
+    Traccia hit, miss, evizioni e invalidazioni per il monitoraggio.
+    """
+    
+    
+    def __init__(self, max_size: int = 10000):
+        if max_size <= 0:
+            raise ValueError("Cache size must be positive")
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], Dict[str, Any]]]" = OrderedDict()
+        # calcoli in corso: un'invalidazione arrivata durante il calcolo ne impedisce il salvataggio
+        self._pending: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get_or_compute(self, user_id: str, compute: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        
+        # le spese mensili dipendono dal mese corrente: la chiave include il periodo
+        period = self._current_period()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == period:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return dict(entry[1])
+            self.misses += 1
+            token = object()
+            self._pending[user_id] = token
+        
+        try:
+            summary = compute(user_id)
+        except Exception:
+            with self._lock:
+                if self._pending.get(user_id) is token:
+                    del self._pending[user_id]
+            raise
+        
+        with self._lock:
+            if self._pending.get(user_id) is token:
+                del self._pending[user_id]
+                self._entries[user_id] = (period, summary)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return dict(summary)
+    
+    def invalidate(self, user_id: Optional[str]) -> None:
+        
+        if not user_id:
+            return
+        with self._lock:
+            self._pending.pop(user_id, None)
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+    
+    def invalidate_all(self) -> None:
+        
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._pending.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+    
+    @staticmethod
+    def _current_period() -> Tuple[int, int]:
+        
+        now = datetime.now()
+        return (now.year, now.month)
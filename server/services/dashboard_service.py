@@ -1,12 +1,31 @@
 
 
-from typing import Dict, Any
-from decimal import Decimal
-from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, Iterable, Iterator, Optional
 from repositories.account_repository import AccountRepository
 from repositories.investment_repository import InvestmentRepository
 from repositories.loan_repository import LoanRepository
 from repositories.transaction_repository import TransactionRepository
+from services.dashboard_cache import DashboardSummaryCache
+from services.dashboard_aggregator import AggregationContext, BatchDashboardAggregator, DashboardAggregationEngine
+
+
+# aggregatore del processo figlio, impostato dall'initializer del pool (ereditato via fork)
+_BATCH_AGGREGATOR: Optional[BatchDashboardAggregator] = None
+
+
+def _init_shard_worker(aggregator: BatchDashboardAggregator) -> None:
+    
+    global _BATCH_AGGREGATOR
+    _BATCH_AGGREGATOR = aggregator
+
+
+def _aggregate_shard(shard, user_ids, context):
+    
+    return [metrics.to_record() for metrics in _BATCH_AGGREGATOR.aggregate(user_ids, context, shard)]
 
 
 class DashboardService:
@@ -21,68 +40,86 @@ class DashboardService:
                  account_repository: AccountRepository,
                  investment_repository: InvestmentRepository,
                  loan_repository: LoanRepository,
-                 transaction_repository: TransactionRepository):
+                 transaction_repository: TransactionRepository,
+                 cache: Optional[DashboardSummaryCache] = None):
         self.account_repository = account_repository
         self.investment_repository = investment_repository
         self.loan_repository = loan_repository
         self.transaction_repository = transaction_repository
-    
-    def get_dashboard_summary(self, user_id: str) -> Dict[str, Any]:
-        
-        
-        total_balance = self.account_repository.get_total_balance_by_user(user_id, exclude_loan_accounts=True)
-        
-        
-        investments = self.investment_repository.find_by_user_id(user_id)
-        total_investments = sum(
-            investment.shares * investment.current_price 
-            for investment in investments
+        self.cache = cache or DashboardSummaryCache()
+        self.aggregation_engine = DashboardAggregationEngine(
+            account_repository,
+            investment_repository,
+            loan_repository,
+            transaction_repository
+        )
+        self.batch_aggregator = BatchDashboardAggregator(
+            account_repository,
+            investment_repository,
+            loan_repository,
+            transaction_repository
         )
         
+        # ogni scrittura invalida il riepilogo dell'utente coinvolto
+        self.account_repository.add_listener(self._on_user_entity_event)
+        self.investment_repository.add_listener(self._on_user_entity_event)
+        self.loan_repository.add_listener(self._on_user_entity_event)
+        self.transaction_repository.add_listener(self._on_transaction_event)
+    
+    def get_dashboard_summary(self, user_id: str) -> Dict[str, Any]:
         
-        investment_growth = self._calculate_investment_growth(investments)
-        
-        
-        accounts = self.account_repository.find_by_user_id(user_id)
-        account_ids = [acc.id for acc in accounts if acc.type != 'loan']
-        
-        
-        monthly_expenses = self.transaction_repository.get_monthly_expenses(account_ids)
-        
-        
-        expense_variation = self._calculate_expense_variation(account_ids)
-        
-        
-        active_loan_balance = self.loan_repository.get_total_remaining_balance(user_id)
-        active_loans_count = len(self.loan_repository.find_active_loans(user_id))
-        
-        return {
-            "totalBalance": float(total_balance),
-            "totalInvestments": float(total_investments),
-            "monthlyExpenses": float(monthly_expenses),
-            "activeLoanBalance": float(active_loan_balance),
-            "investmentGrowth": f"{investment_growth:+.1f}%",
-            "expenseVariation": f"{expense_variation:+.1f}%",
-            "activeLoansCount": active_loans_count
-        }
+        return self.cache.get_or_compute(user_id, self._compute_dashboard_summary)
+    
+    def iter_batch_summaries(self, user_ids: Optional[Iterable[str]] = None,
+                             processes: int = 0) -> Iterator[Dict[str, Any]]:
+        
+        # senza user_ids vengono inclusi tutti gli utenti con almeno un conto, investimento o prestito;
+        # il pool di processi è pensato per i job offline, le richieste HTTP restano in un solo processo
+        max_processes = os.cpu_count() or 1
+        if processes > max_processes:
+            raise ValueError(f"Processes cannot exceed {max_processes}")
+        user_ids = list(user_ids) if user_ids is not None else None
+        context = AggregationContext.at()
+        
+        if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for metrics in self.batch_aggregator.aggregate(user_ids, context):
+                yield metrics.to_record()
+            return
+        
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_shard_worker, initargs=(self.batch_aggregator,)) as executor:
+            futures = [
+                executor.submit(_aggregate_shard, (index, processes), user_ids, context)
+                for index in range(processes)
+            ]
+            for future in as_completed(futures):
+                yield from future.result()
     
-    def _calculate_investment_growth(self, investments) -> float:
+    def iter_batch_summaries_ndjson(self, user_ids: Optional[Iterable[str]] = None,
+                                    processes: int = 0) -> Iterator[str]:
         
-        total_current_value = Decimal('0')
-        total_cost_basis = Decimal('0')
+        for record in self.iter_batch_summaries(user_ids, processes):
+            yield json.dumps(record, separators=(',', ':')) + "\n"
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
         
-        for investment in investments:
-            current_value = investment.shares * investment.current_price
-            cost_basis = investment.shares * investment.purchase_price
-            total_current_value += current_value
-            total_cost_basis += cost_basis
+        return self.cache.get_stats()
+    
+    def _on_user_entity_event(self, event: str, entity) -> None:
         
-        if total_cost_basis == 0:
-            return 0.0
+        if entity is None:
+            self.cache.invalidate_all()
+        else:
+            self.cache.invalidate(entity.user_id)
+    
+    def _on_transaction_event(self, event: str, transaction) -> None:
         
-        growth = ((total_current_value - total_cost_basis) / total_cost_basis) * 100
-        return float(growth)
+        account = self.account_repository.get_by_id(transaction.account_id) if transaction else None
+        if account is None:
+            self.cache.invalidate_all()
+        else:
+            self.cache.invalidate(account.user_id)
     
-    def _calculate_expense_variation(self, account_ids) -> float:
+    def _compute_dashboard_summary(self, user_id: str) -> Dict[str, Any]:
         
-        return self.transaction_repository.get_expense_variation(account_ids)
\ No newline at end of file
+        return self.aggregation_engine.aggregate(user_id).to_summary()
@@ -1,13 +1,18 @@
 
 
-from typing import List, Optional, Dict, Any
+import threading
+from typing import Callable, List, Optional, Dict, Any, Tuple
+from dataclasses import replace
 from decimal import Decimal
 from datetime import datetime
 from uuid import uuid4
-from models.investment import Investment, AvailableAsset
+from models.investment import Investment, AvailableAsset, RealizedGain, TaxLotQueue
+from models.order import InvestmentOrder
+from models.price import PriceSnapshot
 from repositories.investment_repository import InvestmentRepository, AvailableAssetRepository
 from repositories.account_repository import AccountRepository
 from repositories.transaction_repository import TransactionRepository
+from repositories.realized_gain_repository import RealizedGainRepository
 
 
 class InvestmentService:
@@ -17,18 +22,34 @@ class InvestmentService:
     Coordina aggiornamenti di prezzo e notifiche per operazioni.
     """
     
+    MIN_INVESTMENT_AMOUNT = Decimal('500')
+    MAX_INVESTMENT_AMOUNT = Decimal('100000')
     
     def __init__(self,
                  investment_repository: InvestmentRepository,
                  available_asset_repository: AvailableAssetRepository,
                  account_repository: AccountRepository,
                  transaction_repository: TransactionRepository,
-                 notification_service):
+                 realized_gain_repository: RealizedGainRepository,
+                 notification_service,
+                 lot_method: str = 'fifo'):
+        if lot_method not in TaxLotQueue.METHODS:
+            raise ValueError(f"Unknown lot method {lot_method}")
         self.investment_repository = investment_repository
         self.available_asset_repository = available_asset_repository
         self.account_repository = account_repository
         self.transaction_repository = transaction_repository
+        self.realized_gain_repository = realized_gain_repository
         self.notification_service = notification_service
+        self.lot_method = lot_method
+        self._price_listeners: List[Callable[[PriceSnapshot, Dict[str, Decimal]], None]] = []
+        # serializza l'esecuzione degli ordini: saldi e posizioni letti e scritti nello stesso batch
+        self._trade_lock = threading.Lock()
+    
+    def add_price_listener(self, listener: Callable[[PriceSnapshot, Dict[str, Decimal]], None]) -> None:
+        
+        # invocati dopo ogni tick applicato, con lo snapshot pubblicato e le variazioni
+        self._price_listeners.append(listener)
     
     def get_user_portfolio(self, user_id: str) -> List[Investment]:
         
@@ -40,177 +61,405 @@ class InvestmentService:
     
     def buy_investment(self, user_id: str, symbol: str, shares: str, account_id: str) -> Dict[str, Any]:
         
+        return self._execute_single(InvestmentOrder('buy', user_id, symbol, Decimal(shares), account_id))
+    
+    def sell_investment(self, user_id: str, symbol: str, shares: str, account_id: str) -> Dict[str, Any]:
         
-        shares_decimal = Decimal(shares)
-        if shares_decimal <= 0:
-            raise ValueError("Shares must be positive")
-        
-        
-        account = self.account_repository.get_by_id(account_id)
-        if not account or account.user_id != user_id:
-            raise ValueError("Account not found or access denied")
-        
-        
-        available_asset = self.available_asset_repository.find_by_symbol(symbol)
-        if not available_asset:
-            raise ValueError(f"Asset {symbol} not available for trading")
-        
-        
-        total_cost = shares_decimal * available_asset.current_price
-        
-        
-        if account.balance < total_cost:
-            raise ValueError("Insufficient funds")
-        
-        
-        existing_investment = self.investment_repository.find_by_symbol(user_id, symbol)
+        return self._execute_single(InvestmentOrder('sell', user_id, symbol, Decimal(shares), account_id))
+    
+    def _execute_single(self, order: InvestmentOrder) -> Dict[str, Any]:
         
-        if existing_investment:
+        result, error = self.execute_orders([order])[0]
+        if error is not None:
+            raise error
+        return result
+    
+    def execute_orders(self, orders: List[InvestmentOrder],
+                       price_snapshot: Optional[PriceSnapshot] = None) -> List[Tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+        
+        # un solo snapshot prezzi per l'intero batch; gli ordini sono applicati in ordine di arrivo
+        # su uno stato di lavoro, poi conti e posizioni sono scritti una volta per chiave
+        with self._trade_lock:
+            if price_snapshot is None:
+                price_snapshot = self.available_asset_repository.price_snapshot()
+            accounts: Dict[str, Any] = {}
+            cash_flows: Dict[str, Decimal] = {}
+            original_holdings: Dict[Tuple[str, str], Optional[Investment]] = {}
+            holdings: Dict[Tuple[str, str], Optional[Investment]] = {}
+            fills = []
+            outcomes: List[Tuple[Optional[Dict[str, Any]], Optional[Exception]]] = []
             
-            current_value = existing_investment.shares * existing_investment.purchase_price
-            new_total_shares = existing_investment.shares + shares_decimal
-            new_total_value = current_value + total_cost
-            new_average_price = new_total_value / new_total_shares
+            for order in orders:
+                try:
+                    fills.append((order, self._apply_order(order, price_snapshot, accounts, cash_flows,
+                                                           original_holdings, holdings)))
+                    outcomes.append((None, None))
+                except (ValueError, ArithmeticError) as error:
+                    outcomes.append((None, error))
+            self._flush_working_state(original_holdings, holdings, cash_flows)
+        
+        
+        results = iter(fills)
+        for index, (_, error) in enumerate(outcomes):
+            if error is not None:
+                continue
+            order, (amount, investment, realized_gain) = next(results)
+            transaction = self._build_transaction(order, amount, datetime.now(), price_snapshot.version)
+            self.transaction_repository.create(transaction)
+            if realized_gain is not None:
+                realized_gain.transaction_id = transaction.id
+                self.realized_gain_repository.create(realized_gain)
             
-            existing_investment.shares = new_total_shares
-            existing_investment.purchase_price = new_average_price
-            existing_investment.current_price = available_asset.current_price
-            existing_investment.updated_at = datetime.now()
             
-            investment = self.investment_repository.update(existing_investment.id, existing_investment)
-        else:
+            if order.side == 'buy':
+                self.notification_service.create_notification(
+                    user_id=order.user_id,
+                    title="Investimento Acquistato",
+                    message=f"Acquistate {order.shares} azioni di {order.symbol} per €{amount:.2f}",
+                    notification_type="success"
+                )
+                message = f"Successfully purchased {order.shares} shares of {order.symbol}"
+            else:
+                self.notification_service.create_notification(
+                    user_id=order.user_id,
+                    title="Investimento Venduto",
+                    message=f"Vendute {order.shares} azioni di {order.symbol} per €{amount:.2f}",
+                    notification_type="success"
+                )
+                message = f"Successfully sold {order.shares} shares of {order.symbol}"
             
-            investment = Investment(
-                id=str(uuid4()),
-                user_id=user_id,
-                symbol=symbol,
-                name=available_asset.name,
-                shares=shares_decimal,
-                purchase_price=available_asset.current_price,
-                current_price=available_asset.current_price,
-                purchase_date=datetime.now(),
-                updated_at=datetime.now()
-            )
-            investment = self.investment_repository.create(investment)
-        
-        
-        new_balance = account.balance - total_cost
-        self.account_repository.update_balance(account_id, new_balance)
-        
-        
-        from models.transaction import Transaction
-        transaction = Transaction(
-            id=str(uuid4()),
-            account_id=account_id,
-            amount=-total_cost,
-            description=f"Acquisto {shares} azioni {symbol}",
-            category="Investimenti",
-            transaction_date=datetime.now(),
-            created_at=datetime.now(),
-            reference_number=f"INV-{symbol}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        )
-        self.transaction_repository.create(transaction)
-        
-        
+            outcomes[index] = ({
+                "order_id": order.id,
+                "investment": investment,
+                "transaction": transaction,
+                "realized_gain": realized_gain,
+                "price_version": price_snapshot.version,
+                "message": message
+            }, None)
+        return outcomes
+    
+    def execute_basket(self, user_id: str, account_id: str, legs: List[InvestmentOrder]) -> Dict[str, Any]:
+        
+        # tutto o niente: il paniere è validato per intero sullo stesso snapshot prima di toccare lo stato,
+        # con i ricavi delle vendite disponibili per gli acquisti
+        if not legs:
+            raise ValueError("Basket must contain at least one order")
+        with self._trade_lock:
+            price_snapshot = self.available_asset_repository.price_snapshot()
+            account = self.account_repository.get_by_id(account_id)
+            if not account or account.user_id != user_id:
+                raise ValueError("Account not found or access denied")
+            
+            
+            # vendite prima degli acquisti; le posizioni negli errori restano quelle della richiesta
+            numbered = sorted(enumerate(legs, start=1), key=lambda item: item[1].side != 'sell')
+            legs = [leg for _, leg in numbered]
+            cash = account.balance
+            held: Dict[str, Decimal] = {}
+            for position, leg in numbered:
+                if leg.user_id != user_id or leg.account_id != account_id:
+                    raise ValueError(f"Order {position}: basket orders must share user and account")
+                if leg.shares <= 0:
+                    raise ValueError(f"Order {position}: shares must be positive")
+                price = price_snapshot.get(leg.symbol)
+                if price is None or not self.available_asset_repository.find_by_symbol(leg.symbol):
+                    raise ValueError(f"Order {position}: asset {leg.symbol} not available for trading")
+                if leg.side == 'sell':
+                    if leg.symbol not in held:
+                        investment = self.investment_repository.find_by_symbol(user_id, leg.symbol)
+                        held[leg.symbol] = investment.shares if investment else Decimal('0')
+                    if held[leg.symbol] < leg.shares:
+                        raise ValueError(f"Order {position}: insufficient shares of {leg.symbol} to sell")
+                    held[leg.symbol] -= leg.shares
+                    cash += leg.shares * price
+                else:
+                    cash -= leg.shares * price
+            if cash < 0:
+                raise ValueError(f"Insufficient funds for basket: short by €{-cash:.2f}")
+            
+            
+            # validazione superata: l'applicazione sullo stato di lavoro non può più fallire
+            accounts: Dict[str, Any] = {account_id: account}
+            cash_flows: Dict[str, Decimal] = {}
+            original_holdings: Dict[Tuple[str, str], Optional[Investment]] = {}
+            holdings: Dict[Tuple[str, str], Optional[Investment]] = {}
+            fills = [
+                (leg, self._apply_order(leg, price_snapshot, accounts, cash_flows, original_holdings, holdings))
+                for leg in legs
+            ]
+            balances = self._flush_working_state(original_holdings, holdings, cash_flows)
+        
+        
+        now = datetime.now()
+        basket_id = str(uuid4())
+        transactions = [
+            self._build_transaction(leg, amount, now, price_snapshot.version,
+                                    reference=f"BASKET-{basket_id[:8]}-{position}")
+            for position, (leg, (amount, _, _)) in enumerate(fills, start=1)
+        ]
+        self.transaction_repository.create_many(transactions)
+        
+        
+        results = []
+        bought, sold = Decimal('0'), Decimal('0')
+        for (leg, (amount, investment, realized_gain)), transaction in zip(fills, transactions):
+            if realized_gain is not None:
+                realized_gain.transaction_id = transaction.id
+                self.realized_gain_repository.create(realized_gain)
+            if leg.side == 'buy':
+                bought += amount
+            else:
+                sold += amount
+            results.append({
+                "order_id": leg.id,
+                "side": leg.side,
+                "symbol": leg.symbol,
+                "shares": leg.shares,
+                "price": price_snapshot.get(leg.symbol),
+                "amount": amount,
+                "investment": investment,
+                "transaction": transaction,
+                "realized_gain": realized_gain
+            })
         self.notification_service.create_notification(
             user_id=user_id,
-            title="Investimento Acquistato",
-            message=f"Acquistate {shares} azioni di {symbol} per €{total_cost:.2f}",
+            title="Ordine Paniere Eseguito",
+            message=f"Eseguite {len(fills)} operazioni: acquisti €{bought:.2f}, vendite €{sold:.2f}",
             notification_type="success"
         )
-        
         return {
-            "investment": investment,
-            "transaction": transaction,
-            "message": f"Successfully purchased {shares} shares of {symbol}"
+            "basket_id": basket_id,
+            "orders": results,
+            "total_bought": bought,
+            "total_sold": sold,
+            "net_cash_flow": sold - bought,
+            "balance": balances[account_id],
+            "price_version": price_snapshot.version,
+            "message": f"Successfully executed basket of {len(fills)} orders"
         }
     
-    def sell_investment(self, user_id: str, symbol: str, shares: str, account_id: str) -> Dict[str, Any]:
+    def _flush_working_state(self, original_holdings: Dict[Tuple[str, str], Optional[Investment]],
+                             holdings: Dict[Tuple[str, str], Optional[Investment]],
+                             cash_flows: Dict[str, Decimal]) -> Dict[str, Decimal]:
+        
+        for key, investment in holdings.items():
+            original = original_holdings[key]
+            if original is not None and (investment is None or investment.id != original.id):
+                self.investment_repository.delete(original.id)
+            if investment is not None and (original is None or investment.id != original.id):
+                self.investment_repository.create(investment)
+            elif investment is not None:
+                self.investment_repository.update(investment.id, investment)
+        # il contante netto del batch è applicato come variazione: rate, bonifici ed erogazioni
+        # arrivati dopo la lettura dei saldi non vengono sovrascritti
+        balances = {}
+        for account_id, cash_flow in cash_flows.items():
+            balances[account_id] = self.account_repository.adjust_balance(account_id, cash_flow).balance
+        return balances
+    
+    def _build_transaction(self, order: InvestmentOrder, amount: Decimal, now: datetime, price_version: int,
+                           reference: Optional[str] = None):
         
+        from models.transaction import Transaction
+        if order.side == 'buy':
+            description = f"Acquisto {order.shares} azioni {order.symbol}"
+            reference = reference or f"INV-{order.symbol}-{now.strftime('%Y%m%d%H%M%S')}"
+        else:
+            description = f"Vendita {order.shares} azioni {order.symbol}"
+            reference = reference or f"SELL-{order.symbol}-{now.strftime('%Y%m%d%H%M%S')}"
+        return Transaction(
+            id=str(uuid4()),
+            account_id=order.account_id,
+            amount=-amount if order.side == 'buy' else amount,
+            description=description,
+            category="Investimenti",
+            transaction_date=now,
+            created_at=now,
+            reference_number=reference,
+            price_version=price_version
+        )
+    
+    def _apply_order(self, order: InvestmentOrder, price_snapshot: PriceSnapshot,
+                     accounts: Dict[str, Any], cash_flows: Dict[str, Decimal],
+                     original_holdings: Dict[Tuple[str, str], Optional[Investment]],
+                     holdings: Dict[Tuple[str, str], Optional[Investment]]) -> Tuple[Decimal, Optional[Investment], Optional[RealizedGain]]:
         
-        shares_decimal = Decimal(shares)
-        if shares_decimal <= 0:
+        # valida e applica un ordine allo stato di lavoro del batch senza toccare i repository
+        if order.shares <= 0:
             raise ValueError("Shares must be positive")
         
         
-        account = self.account_repository.get_by_id(account_id)
-        if not account or account.user_id != user_id:
+        if order.account_id not in accounts:
+            accounts[order.account_id] = self.account_repository.get_by_id(order.account_id)
+        account = accounts[order.account_id]
+        if not account or account.user_id != order.user_id:
             raise ValueError("Account not found or access denied")
+        cash_flow = cash_flows.get(order.account_id, Decimal('0'))
+        balance = account.balance + cash_flow
+        
+        
+        key = (order.user_id, order.symbol)
+        if key not in holdings:
+            # copia di lavoro: la posizione del repository cambia solo nel flush, non con un ordine poi rifiutato
+            original = self.investment_repository.find_by_symbol(order.user_id, order.symbol)
+            original_holdings[key] = original
+            holdings[key] = replace(original, lots=original.lots.copy()) if original else None
+        investment = holdings[key]
+        price = price_snapshot.get(order.symbol)
+        now = datetime.now()
+        
+        if order.side == 'buy':
+            available_asset = self.available_asset_repository.find_by_symbol(order.symbol)
+            if not available_asset or price is None:
+                raise ValueError(f"Asset {order.symbol} not available for trading")
+            
+            total_cost = order.shares * price
+            if balance < total_cost:
+                raise ValueError("Insufficient funds")
+            
+            if investment:
+                # ogni acquisto apre un lotto; il prezzo di carico resta la media dei lotti aperti
+                investment.lots.add(order.shares, price, now)
+                investment.shares = investment.lots.shares
+                investment.purchase_price = investment.lots.average_price
+                investment.current_price = price
+                investment.updated_at = now
+            else:
+                investment = Investment(
+                    id=str(uuid4()),
+                    user_id=order.user_id,
+                    symbol=order.symbol,
+                    name=available_asset.name,
+                    shares=order.shares,
+                    purchase_price=price,
+                    current_price=price,
+                    purchase_date=now,
+                    updated_at=now
+                )
+            holdings[key] = investment
+            cash_flows[order.account_id] = cash_flow - total_cost
+            return total_cost, investment, None
         
         
-        investment = self.investment_repository.find_by_symbol(user_id, symbol)
         if not investment:
-            raise ValueError(f"No investment found for {symbol}")
-        
-        if investment.shares < shares_decimal:
+            raise ValueError(f"No investment found for {order.symbol}")
+        if investment.shares < order.shares:
             raise ValueError("Insufficient shares to sell")
-        
-        
-        available_asset = self.available_asset_repository.find_by_symbol(symbol)
-        if not available_asset:
-            raise ValueError(f"Asset {symbol} not available for trading")
-        
-        
-        sale_proceeds = shares_decimal * available_asset.current_price
-        
-        
-        investment.shares -= shares_decimal
-        investment.current_price = available_asset.current_price
-        investment.updated_at = datetime.now()
-        
-        
+        if price is None:
+            raise ValueError(f"Asset {order.symbol} not available for trading")
+        
+        sale_proceeds = order.shares * price
+        lot_method = order.lot_method or self.lot_method
+        consumed = investment.lots.consume(order.shares, lot_method)
+        acquired = [lot.acquired_at for lot in consumed]
+        realized_gain = RealizedGain(
+            id=str(uuid4()),
+            user_id=order.user_id,
+            symbol=order.symbol,
+            shares=order.shares,
+            proceeds=sale_proceeds,
+            cost_basis=sum((lot.shares * lot.price for lot in consumed), Decimal('0')),
+            lot_method=lot_method,
+            lots_consumed=len(consumed),
+            first_acquired_at=min(acquired),
+            last_acquired_at=max(acquired),
+            sold_at=now
+        )
+        investment.shares = investment.lots.shares
+        investment.current_price = price
+        investment.updated_at = now
         if investment.shares == 0:
-            self.investment_repository.delete(investment.id)
             investment = None
         else:
-            investment = self.investment_repository.update(investment.id, investment)
-        
-        
-        new_balance = account.balance + sale_proceeds
-        self.account_repository.update_balance(account_id, new_balance)
-        
-        
-        from models.transaction import Transaction
-        transaction = Transaction(
-            id=str(uuid4()),
-            account_id=account_id,
-            amount=sale_proceeds,
-            description=f"Vendita {shares} azioni {symbol}",
-            category="Investimenti",
-            transaction_date=datetime.now(),
-            created_at=datetime.now(),
-            reference_number=f"SELL-{symbol}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        )
-        self.transaction_repository.create(transaction)
-        
+            investment.purchase_price = investment.lots.average_price
+        holdings[key] = investment
+        cash_flows[order.account_id] = cash_flow + sale_proceeds
+        return sale_proceeds, investment, realized_gain
+    
+    def get_price_snapshot(self) -> PriceSnapshot:
         
-        self.notification_service.create_notification(
-            user_id=user_id,
-            title="Investimento Venduto",
-            message=f"Vendute {shares} azioni di {symbol} per €{sale_proceeds:.2f}",
-            notification_type="success"
-        )
+        return self.available_asset_repository.price_snapshot()
+    
+    def update_prices(self, price_updates: Dict[str, Decimal]) -> PriceSnapshot:
+        
+        # il nuovo snapshot diventa visibile in un colpo solo, poi si aggiornano le posizioni
+        snapshot = self.available_asset_repository.apply_prices(price_updates)
+        self.investment_repository.apply_prices(price_updates, snapshot.version)
+        for listener in self._price_listeners:
+            listener(snapshot, price_updates)
+        return snapshot
+    
+    def get_portfolio_valuation(self, user_id: str) -> Dict[str, Any]:
         
+        market_value, cost_basis, price_version = self.investment_repository.get_portfolio_snapshot(user_id)
+        profit_loss = market_value - cost_basis
         return {
-            "investment": investment,
-            "transaction": transaction,
-            "message": f"Successfully sold {shares} shares of {symbol}"
+            "market_value": market_value,
+            "cost_basis": cost_basis,
+            "profit_loss": profit_loss,
+            "profit_loss_percentage": float(profit_loss / cost_basis * 100) if cost_basis else 0.0,
+            "price_version": price_version
         }
     
-    def update_prices(self, price_updates: Dict[str, Decimal]):
-        
-        
-        for symbol, new_price in price_updates.items():
-            asset = self.available_asset_repository.find_by_symbol(symbol)
-            if asset:
-                asset.current_price = new_price
-                asset.updated_at = datetime.now()
-                self.available_asset_repository.update(asset.id, asset)
+    def get_profit_and_loss(self, user_id: str, limit: int = 20) -> Dict[str, Any]:
+        
+        # non realizzato dai totali correnti e dalle singole posizioni, realizzato dai totali per simbolo:
+        # il costo non dipende dal numero di lotti aperti
+        market_value, cost_basis, price_version = self.investment_repository.get_portfolio_snapshot(user_id)
+        realized_totals = self.realized_gain_repository.get_realized_totals(user_id)
+        holdings = {}
+        for investment in self.investment_repository.find_by_user_id(user_id):
+            holdings[investment.symbol] = {
+                "symbol": investment.symbol,
+                "shares": investment.shares,
+                "cost_basis": investment.shares * investment.purchase_price,
+                "market_value": investment.current_value,
+                "unrealized_profit_loss": investment.profit_loss,
+                "realized_profit_loss": realized_totals.get(investment.symbol, Decimal('0')),
+                "open_lots": len(investment.lots)
+            }
+        for symbol, realized in realized_totals.items():
+            if symbol not in holdings:
+                holdings[symbol] = {
+                    "symbol": symbol,
+                    "shares": Decimal('0'),
+                    "cost_basis": Decimal('0'),
+                    "market_value": Decimal('0'),
+                    "unrealized_profit_loss": Decimal('0'),
+                    "realized_profit_loss": realized,
+                    "open_lots": 0
+                }
+        realized = sum(realized_totals.values(), Decimal('0'))
+        unrealized = market_value - cost_basis
+        return {
+            "realized_profit_loss": realized,
+            "unrealized_profit_loss": unrealized,
+            "total_profit_loss": realized + unrealized,
+            "price_version": price_version,
+            "lot_method": self.lot_method,
+            "holdings": sorted(holdings.values(), key=lambda row: row["symbol"]),
+            "recent_sales": self.realized_gain_repository.find_by_user_id(user_id, limit=limit)
+        }
+    
+    def get_open_lots(self, user_id: str, symbol: str) -> List[Dict[str, Any]]:
         
+        investment = self.investment_repository.find_by_symbol(user_id, symbol)
+        if not investment:
+            return []
+        return [
+            {
+                "shares": lot.shares,
+                "price": lot.price,
+                "acquired_at": lot.acquired_at,
+                "unrealized_profit_loss": lot.shares * (investment.current_price - lot.price)
+            }
+            for lot in investment.lots
+        ]
+    
+    def reconcile_portfolio_totals(self) -> Dict[str, Any]:
         
-        for investment in self.investment_repository.get_all():
-            if investment.symbol in price_updates:
-                self.investment_repository.update_current_price(
-                    investment.id, 
-                    price_updates[investment.symbol]
-                )
\ No newline at end of file
+        mismatches = self.investment_repository.reconcile_totals()
+        return {
+            "consistent": not mismatches,
+            "mismatches": mismatches
+        }
@@ -0,0 +1,309 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    due REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'ready',
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (queue, status, due);
+"""
+
+
+class DurableJobQueue:
+    """
+    Coda di lavori persistente su SQLite con scadenze, lease di visibilità e tentativi con backoff.
+    Gli inserimenti si accodano a un thread di scrittura che li conferma con un solo commit per gruppo.
+    I lavori presi da un processo terminato tornano visibili alla scadenza del lease e vengono ripresi.
+    """
+    
+    
+    def __init__(self, path: str, handler: Callable[[Any], None], queue_name: str = "default",
+                 workers: int = 4, max_pending: int = 10000, batch_size: int = 64,
+                 visibility_timeout: float = 30.0, max_attempts: int = 5, retry_backoff: float = 1.0,
+                 max_backoff: float = 300.0, poll_interval: float = 1.0,
+                 on_dead: Optional[Callable[[Any, str], None]] = None):
+        if workers <= 0:
+            raise ValueError("Worker count must be positive")
+        if max_pending <= 0:
+            raise ValueError("Max pending jobs must be positive")
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        if max_attempts <= 0:
+            raise ValueError("Max attempts must be positive")
+        self.path = path
+        self.handler = handler
+        self.on_dead = on_dead
+        self.queue_name = queue_name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        # una connessione per processo, serializzata dal lock; WAL per letture concorrenti tra processi
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        # stesso lock, due attese distinte: il thread di scrittura non sveglia i worker a ogni inserimento
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._flush = threading.Condition(self._lock)
+        self._buffer: List[Tuple[str, float, Future]] = []
+        self._writer: Optional[threading.Thread] = None
+        self._threads: List[threading.Thread] = []
+        self._stopped = False
+        self._next_due = float('inf')
+        self.pending = self._db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = 'ready'", (queue_name,)
+        ).fetchone()[0]
+        self.enqueued = 0
+        self.rejected = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        self.commits = 0
+        self.largest_group = 0
+        self.total_commit_time = 0.0
+        self.batches = 0
+    
+    def enqueue(self, payload: Any, delay: float = 0.0, timeout: Optional[float] = 10.0) -> bool:
+        
+        # ritorna dopo il commit del gruppo che contiene il lavoro; False oltre il limite di ammissione
+        data = json.dumps(payload)
+        future: Future = Future()
+        with self._condition:
+            if self._stopped or self.pending + len(self._buffer) >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._ensure_threads()
+            entry = (data, time.time() + max(0.0, delay), future)
+            self._buffer.append(entry)
+            self._flush.notify()
+        try:
+            future.result(timeout)
+        except TimeoutError:
+            with self._condition:
+                # ancora in attesa del thread di scrittura: ritirato, il lavoro non sarà mai persistito
+                if any(buffered is entry for buffered in self._buffer):
+                    self._buffer = [buffered for buffered in self._buffer if buffered is not entry]
+                    self.rejected += 1
+                    return False
+            # già nel commit in corso: si attende l'esito invece di lasciarlo indeterminato
+            future.result()
+        return True
+    
+    def start(self) -> None:
+        
+        # avvio esplicito per riprendere i lavori persistiti senza attendere un nuovo inserimento
+        with self._condition:
+            if not self._stopped:
+                self._ensure_threads()
+    
+    def stop(self, timeout: Optional[float] = None) -> None:
+        
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            self._flush.notify_all()
+        for thread in self._threads + ([self._writer] if self._writer else []):
+            thread.join(timeout)
+    
+    def _ensure_threads(self) -> None:
+        
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name=f"{self.queue_name}-writer", daemon=True)
+            self._writer.start()
+        alive = [thread for thread in self._threads if thread.is_alive()]
+        while len(alive) < self.workers:
+            thread = threading.Thread(target=self._work_loop, name=f"{self.queue_name}-{len(alive)}", daemon=True)
+            thread.start()
+            alive.append(thread)
+        self._threads = alive
+    
+    def _write_loop(self) -> None:
+        
+        while True:
+            with self._condition:
+                while not self._buffer and not self._stopped:
+                    self._flush.wait()
+                if not self._buffer:
+                    return
+                # commit di gruppo: tutto ciò che è arrivato durante il commit precedente va nel prossimo
+                group, self._buffer = self._buffer, []
+            
+            started = time.perf_counter()
+            now = time.time()
+            try:
+                with self._db_lock:
+                    self._db.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._db.executemany(
+                            "INSERT INTO jobs (queue, payload, due, created_at) VALUES (?, ?, ?, ?)",
+                            [(self.queue_name, data, due, now) for data, due, _ in group]
+                        )
+                        self._db.execute("COMMIT")
+                    except Exception:
+                        self._db.execute("ROLLBACK")
+                        raise
+            except Exception as error:
+                for _, _, future in group:
+                    future.set_exception(error)
+                continue
+            
+            earliest = min(due for _, due, _ in group)
+            with self._condition:
+                self.pending += len(group)
+                self.enqueued += len(group)
+                self.commits += 1
+                self.largest_group = max(self.largest_group, len(group))
+                self.total_commit_time += time.perf_counter() - started
+                # i worker si svegliano solo se la nuova scadenza anticipa l'attesa in corso
+                if earliest < self._next_due:
+                    self._next_due = earliest
+                    self._condition.notify_all()
+            for _, _, future in group:
+                future.set_result(True)
+    
+    def _claim(self) -> Tuple[float, List[Tuple[int, str, int]]]:
+        
+        now = time.time()
+        lease = now + self.visibility_timeout
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "UPDATE jobs SET lease_until = ?, attempts = attempts + 1 WHERE id IN ("
+                    "SELECT id FROM jobs WHERE queue = ? AND status = 'ready' AND due <= ? AND lease_until <= ? "
+                    "ORDER BY due, id LIMIT ?) RETURNING id, payload, attempts",
+                    (lease, self.queue_name, now, now, self.batch_size)
+                ).fetchall()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            if not rows:
+                # prossimo lavoro visibile: scadenza o fine del lease, la più tarda delle due
+                next_due = self._db.execute(
+                    "SELECT MIN(MAX(due, lease_until)) FROM jobs WHERE queue = ? AND status = 'ready'",
+                    (self.queue_name,)
+                ).fetchone()[0]
+                with self._condition:
+                    self._next_due = next_due if next_due is not None else float('inf')
+        return lease, rows
+    
+    def _work_loop(self) -> None:
+        
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+            try:
+                lease, rows = self._claim()
+                if rows:
+                    self._process(lease, rows)
+                    continue
+                wait = None
+            except sqlite3.Error as error:
+                print(f"Error processing {self.queue_name} jobs: {error}")
+                wait = self.poll_interval
+            with self._condition:
+                if self._stopped:
+                    return
+                # il limite di attesa copre i lease scaduti di altri processi
+                if wait is None:
+                    wait = max(0.0, min(self._next_due - time.time(), self.poll_interval))
+                self._condition.wait(wait)
+    
+    def _process(self, lease: float, rows: List[Tuple[int, str, int]]) -> None:
+        
+        done: List[int] = []
+        failed: List[Tuple[int, str, int, str]] = []
+        for job_id, data, attempts in rows:
+            try:
+                self.handler(json.loads(data))
+                done.append(job_id)
+            except Exception as error:
+                failed.append((job_id, data, attempts, str(error)))
+        
+        now = time.time()
+        retries = [(job_id, error, attempts) for job_id, _, attempts, error in failed if attempts < self.max_attempts]
+        dead = [(job_id, data, error) for job_id, data, attempts, error in failed if attempts >= self.max_attempts]
+        # conferme e nuovi tentativi in un solo commit; il lease fa da token contro i lavori ripresi da altri
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("DELETE FROM jobs WHERE id = ? AND lease_until = ?",
+                                     [(job_id, lease) for job_id in done])
+                self._db.executemany(
+                    "UPDATE jobs SET due = ?, lease_until = 0, last_error = ? WHERE id = ? AND lease_until = ?",
+                    [(now + min(self.max_backoff, self.retry_backoff * 2 ** (attempts - 1)), error, job_id, lease)
+                     for job_id, error, attempts in retries]
+                )
+                self._db.executemany("UPDATE jobs SET status = 'dead', last_error = ? WHERE id = ? AND lease_until = ?",
+                                     [(error, job_id, lease) for job_id, _, error in dead])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        
+        with self._condition:
+            self.batches += 1
+            self.completed += len(done)
+            self.retried += len(retries)
+            self.dead += len(dead)
+            self.pending -= len(done) + len(dead)
+            if retries:
+                self._next_due = min(self._next_due, now + self.retry_backoff)
+        for _, data, error in dead:
+            if self.on_dead is not None:
+                try:
+                    self.on_dead(json.loads(data), error)
+                except Exception as callback_error:
+                    print(f"Error in {self.queue_name} dead-letter handler: {callback_error}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._db_lock:
+            counts = dict(self._db.execute(
+                "SELECT CASE WHEN status = 'dead' THEN 'dead' WHEN lease_until > ? THEN 'leased' ELSE 'queued' END, "
+                "COUNT(*) FROM jobs WHERE queue = ? GROUP BY 1",
+                (time.time(), self.queue_name)
+            ).fetchall())
+        with self._condition:
+            return {
+                "path": self.path,
+                "workers": self.workers,
+                "threads_alive": sum(thread.is_alive() for thread in self._threads),
+                "queued": counts.get('queued', 0),
+                "leased": counts.get('leased', 0),
+                "dead_letters": counts.get('dead', 0),
+                "max_pending": self.max_pending,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "retried": self.retried,
+                "dead": self.dead,
+                "batches": self.batches,
+                "commits": self.commits,
+                "average_group": (self.enqueued / self.commits) if self.commits else 0.0,
+                "largest_group": self.largest_group,
+                "avg_commit_ms": round(self.total_commit_time / self.commits * 1000, 3) if self.commits else 0.0,
+                "next_due_in_ms": None if self._next_due == float('inf') else round(max(0.0, self._next_due - time.time()) * 1000, 3)
+            }
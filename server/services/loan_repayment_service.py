@@ -0,0 +1,258 @@
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from models.loan import Loan
+from models.transaction import Transaction
+from repositories.account_repository import AccountRepository
+from repositories.loan_repository import LoanRepository
+from repositories.transaction_repository import TransactionRepository
+from services.notification_service import NotificationService
+from utils.dates import add_months
+
+
+CENTS = 100
+
+
+def due_period(loan: Loan, as_of: datetime) -> int:
+    
+    # rate scadute alla data: la rata k scade k mesi dopo l'erogazione
+    months = (as_of.year - loan.created_at.year) * 12 + as_of.month - loan.created_at.month
+    if months > 0 and add_months(loan.created_at, months) > as_of:
+        months -= 1
+    return max(0, min(months, loan.term_months))
+
+
+class LoanRepaymentService:
+    """
+    Servizio di addebito periodico delle rate dei prestiti attivi sul conto corrente dell'utente.
+    Elabora i prestiti a blocchi di utenti, con lock per utente e in centesimi interi come il piano contrattuale.
+    Ogni rata è addebitata una sola volta per periodo; le rate arretrate sono recuperate in ordine.
+    """
+    
+    
+    def __init__(self, loan_repository: LoanRepository, account_repository: AccountRepository,
+                 transaction_repository: TransactionRepository, notification_service: NotificationService,
+                 batch_size: int = 1000):
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        self.loan_repository = loan_repository
+        self.account_repository = account_repository
+        self.transaction_repository = transaction_repository
+        self.notification_service = notification_service
+        self.batch_size = batch_size
+        self._run_lock = threading.Lock()
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._user_locks_guard = threading.Lock()
+        self._rate_ratios: Dict[Decimal, Tuple[int, int]] = {}
+        # ultimo periodo scaduto già segnalato come non addebitato, per prestito
+        self._notified_periods: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.installments = 0
+        self.collected = Decimal('0.00')
+        self.paid_off = 0
+        self.failed = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+    
+    def start(self, interval: float) -> None:
+        
+        # esecuzione a orologio: le rate già addebitate vengono saltate, quindi la frequenza non conta
+        if interval <= 0:
+            raise ValueError("Repayment interval must be positive")
+        self._thread = threading.Thread(target=self._run_periodically, args=(interval,),
+                                        name="loan-repayments", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None) -> None:
+        
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _run_periodically(self, interval: float) -> None:
+        
+        while not self._stop.is_set():
+            try:
+                self.run_repayments()
+            except Exception as error:
+                print(f"Error processing loan repayments: {error}")
+            self._stop.wait(interval)
+    
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        
+        with self._user_locks_guard:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.Lock()
+            return lock
+    
+    def _rate_ratio(self, annual_rate: Decimal) -> Tuple[int, int]:
+        
+        # tasso mensile come frazione esatta, come nel piano contrattuale del motore di ammortamento
+        ratio = self._rate_ratios.get(annual_rate)
+        if ratio is None:
+            numerator, denominator = Decimal(annual_rate).as_integer_ratio()
+            ratio = self._rate_ratios[annual_rate] = (numerator, denominator * 1200)
+        return ratio
+    
+    def run_repayments(self, as_of: Optional[datetime] = None) -> Dict[str, Any]:
+        
+        if not self._run_lock.acquire(blocking=False):
+            raise ValueError("Repayment run already in progress")
+        try:
+            return self._run(as_of or datetime.now())
+        finally:
+            self._run_lock.release()
+    
+    def _run(self, as_of: datetime) -> Dict[str, Any]:
+        
+        started = time.perf_counter()
+        due_by_user = {}
+        for user_id, loans in self.loan_repository.group_active_by_user().items():
+            due = [loan for loan in loans if due_period(loan, as_of) > loan.last_paid_period]
+            if due:
+                due_by_user[user_id] = sorted(due, key=lambda loan: loan.created_at)
+        
+        user_ids = set(due_by_user)
+        checking_accounts = self.account_repository.find_first_by_type(user_ids, 'checking')
+        loan_accounts = self.account_repository.find_first_by_type(user_ids, 'loan')
+        totals = {"loans": 0, "installments": 0, "collected": 0, "interest": 0, "principal": 0,
+                  "paid_off": 0, "failed": 0}
+        
+        users = list(due_by_user)
+        for start in range(0, len(users), self.batch_size):
+            transactions: List[Transaction] = []
+            for user_id in users[start:start + self.batch_size]:
+                with self._user_lock(user_id):
+                    self._settle_user(user_id, due_by_user[user_id], checking_accounts.get(user_id),
+                                      loan_accounts.get(user_id), as_of, transactions, totals)
+            # una sola scrittura in blocco per gruppo di utenti
+            self.transaction_repository.create_many(transactions)
+        
+        elapsed = time.perf_counter() - started
+        result = {
+            "as_of": as_of,
+            "users": len(users),
+            "loans_due": totals["loans"],
+            "installments": totals["installments"],
+            "collected": Decimal(totals["collected"]) / CENTS,
+            "interest": Decimal(totals["interest"]) / CENTS,
+            "principal": Decimal(totals["principal"]) / CENTS,
+            "paid_off": totals["paid_off"],
+            "failed": totals["failed"],
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "loans_per_second": round(totals["loans"] / elapsed, 1) if elapsed > 0 else 0.0
+        }
+        self.runs += 1
+        self.installments += totals["installments"]
+        self.collected += result["collected"]
+        self.paid_off += totals["paid_off"]
+        self.failed += totals["failed"]
+        self.last_run = result
+        return result
+    
+    def _settle_user(self, user_id: str, loans: List[Loan], checking_account, loan_account,
+                     as_of: datetime, transactions: List[Transaction], totals: Dict[str, int]) -> None:
+        
+        totals["loans"] += len(loans)
+        if checking_account is None:
+            totals["failed"] += len(loans)
+            if self._first_miss(loans, as_of):
+                self.notification_service.create_notification(
+                    user_id=user_id,
+                    title="Rata Non Addebitata",
+                    message="Nessun conto corrente disponibile per l'addebito delle rate dei prestiti",
+                    notification_type="warning"
+                )
+            return
+        
+        collected = repaid = 0
+        now = datetime.now()
+        for loan in loans:
+            numerator, denominator = self._rate_ratio(loan.interest_rate)
+            balance = int(loan.remaining_balance * CENTS)
+            installment = int(loan.monthly_payment * CENTS)
+            period = loan.last_paid_period
+            target = due_period(loan, as_of)
+            
+            while period < target and balance > 0:
+                interest = (2 * balance * numerator + denominator) // (2 * denominator)
+                payment = installment
+                # l'ultima rata chiude il debito residuo, come nel piano in centesimi
+                if period + 1 == loan.term_months or payment - interest >= balance:
+                    payment = balance + interest
+                # saldo verificato e addebitato insieme: un movimento concorrente non porta il conto in rosso
+                if self.account_repository.withdraw(checking_account.id, Decimal(payment) / CENTS) is None:
+                    break
+                period += 1
+                balance -= payment - interest
+                collected += payment
+                repaid += payment - interest
+                totals["installments"] += 1
+                totals["interest"] += interest
+                totals["principal"] += payment - interest
+                transactions.append(Transaction(
+                    id=str(uuid4()),
+                    account_id=checking_account.id,
+                    amount=-Decimal(payment) / CENTS,
+                    description=f"Rata {period}/{loan.term_months} prestito {loan.type}",
+                    category="Prestiti",
+                    transaction_date=add_months(loan.created_at, period),
+                    created_at=now,
+                    reference_number=f"RATA-{loan.id[:8]}-{period}"
+                ))
+            
+            if period == loan.last_paid_period:
+                totals["failed"] += 1
+                if self._first_miss([loan], as_of):
+                    self.notification_service.create_notification(
+                        user_id=user_id,
+                        title="Rata Non Addebitata",
+                        message=f"Saldo insufficiente per la rata del prestito {loan.type} di €{loan.monthly_payment:,.2f}",
+                        notification_type="warning"
+                    )
+                continue
+            loan.last_paid_period = period
+            self._notified_periods.pop(loan.id, None)
+            self.loan_repository.update_remaining_balance(loan.id, Decimal(balance) / CENTS)
+            if loan.status == 'paid_off':
+                totals["paid_off"] += 1
+                self.notification_service.create_notification(
+                    user_id=user_id,
+                    title="Prestito Estinto",
+                    message=f"Il prestito {loan.type} di €{loan.amount:,.2f} è stato rimborsato completamente",
+                    notification_type="success"
+                )
+        
+        totals["collected"] += collected
+        if repaid and loan_account is not None:
+            # variazione e non saldo assoluto: i movimenti concorrenti sul conto non vanno persi
+            self.account_repository.adjust_balance(loan_account.id, Decimal(repaid) / CENTS)
+    
+    def _first_miss(self, loans: List[Loan], as_of: datetime) -> bool:
+        
+        # una sola notifica per periodo scaduto: le esecuzioni orarie successive non la ripetono
+        first = False
+        for loan in loans:
+            target = due_period(loan, as_of)
+            if target > self._notified_periods.get(loan.id, 0):
+                self._notified_periods[loan.id] = target
+                first = True
+        return first
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        return {
+            "runs": self.runs,
+            "installments": self.installments,
+            "collected": self.collected,
+            "paid_off": self.paid_off,
+            "failed": self.failed,
+            "running": self._run_lock.locked(),
+            "last_run": self.last_run
+        }
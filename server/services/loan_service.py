@@ -1,16 +1,20 @@
 
 
-import threading
-import time
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from decimal import Decimal
 from datetime import datetime
 from uuid import uuid4
-from models.loan import Loan, LoanApplication, LoanType, LoanStatus, LoanApplicationStatus
+import numpy as np
+from models.loan import Loan, LoanApplication, LoanType, LoanStatus, LoanApplicationStatus, LoanRateType
 from repositories.loan_repository import LoanRepository
 from repositories.loan_application_repository import LoanApplicationRepository
 from repositories.account_repository import AccountRepository
 from repositories.transaction_repository import TransactionRepository
+from repositories.user_repository import UserRepository
+from services.amortization import AmortizationEngine, AmortizationSchedule, QuoteGrid
+from services.cash_flow_features import CashFlowFeatureStore
+from services.job_queue import DurableJobQueue
+from utils.dates import add_months
 
 
 class LoanService:
@@ -20,18 +24,64 @@ class LoanService:
     Gestisce erogazione fondi e creazione automatica di conti prestito.
     """
     
+    INTEREST_RATES = {
+        'personal': Decimal('8.5'),
+        'auto': Decimal('6.2'),
+        'mortgage': Decimal('4.8'),
+        'business': Decimal('9.5')
+    }
+    DEFAULT_RATE = Decimal('8.5')
+    DEFAULT_TERMS = {
+        'personal': 36,
+        'auto': 60,
+        'mortgage': 360,
+        'business': 60
+    }
+    DEFAULT_TERM = 36
+    # (DTI massimo %, reddito mensile minimo) per condizione lavorativa
+    EVALUATION_THRESHOLDS = {
+        'employed': (Decimal('40'), Decimal('2000')),
+        'self_employed': (Decimal('40'), Decimal('2000')),
+        'unemployed': (Decimal('25'), Decimal('3000')),
+        'retired': (Decimal('25'), Decimal('3000'))
+    }
+    DEFAULT_THRESHOLDS = (Decimal('20'), Decimal('4000'))
+    MIN_LOAN_AMOUNT = Decimal('1000')
+    MAX_LOAN_AMOUNT = Decimal('1000000')
+    MAX_WHAT_IF_SCENARIOS = 1000
+    
     
     def __init__(self,
                  loan_repository: LoanRepository,
                  loan_application_repository: LoanApplicationRepository,
                  account_repository: AccountRepository,
                  transaction_repository: TransactionRepository,
-                 notification_service):
+                 notification_service,
+                 amortization_engine: AmortizationEngine,
+                 cash_flow_features: CashFlowFeatureStore,
+                 user_repository: UserRepository,
+                 evaluation_delay: float = 60.0,
+                 evaluation_workers: int = 4,
+                 max_pending_evaluations: int = 10000,
+                 evaluation_queue_path: str = ':memory:'):
         self.loan_repository = loan_repository
         self.loan_application_repository = loan_application_repository
         self.account_repository = account_repository
         self.transaction_repository = transaction_repository
         self.notification_service = notification_service
+        self.amortization_engine = amortization_engine
+        self.cash_flow_features = cash_flow_features
+        self.user_repository = user_repository
+        # le richieste attendono evaluation_delay secondi in una coda persistente, poi un pool fisso le valuta a blocchi
+        self.evaluation_delay = evaluation_delay
+        self.evaluation_queue = DurableJobQueue(
+            evaluation_queue_path,
+            self._run_evaluation_job,
+            queue_name="loan-evaluation",
+            workers=evaluation_workers,
+            max_pending=max_pending_evaluations,
+            on_dead=self._reject_failed_evaluation
+        )
     
     def get_user_loans(self, user_id: str) -> List[Loan]:
         
@@ -46,28 +96,16 @@ class LoanService:
     
     def create_loan_application(self, user_id: str, loan_type: LoanType, amount: Decimal,
                                purpose: str, income: Decimal, employment_status: str,
-                               term_months: int) -> LoanApplication:
+                               term_months: int, rate_type: LoanRateType = 'fixed') -> LoanApplication:
         """Create a new loan application."""
         # Estimate credit score for demo (normally this would come from credit bureau)
         credit_score = 750  # Default for demo
         
         # Estimate interest rate based on loan type and credit score
-        base_rates = {
-            'personal': Decimal('8.5'),
-            'auto': Decimal('6.2'),
-            'mortgage': Decimal('4.8'),
-            'business': Decimal('9.5')
-        }
-        estimated_rate = base_rates.get(loan_type, Decimal('8.5'))
+        estimated_rate = self.INTEREST_RATES.get(loan_type, self.DEFAULT_RATE)
         
         # Calculate estimated monthly payment
-        monthly_interest_rate = estimated_rate / Decimal('100') / Decimal('12')
-        if monthly_interest_rate > 0:
-            estimated_monthly = amount * (
-                monthly_interest_rate * (1 + monthly_interest_rate) ** term_months
-            ) / ((1 + monthly_interest_rate) ** term_months - 1)
-        else:
-            estimated_monthly = amount / term_months
+        estimated_monthly = self.calculate_monthly_payment(amount, estimated_rate, term_months)
         
         # Create loan application
         application = LoanApplication(
@@ -83,23 +121,16 @@ class LoanService:
             credit_score=credit_score,
             estimated_rate=estimated_rate,
             estimated_monthly=estimated_monthly,
-            submitted_date=datetime.now()
+            submitted_date=datetime.now(),
+            rate_type=rate_type
         )
         
         return self.loan_application_repository.create(application)
     
     def create_loan(self, user_id: str, loan_type: LoanType, amount: Decimal,
-                   interest_rate: Decimal, term_months: int) -> Loan:
+                   interest_rate: Decimal, term_months: int, rate_type: LoanRateType = 'fixed') -> Loan:
         
-        
-        monthly_interest_rate = interest_rate / Decimal('100') / Decimal('12')
-        if monthly_interest_rate > 0:
-            monthly_payment = amount * (
-                monthly_interest_rate * (1 + monthly_interest_rate) ** term_months
-            ) / ((1 + monthly_interest_rate) ** term_months - 1)
-        else:
-            
-            monthly_payment = amount / term_months
+        monthly_payment = self.calculate_monthly_payment(amount, interest_rate, term_months)
         
         
         loan = Loan(
@@ -113,7 +144,8 @@ class LoanService:
             remaining_balance=amount,
             status='active',
             created_at=datetime.now(),
-            updated_at=datetime.now()
+            updated_at=datetime.now(),
+            rate_type=rate_type
         )
         
         created_loan = self.loan_repository.create(loan)
@@ -123,8 +155,7 @@ class LoanService:
         if loan_accounts:
             
             loan_account = loan_accounts[0]
-            new_balance = loan_account.balance - amount  
-            self.account_repository.update_balance(loan_account.id, new_balance)
+            self.account_repository.adjust_balance(loan_account.id, -amount)
         else:
             
             from models.account import Account
@@ -139,8 +170,7 @@ class LoanService:
         checking_accounts = self.account_repository.find_by_type(user_id, 'checking')
         if checking_accounts:
             primary_account = checking_accounts[0]
-            new_balance = primary_account.balance + amount
-            self.account_repository.update_balance(primary_account.id, new_balance)
+            self.account_repository.adjust_balance(primary_account.id, amount)
             
             
             from models.transaction import Transaction
@@ -176,16 +206,135 @@ class LoanService:
     
     def calculate_monthly_payment(self, amount: Decimal, interest_rate: Decimal, term_months: int) -> Decimal:
         
-        monthly_interest_rate = interest_rate / Decimal('100') / Decimal('12')
-        if monthly_interest_rate > 0:
-            monthly_payment = amount * (
-                monthly_interest_rate * (1 + monthly_interest_rate) ** term_months
-            ) / ((1 + monthly_interest_rate) ** term_months - 1)
-        else:
-            
-            monthly_payment = amount / term_months
+        # rata contrattuale al centesimo, memorizzata dal motore di ammortamento
+        return self.amortization_engine.monthly_payment(amount, interest_rate, term_months)
+    
+    def get_amortization_schedule(self, amount: Decimal, interest_rate: Decimal, term_months: int,
+                                  exact: bool = False) -> AmortizationSchedule:
+        
+        return self.amortization_engine.schedule(amount, interest_rate, term_months, exact)
+    
+    def get_quote_grid(self, amounts: List[Decimal], rates: List[Decimal], terms: List[int]) -> QuoteGrid:
+        
+        return self.amortization_engine.quote_grid(amounts, rates, terms)
+    
+    def get_loan_schedule(self, user_id: str, loan_id: str, exact: bool = True) -> AmortizationSchedule:
+        
+        loan = self.loan_repository.get_by_id(loan_id)
+        if not loan or loan.user_id != user_id:
+            raise ValueError("Loan not found or access denied")
+        return self.amortization_engine.schedule(loan.amount, loan.interest_rate, loan.term_months, exact)
+    
+    def simulate_loan_scenarios(self, user_id: str, loan_id: str, scenarios: List[Dict[str, Any]]) -> Dict[str, Any]:
+        
+        # base e scenari sono righe degli stessi array in forma chiusa: uno scenario neutro non sposta i totali
+        if not scenarios:
+            raise ValueError("At least one scenario is required")
+        if len(scenarios) > self.MAX_WHAT_IF_SCENARIOS:
+            raise ValueError(f"At most {self.MAX_WHAT_IF_SCENARIOS} scenarios per request")
+        loan = self.loan_repository.get_by_id(loan_id)
+        if not loan or loan.user_id != user_id:
+            raise ValueError("Loan not found or access denied")
+        if loan.status != 'active':
+            raise ValueError("Only active loans can be simulated")
+        paid = loan.last_paid_period
+        remaining_months = loan.term_months - paid
+        balance = float(loan.remaining_balance)
+        
+        # una riga per scenario, la prima è il piano corrente: debito di partenza, tasso,
+        # rata fissa (nan = da ricalcolare), durata, extra, esborso immediato
+        starting_balances, rates, fixed_payments = [balance], [float(loan.interest_rate)], [float(loan.monthly_payment)]
+        terms, extras, upfront = [remaining_months], [0.0], [0.0]
+        for position, scenario in enumerate(scenarios):
+            kind = scenario.get('type')
+            extra = self._scenario_number(scenario, 'extraMonthly', 0, position)
+            if extra < 0:
+                raise ValueError(f"Scenario {position}: extraMonthly cannot be negative")
+            if kind == 'prepayment':
+                lump_sum = self._scenario_number(scenario, 'lumpSum', 0, position)
+                mode = scenario.get('mode', 'reduce_term')
+                if not 0 <= lump_sum <= balance:
+                    raise ValueError(f"Scenario {position}: lumpSum must be between 0 and the remaining balance")
+                if mode not in ('reduce_term', 'reduce_payment'):
+                    raise ValueError(f"Scenario {position}: mode must be reduce_term or reduce_payment")
+                # reduce_term mantiene la rata e accorcia il piano, reduce_payment ricalcola la rata sui mesi residui
+                starting_balances.append(balance - lump_sum)
+                rates.append(float(loan.interest_rate))
+                fixed_payments.append(float(loan.monthly_payment) if mode == 'reduce_term' else np.nan)
+                terms.append(remaining_months)
+                upfront.append(lump_sum)
+            elif kind == 'refinance':
+                if 'rate' not in scenario:
+                    raise ValueError(f"Scenario {position}: rate is required for refinance")
+                rate = self._scenario_number(scenario, 'rate', None, position)
+                term = int(self._scenario_number(scenario, 'termMonths', remaining_months, position))
+                fees = self._scenario_number(scenario, 'fees', 0, position)
+                if not 0 <= rate <= 50:
+                    raise ValueError(f"Scenario {position}: rate must be between 0 and 50")
+                if not 1 <= term <= 360:
+                    raise ValueError(f"Scenario {position}: termMonths must be between 1 and 360")
+                if fees < 0:
+                    raise ValueError(f"Scenario {position}: fees cannot be negative")
+                # spese pagate subito oppure aggiunte al nuovo debito
+                financed = bool(scenario.get('financeFees', False))
+                starting_balances.append(balance + fees if financed else balance)
+                rates.append(rate)
+                fixed_payments.append(np.nan)
+                terms.append(term)
+                upfront.append(0.0 if financed else fees)
+            else:
+                raise ValueError(f"Scenario {position}: type must be prepayment or refinance")
+            extras.append(extra)
+        
+        start = np.array(starting_balances)
+        rate = np.array(rates)
+        fixed = np.array(fixed_payments)
+        recomputed = self.amortization_engine.annuity_payment(start, rate, np.array(terms))
+        # rata al centesimo con arrotondamento per eccesso a metà, come la rata contrattuale
+        installment = np.where(np.isnan(fixed), np.floor(recomputed * 100 + 0.5) / 100, fixed) + np.array(extras)
+        months, paid_total = self.amortization_engine.payoff(start, rate, installment)
+        # come nel piano contrattuale, un residuo da arrotondamento si chiude con l'ultima rata del termine
+        months = np.minimum(months, np.array(terms))
+        total_cost = paid_total + np.array(upfront)
+        interest = total_cost - balance
+        base_months, base_total, base_interest = int(months[0]), float(total_cost[0]), float(interest[0])
+        
+        results = []
+        columns = zip(scenarios, installment[1:].tolist(), months[1:].tolist(), total_cost[1:].tolist(), interest[1:].tolist())
+        for position, (scenario, payment, scenario_months, cost, scenario_interest) in enumerate(columns):
+            results.append({
+                "index": position,
+                "scenario": scenario,
+                "monthly_payment": round(payment, 2),
+                "payment_change": round(payment - float(loan.monthly_payment), 2),
+                "remaining_months": scenario_months,
+                "months_saved": base_months - scenario_months,
+                "payoff_date": add_months(loan.created_at, paid + scenario_months).date().isoformat(),
+                "total_payment": round(cost, 2),
+                "total_interest": round(scenario_interest, 2),
+                "interest_saved": round(base_interest - scenario_interest, 2)
+            })
+        return {
+            "loan_id": loan.id,
+            "base": {
+                "monthly_payment": loan.monthly_payment,
+                "remaining_balance": loan.remaining_balance,
+                "remaining_months": base_months,
+                "payoff_date": add_months(loan.created_at, paid + base_months).date().isoformat(),
+                "total_payment": round(base_total, 2),
+                "total_interest": round(base_interest, 2)
+            },
+            "scenarios": results
+        }
+    
+    @staticmethod
+    def _scenario_number(scenario: Dict[str, Any], key: str, default: Optional[float], position: int) -> float:
         
-        return monthly_payment
+        # NaN e infiniti superano i confronti di validazione: rifiutati subito
+        value = float(scenario[key] if default is None else scenario.get(key, default))
+        if not np.isfinite(value):
+            raise ValueError(f"Scenario {position}: {key} must be a finite number")
+        return value
     
     def evaluate_loan_application(self, application_data: Dict[str, Any]) -> Dict[str, Any]:
         
@@ -198,31 +347,16 @@ class LoanService:
             employment_status = application_data['employmentStatus']
             
             
-            interest_rates = {
-                'personal': Decimal('8.5'),
-                'auto': Decimal('6.2'),
-                'mortgage': Decimal('4.8'),
-                'business': Decimal('9.5')
-            }
-            interest_rate = interest_rates.get(loan_type, Decimal('8.5'))
-            
-            
-            default_terms = {
-                'personal': 36,
-                'auto': 60,
-                'mortgage': 360,
-                'business': 60
-            }
-            term_months = int(application_data.get('termMonths', default_terms.get(loan_type, 36)))
+            interest_rate = self.INTEREST_RATES.get(loan_type, self.DEFAULT_RATE)
+            term_months = int(application_data.get('termMonths', self.DEFAULT_TERMS.get(loan_type, self.DEFAULT_TERM)))
             
             
             monthly_payment = self.calculate_monthly_payment(amount, interest_rate, term_months)
             monthly_income = annual_income / Decimal('12')
             
             
-            user_accounts = self.account_repository.find_by_user_id(user_id)
-            account_ids = [acc.id for acc in user_accounts]
-            existing_debt_payments = self.transaction_repository.get_monthly_expenses(account_ids)
+            # impegni esistenti: spesa mensile media sulla finestra mobile, letta dall'archivio incrementale
+            existing_debt_payments = self.cash_flow_features.get_monthly_expenses(user_id)
             
             
             total_monthly_debt = existing_debt_payments + monthly_payment
@@ -231,25 +365,13 @@ class LoanService:
             dti_ratio = self.calculate_dti_ratio(monthly_income, total_monthly_debt)
             
             
-            max_dti = Decimal('40')  
-            min_income = Decimal('2000')  
-            
-            
-            if employment_status in ['employed', 'self_employed']:
-                max_dti_threshold = max_dti  
-                min_income_threshold = min_income  
-            elif employment_status in ['unemployed', 'retired']:
-                max_dti_threshold = Decimal('25')  
-                min_income_threshold = Decimal('3000')  
-            else:
-                max_dti_threshold = Decimal('20')
-                min_income_threshold = Decimal('4000')
+            max_dti_threshold, min_income_threshold = self.EVALUATION_THRESHOLDS.get(employment_status, self.DEFAULT_THRESHOLDS)
             
             approved = (
                 dti_ratio <= max_dti_threshold and
                 monthly_income >= min_income_threshold and
-                amount >= Decimal('1000') and
-                amount <= Decimal('1000000')
+                amount >= self.MIN_LOAN_AMOUNT and
+                amount <= self.MAX_LOAN_AMOUNT
             )
             
             evaluation_result = {
@@ -270,22 +392,92 @@ class LoanService:
                 'reason': f'Errore nella valutazione: {str(e)}'
             }
     
+    def evaluate_loan_applications(self, applications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        
+        # stesse regole di evaluate_loan_application: lettura dei campi riga per riga,
+        # impegni letti una volta per utente distinto, rate, DTI e decisioni su array NumPy
+        results: List[Optional[Dict[str, Any]]] = [None] * len(applications)
+        positions, user_ids, statuses = [], [], []
+        amounts, incomes, rates, terms, max_dtis, min_incomes = [], [], [], [], [], []
+        for position, application_data in enumerate(applications):
+            try:
+                user_id = application_data['userId']
+                loan_type = application_data['type']
+                amount = Decimal(str(application_data['amount']))
+                annual_income = Decimal(str(application_data['income']))
+                employment_status = application_data['employmentStatus']
+                interest_rate = self.INTEREST_RATES.get(loan_type, self.DEFAULT_RATE)
+                term_months = int(application_data.get('termMonths', self.DEFAULT_TERMS.get(loan_type, self.DEFAULT_TERM)))
+                # NaN e infiniti non superano i confronti con le soglie: scartati qui come errore della riga
+                if not amount.is_finite() or not annual_income.is_finite():
+                    raise ValueError("Amount and income must be finite numbers")
+                max_term = self.amortization_engine.MAX_TERM_MONTHS
+                if not 1 <= term_months <= max_term:
+                    raise ValueError(f"Term months must be between 1 and {max_term}")
+                max_dti_threshold, min_income_threshold = self.EVALUATION_THRESHOLDS.get(employment_status, self.DEFAULT_THRESHOLDS)
+            except Exception as e:
+                results[position] = {
+                    'approved': False,
+                    'dti_ratio': 100.0,
+                    'reason': f'Errore nella valutazione: {str(e)}'
+                }
+                continue
+            positions.append(position)
+            user_ids.append(user_id)
+            statuses.append(employment_status)
+            amounts.append(float(amount))
+            incomes.append(float(annual_income))
+            rates.append(float(interest_rate))
+            terms.append(term_months)
+            max_dtis.append(float(max_dti_threshold))
+            min_incomes.append(float(min_income_threshold))
+        if not positions:
+            return results
+        
+        
+        debt_by_user = {user_id: float(self.cash_flow_features.get_monthly_expenses(user_id)) for user_id in set(user_ids)}
+        existing_debt = np.array([debt_by_user.get(user_id, 0.0) for user_id in user_ids])
+        
+        
+        amount = np.array(amounts)
+        monthly_rate = np.array(rates) / 1200
+        term = np.array(terms, dtype=np.float64)
+        annuity = np.divide(monthly_rate, -np.expm1(-term * np.log1p(monthly_rate)),
+                            out=1.0 / term, where=monthly_rate > 0)
+        # rata al centesimo con arrotondamento per eccesso a metà, come la rata contrattuale
+        monthly_payment = np.floor(amount * annuity * 100 + 0.5) / 100
+        monthly_income = np.array(incomes) / 12
+        total_monthly_debt = existing_debt + monthly_payment
+        dti_ratio = np.divide(total_monthly_debt * 100, monthly_income,
+                              out=np.full(len(positions), 100.0), where=monthly_income > 0)
+        approved = (
+            (dti_ratio <= np.array(max_dtis)) &
+            (monthly_income >= np.array(min_incomes)) &
+            (amount >= float(self.MIN_LOAN_AMOUNT)) &
+            (amount <= float(self.MAX_LOAN_AMOUNT))
+        )
+        
+        
+        columns = zip(positions, statuses, approved.tolist(), dti_ratio.tolist(), monthly_payment.tolist(),
+                      monthly_income.tolist(), total_monthly_debt.tolist())
+        for position, employment_status, is_approved, dti, payment, income, debt in columns:
+            results[position] = {
+                'approved': is_approved,
+                'dti_ratio': dti,
+                'monthly_payment': payment,
+                'monthly_income': income,
+                'total_monthly_debt': debt,
+                'reason': self._get_evaluation_reason(is_approved, dti, income, employment_status)
+            }
+        return results
+    
     def _get_evaluation_reason(self, approved: bool, dti_ratio: Decimal, monthly_income: Decimal, employment_status: str) -> str:
         
         if approved:
             return f"Prestito approvato. DTI: {dti_ratio:.1f}%, reddito sostenibile per {employment_status}."
         
         reasons = []
-            
-        if employment_status in ['employed', 'self_employed']:
-            max_dti_threshold = Decimal('40')
-            min_income_threshold = Decimal('2000')
-        elif employment_status in ['unemployed', 'retired']:
-            max_dti_threshold = Decimal('25')
-            min_income_threshold = Decimal('3000')
-        else:
-            max_dti_threshold = Decimal('20')
-            min_income_threshold = Decimal('4000')
+        max_dti_threshold, min_income_threshold = self.EVALUATION_THRESHOLDS.get(employment_status, self.DEFAULT_THRESHOLDS)
         
         if dti_ratio > max_dti_threshold:
             reasons.append(f"DTI troppo alto ({dti_ratio:.1f}% > {max_dti_threshold}% per {employment_status})")
@@ -294,77 +486,112 @@ class LoanService:
 
         return "Prestito rifiutato: " + ", ".join(reasons)
     
-    def process_loan_application_async(self, application_data: Dict[str, Any], application_id: str) -> None:
-        """Process loan application asynchronously (simulate evaluation delay)."""
-        def evaluate_and_notify():
-            try:
-                self.loan_application_repository.update_status(application_id, 'evaluating')
-                
-                time.sleep(60)
-                
-                user_id = application_data['userId']
-                evaluation = self.evaluate_loan_application(application_data)
-                
-                if evaluation['approved']:
-                    application = self.loan_application_repository.get_by_id(application_id)
-                    if application:
-                        application.status = 'approved'
-                        application.approved_date = datetime.now()
-                    
-                    loan_type = application_data['type']
-                    amount = Decimal(str(application_data['amount']))
-                    
-                    
-                    interest_rates = {
-                        'personal': Decimal('8.5'),
-                        'auto': Decimal('6.2'),
-                        'mortgage': Decimal('4.8'),
-                        'business': Decimal('9.5')
-                    }
-                    interest_rate = interest_rates.get(loan_type, Decimal('8.5'))
-                    
-                    default_terms = {
-                        'personal': 36,
-                        'auto': 60,
-                        'mortgage': 360,
-                        'business': 60
-                    }
-                    term_months = int(application_data.get('termMonths', default_terms.get(loan_type, 36)))
-                    
-                    
-                    self.create_loan(user_id, loan_type, amount, interest_rate, term_months)
-                    
-                    
-                    self.notification_service.create_notification(
-                        user_id=user_id,
-                        title="Prestito Approvato",
-                        message=f"La tua richiesta di prestito {loan_type} di €{amount:,.2f} è stata approvata! DTI: {evaluation['dti_ratio']:.1f}%. Fondi erogati sul tuo conto.",
-                        notification_type="success"
-                    )
-                else:
-                    
-                    self.loan_application_repository.update_status(application_id, 'rejected', evaluation['reason'])
-
-                    self.notification_service.create_notification(
-                        user_id=user_id,
-                        title="Prestito Rifiutato",
-                        message=f"La tua richiesta di prestito non è stata approvata. {evaluation['reason']}",
-                        notification_type="error"
-                    )
-                    
-            except Exception as e:
-                
-                self.loan_application_repository.update_status(application_id, 'rejected', evaluation['reason'])
-
-
-                self.notification_service.create_notification(
-                    user_id=application_data.get('userId', 'unknown'),
-                    title=" Errore Valutazione",
-                    message=f"Si è verificato un errore durante la valutazione della richiesta: {str(e)}",
-                    notification_type="error"
-                )
+    def process_loan_application_async(self, application_data: Dict[str, Any], application_id: str) -> bool:
+        """Persist the delayed evaluation of a loan application; False when the queue is full."""
+        self.loan_application_repository.update_status(application_id, 'evaluating')
+        job = {'application_id': application_id, 'application': application_data}
+        try:
+            return self.evaluation_queue.enqueue(job, self.evaluation_delay)
+        except Exception as error:
+            # commit del lavoro fallito: la richiesta non resta in 'evaluating' senza un lavoro che la chiuda
+            print(f"Error persisting loan evaluation {application_id}: {error}")
+            return False
+    
+    def _run_evaluation_job(self, job: Dict[str, Any]) -> None:
         
+        application_data, application_id = job['application'], job['application_id']
+        application = self.loan_application_repository.get_by_id(application_id)
+        if application is not None and application.status != 'evaluating':
+            # lavoro riconsegnato dopo un esito già registrato
+            return
+        if not self.user_repository.exists(application_data['userId']):
+            # gli id utente cambiano a ogni avvio: il lavoro è scartato, nessun prestito per un utente sconosciuto
+            if application is not None:
+                self.loan_application_repository.update_status(application_id, 'rejected', "Utente non trovato")
+            print(f"Dropping loan evaluation {application_id}: unknown user {application_data['userId']}")
+            return
+        if application is None:
+            # richiesta persa con il riavvio del processo: viene ricostruita dal payload del lavoro
+            application = self._restore_application(application_data, application_id)
+        self._evaluate_and_notify(application_data, application_id)
+    
+    def _restore_application(self, application_data: Dict[str, Any], application_id: str) -> LoanApplication:
+        
+        loan_type = application_data['type']
+        amount = Decimal(str(application_data['amount']))
+        term_months = int(application_data.get('termMonths', 60))
+        estimated_rate = self.INTEREST_RATES.get(loan_type, self.DEFAULT_RATE)
+        return self.loan_application_repository.create(LoanApplication(
+            id=application_id,
+            user_id=application_data['userId'],
+            type=loan_type,
+            amount=amount,
+            purpose=application_data.get('purpose', f"{loan_type} loan"),
+            income=Decimal(str(application_data['income'])),
+            employment_status=application_data['employmentStatus'],
+            term_months=term_months,
+            status='evaluating',
+            credit_score=750,
+            estimated_rate=estimated_rate,
+            estimated_monthly=self.calculate_monthly_payment(amount, estimated_rate, term_months),
+            submitted_date=datetime.now(),
+            rate_type=application_data.get('rateType', 'fixed')
+        ))
+    
+    def _evaluate_and_notify(self, application_data: Dict[str, Any], application_id: str) -> None:
+        
+        # gli errori risalgono alla coda, che ritenta con backoff e alla fine chiama _reject_failed_evaluation
+        user_id = application_data['userId']
+        evaluation = self.evaluate_loan_application(application_data)
         
-        thread = threading.Thread(target=evaluate_and_notify)
-        thread.daemon = True
-        thread.start()
\ No newline at end of file
+        if evaluation['approved']:
+            loan_type = application_data['type']
+            amount = Decimal(str(application_data['amount']))
+            
+            
+            interest_rate = self.INTEREST_RATES.get(loan_type, self.DEFAULT_RATE)
+            term_months = int(application_data.get('termMonths', self.DEFAULT_TERMS.get(loan_type, self.DEFAULT_TERM)))
+            # tasso variabile solo se richiesto: è la parte del portafoglio che segue gli shock di tasso
+            rate_type = application_data.get('rateType', 'fixed')
+            
+            
+            self.create_loan(user_id, loan_type, amount, interest_rate, term_months, rate_type)
+            
+            # esito registrato solo a erogazione avvenuta: un nuovo tentativo non eroga due volte
+            application = self.loan_application_repository.get_by_id(application_id)
+            if application:
+                application.status = 'approved'
+                application.approved_date = datetime.now()
+            
+            
+            self.notification_service.create_notification(
+                user_id=user_id,
+                title="Prestito Approvato",
+                message=f"La tua richiesta di prestito {loan_type} di €{amount:,.2f} è stata approvata! DTI: {evaluation['dti_ratio']:.1f}%. Fondi erogati sul tuo conto.",
+                notification_type="success"
+            )
+        else:
+            
+            self.loan_application_repository.update_status(application_id, 'rejected', evaluation['reason'])
+            
+            self.notification_service.create_notification(
+                user_id=user_id,
+                title="Prestito Rifiutato",
+                message=f"La tua richiesta di prestito non è stata approvata. {evaluation['reason']}",
+                notification_type="error"
+            )
+    
+    def _reject_failed_evaluation(self, job: Dict[str, Any], error: str) -> None:
+        
+        # tentativi esauriti: il motivo deriva dall'ultimo errore
+        application_data, application_id = job['application'], job['application_id']
+        if self.loan_application_repository.exists(application_id):
+            self.loan_application_repository.update_status(application_id, 'rejected', f"Errore nella valutazione: {error}")
+        
+        
+        self.notification_service.create_notification(
+            user_id=application_data.get('userId', 'unknown'),
+            title=" Errore Valutazione",
+            message=f"Si è verificato un errore durante la valutazione della richiesta: {error}",
+            notification_type="error"
+        )
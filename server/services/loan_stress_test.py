@@ -0,0 +1,230 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from repositories.loan_repository import LoanRepository
+from services.amortization import AmortizationEngine
+from services.cash_flow_features import CashFlowFeatureStore
+
+
+LOAN_TYPES = ('personal', 'mortgage', 'auto', 'business')
+
+
+@dataclass(frozen=True, eq=False)
+class LoanBook:
+    """
+    Fotografia del portafoglio prestiti attivi in array paralleli, una riga per prestito.
+    I flussi mensili dei debitori sono array per utente indicizzati da user_index.
+    Caricata una volta per esecuzione e condivisa in sola lettura con tutti gli scenari.
+    """
+    
+    type_index: np.ndarray
+    user_index: np.ndarray
+    balance: np.ndarray
+    annual_rate: np.ndarray
+    remaining_months: np.ndarray
+    payment: np.ndarray
+    variable: np.ndarray
+    user_income: np.ndarray
+    user_expenses: np.ndarray
+    
+    @property
+    def loans(self) -> int:
+        
+        return len(self.balance)
+    
+    @property
+    def users(self) -> int:
+        
+        return len(self.user_income)
+
+
+# portafoglio del processo figlio, impostato dall'initializer del pool (ereditato via fork)
+_STRESS_BOOK: Optional[LoanBook] = None
+
+
+def _init_scenario_worker(book: LoanBook) -> None:
+    
+    global _STRESS_BOOK
+    _STRESS_BOOK = book
+
+
+def _summary(values: np.ndarray) -> Dict[str, float]:
+    
+    if not len(values):
+        return {"mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"mean": round(float(values.mean()), 2), "p50": round(float(p50), 2),
+            "p90": round(float(p90), 2), "p99": round(float(p99), 2)}
+
+
+def run_scenario(book: LoanBook, rate_shock_bp: int, income_shock_pct: float,
+                 max_dti: float) -> Dict[str, Any]:
+    
+    # solo i variabili seguono lo shock: la rata contrattuale cresce della differenza di annualità sul residuo
+    payment = book.payment
+    if rate_shock_bp and book.variable.any():
+        variable = book.variable
+        shocked = np.maximum(book.annual_rate[variable] + rate_shock_bp / 100, 0.0)
+        delta = (AmortizationEngine.annuity_payment(book.balance[variable], shocked, book.remaining_months[variable]) -
+                 AmortizationEngine.annuity_payment(book.balance[variable], book.annual_rate[variable], book.remaining_months[variable]))
+        payment = payment.copy()
+        payment[variable] += delta
+    
+    income = book.user_income * (1 + income_shock_pct / 100)
+    debt_service = np.bincount(book.user_index, weights=payment, minlength=book.users)
+    known = income > 0
+    user_dti = np.divide(debt_service * 100, income, out=np.full(book.users, np.nan), where=known)
+    free_cash_flow = income - book.user_expenses - debt_service
+    # insolvenza attesa: DTI oltre soglia o flusso di cassa libero negativo; senza redditi noti non si stima
+    user_default = known & ((user_dti > max_dti) | (free_cash_flow < 0))
+    
+    loan_dti = user_dti[book.user_index]
+    loan_default = user_default[book.user_index]
+    payment_change = np.divide((payment - book.payment) * 100, book.payment,
+                               out=np.zeros(book.loans), where=book.payment > 0)
+    by_type = {}
+    for index, loan_type in enumerate(LOAN_TYPES):
+        mask = book.type_index == index
+        count = int(np.count_nonzero(mask))
+        if not count:
+            continue
+        defaults = mask & loan_default
+        dti = loan_dti[mask]
+        exposure = float(book.balance[mask].sum())
+        exposure_at_default = float(book.balance[defaults].sum())
+        by_type[loan_type] = {
+            "loans": count,
+            "variable_loans": int(np.count_nonzero(mask & book.variable)),
+            "exposure": round(exposure, 2),
+            "monthly_payment": _summary(payment[mask]),
+            "payment_change_pct": _summary(payment_change[mask]),
+            "dti": _summary(dti[~np.isnan(dti)]),
+            "projected_defaults": int(np.count_nonzero(defaults)),
+            "default_rate": round(float(np.count_nonzero(defaults)) / count, 4),
+            "exposure_at_default": round(exposure_at_default, 2),
+            "exposure_at_default_pct": round(exposure_at_default / exposure * 100, 2) if exposure else 0.0
+        }
+    return {
+        "rate_shock_bp": rate_shock_bp,
+        "income_shock_pct": income_shock_pct,
+        "borrowers": book.users,
+        "borrowers_without_income": int(np.count_nonzero(~known)),
+        "projected_borrower_defaults": int(np.count_nonzero(user_default)),
+        "projected_loan_defaults": int(np.count_nonzero(loan_default)),
+        "exposure_at_default": round(float(book.balance[loan_default].sum()), 2),
+        "by_type": by_type
+    }
+
+
+def _run_scenarios(scenarios: List[Tuple[int, float]], max_dti: float) -> List[Dict[str, Any]]:
+    
+    return [run_scenario(_STRESS_BOOK, rate_shock, income_shock, max_dti) for rate_shock, income_shock in scenarios]
+
+
+class LoanStressTestService:
+    """
+    Servizio di stress test del portafoglio prestiti su griglie di shock di tasso e di reddito.
+    Carica prestiti attivi e flussi mensili dei debitori in array una sola volta per esecuzione.
+    Ricalcola rate, DTI e insolvenze attese in forma vettoriale; scenari indipendenti anche su un pool di processi.
+    """
+    
+    DEFAULT_RATE_SHOCKS_BP = (0, 100, 200)
+    DEFAULT_INCOME_SHOCKS_PCT = (0, -10, -20)
+    DEFAULT_MAX_DTI = 50.0
+    MAX_SCENARIOS = 100
+    # le rate prestiti sono già nelle uscite: tolte per non contarle due volte con il servizio del debito
+    LOAN_EXPENSE_CATEGORY = "Prestiti"
+    
+    
+    def __init__(self, loan_repository: LoanRepository, cash_flow_features: CashFlowFeatureStore):
+        self.loan_repository = loan_repository
+        self.cash_flow_features = cash_flow_features
+    
+    def load_book(self) -> LoanBook:
+        
+        grouped = self.loan_repository.group_active_by_user()
+        user_ids = list(grouped)
+        type_codes = {loan_type: index for index, loan_type in enumerate(LOAN_TYPES)}
+        rows = [
+            (type_codes[loan.type], user_position, float(loan.remaining_balance), float(loan.interest_rate),
+             max(1, loan.term_months - loan.last_paid_period), float(loan.monthly_payment), loan.rate_type == 'variable')
+            for user_position, user_id in enumerate(user_ids)
+            for loan in grouped[user_id]
+        ]
+        columns = list(zip(*rows)) if rows else [()] * 7
+        flows = self.cash_flow_features.get_monthly_flows(user_ids, exclude_category=self.LOAN_EXPENSE_CATEGORY)
+        income, expenses = (list(column) for column in zip(*flows)) if flows else ([], [])
+        book = LoanBook(
+            type_index=np.array(columns[0], dtype=np.int8),
+            user_index=np.array(columns[1], dtype=np.int64),
+            balance=np.array(columns[2], dtype=np.float64),
+            annual_rate=np.array(columns[3], dtype=np.float64),
+            remaining_months=np.array(columns[4], dtype=np.float64),
+            payment=np.array(columns[5], dtype=np.float64),
+            variable=np.array(columns[6], dtype=bool),
+            user_income=np.array(income, dtype=np.float64),
+            user_expenses=np.array(expenses, dtype=np.float64)
+        )
+        for array in (book.type_index, book.user_index, book.balance, book.annual_rate, book.remaining_months,
+                      book.payment, book.variable, book.user_income, book.user_expenses):
+            array.setflags(write=False)
+        return book
+    
+    def run(self, rate_shocks_bp: Optional[Sequence[int]] = None, income_shocks_pct: Optional[Sequence[float]] = None,
+            max_dti: Optional[float] = None, processes: int = 0) -> Dict[str, Any]:
+        
+        rate_shocks = list(self.DEFAULT_RATE_SHOCKS_BP if rate_shocks_bp is None else rate_shocks_bp)
+        income_shocks = list(self.DEFAULT_INCOME_SHOCKS_PCT if income_shocks_pct is None else income_shocks_pct)
+        max_dti = self.DEFAULT_MAX_DTI if max_dti is None else float(max_dti)
+        if not rate_shocks or not income_shocks:
+            raise ValueError("Rate and income shocks must not be empty")
+        if len(rate_shocks) * len(income_shocks) > self.MAX_SCENARIOS:
+            raise ValueError(f"Stress test cannot exceed {self.MAX_SCENARIOS} scenarios")
+        if any(not -1000 <= shock <= 2000 for shock in rate_shocks):
+            raise ValueError("Rate shocks must be between -1000 and 2000 basis points")
+        if any(not -100 < shock <= 100 for shock in income_shocks):
+            raise ValueError("Income shocks must be between -100 and 100 percent")
+        if max_dti <= 0:
+            raise ValueError("Max DTI must be positive")
+        max_processes = os.cpu_count() or 1
+        if processes > max_processes:
+            raise ValueError(f"Processes cannot exceed {max_processes}")
+        
+        started = time.perf_counter()
+        book = self.load_book()
+        loaded = time.perf_counter()
+        scenarios = [(int(rate_shock), float(income_shock)) for rate_shock in rate_shocks for income_shock in income_shocks]
+        
+        if processes <= 1 or len(scenarios) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+            results = [run_scenario(book, rate_shock, income_shock, max_dti) for rate_shock, income_shock in scenarios]
+        else:
+            # il portafoglio arriva ai figli come argomento dell'initializer: con fork non viene serializzato
+            # e ogni esecuzione ha il proprio, senza stato globale condiviso nel processo padre
+            workers = min(processes, len(scenarios))
+            chunks = [scenarios[index::workers] for index in range(workers)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_scenario_worker, initargs=(book,)) as executor:
+                chunk_results = list(executor.map(_run_scenarios, chunks, [max_dti] * workers))
+            by_scenario = {
+                (result["rate_shock_bp"], result["income_shock_pct"]): result
+                for chunk in chunk_results for result in chunk
+            }
+            results = [by_scenario[scenario] for scenario in scenarios]
+        
+        finished = time.perf_counter()
+        return {
+            "loans": book.loans,
+            "borrowers": book.users,
+            "variable_loans": int(np.count_nonzero(book.variable)),
+            "max_dti": max_dti,
+            "scenarios": results,
+            "load_ms": round((loaded - started) * 1000, 3),
+            "compute_ms": round((finished - loaded) * 1000, 3),
+            "processes": processes if processes > 1 else 0
+        }
@@ -0,0 +1,329 @@
+import csv
+import json
+import math
+import random
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from repositories.investment_repository import AvailableAssetRepository
+
+
+# file tick binari: intestazione con l'elenco simboli, poi record (indice simbolo, timestamp ns, prezzo × PRICE_SCALE)
+TICK_FILE_MAGIC = b"FHTICK1\n"
+TICK_RECORD = struct.Struct('<IqQ')
+PRICE_SCALE = 10000
+
+TickBatch = Tuple[float, Dict[str, Decimal]]
+
+
+class MarketDataFeed(ABC):
+    """
+    Sorgente astratta di tick di prezzo per il servizio investimenti.
+    Produce batch di variazioni, ciascuno con il ritardo dal batch precedente.
+    Le implementazioni sono deterministiche a parità di seme o di file in ingresso.
+    """
+    
+    
+    @abstractmethod
+    def batches(self) -> Iterator[TickBatch]:
+        
+        pass
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        return {}
+
+
+class RandomWalkFeed(MarketDataFeed):
+    """
+    Passeggiata casuale uniforme sui prezzi correnti degli asset.
+    Ogni batch applica a tutti gli asset una variazione in ±max_variation.
+    Riproduce il comportamento storico del task di aggiornamento prezzi.
+    """
+    
+    
+    def __init__(self, available_asset_repository: AvailableAssetRepository, interval: float = 30.0,
+                 max_variation: float = 0.02, seed: Optional[int] = None):
+        self.available_asset_repository = available_asset_repository
+        self.interval = interval
+        self.max_variation = max_variation
+        self._random = random.Random(seed)
+    
+    def batches(self) -> Iterator[TickBatch]:
+        
+        while True:
+            snapshot = self.available_asset_repository.price_snapshot()
+            price_updates = {}
+            for symbol in sorted(snapshot.prices):
+                variation = self._random.uniform(-self.max_variation, self.max_variation)
+                new_price = snapshot.prices[symbol] * (1 + Decimal(str(variation)))
+                price_updates[symbol] = new_price.quantize(Decimal('0.01'))
+            yield self.interval, price_updates
+
+
+class GBMFeed(MarketDataFeed):
+    """
+    Simulatore di moto browniano geometrico con drift e volatilità per asset.
+    Mantiene lo stato in virgola mobile e genera i rendimenti di tutti gli asset in un colpo solo.
+    Pubblica solo i simboli il cui prezzo arrotondato al centesimo è cambiato.
+    """
+    
+    # drift e volatilità annui predefiniti per tipo di asset
+    DEFAULT_PARAMETERS = {
+        "Azione": (0.07, 0.25),
+        "ETF": (0.06, 0.15),
+        "Obbligazione": (0.03, 0.05)
+    }
+    FALLBACK_PARAMETERS = (0.05, 0.20)
+    SECONDS_PER_YEAR = 365 * 24 * 3600
+    
+    
+    def __init__(self, available_asset_repository: AvailableAssetRepository, interval: float = 1.0,
+                 parameters: Optional[Dict[str, Tuple[float, float]]] = None, time_scale: float = 1.0,
+                 seed: Optional[int] = None):
+        if interval < 0:
+            raise ValueError("Interval cannot be negative")
+        self.available_asset_repository = available_asset_repository
+        self.interval = interval
+        self.parameters = parameters or {}
+        # secondi simulati per secondo reale: accelera il tempo del modello senza cambiare la cadenza
+        self.time_scale = time_scale
+        self._rng = np.random.default_rng(seed)
+    
+    def batches(self) -> Iterator[TickBatch]:
+        
+        assets = sorted(self.available_asset_repository.get_all(), key=lambda asset: asset.symbol)
+        if not assets:
+            return
+        symbols = [asset.symbol for asset in assets]
+        snapshot = self.available_asset_repository.price_snapshot()
+        prices = np.array([float(snapshot.get(symbol) or asset.current_price) for symbol, asset in zip(symbols, assets)])
+        drift, volatility = np.array([
+            self.parameters.get(asset.symbol, self.DEFAULT_PARAMETERS.get(asset.asset_type, self.FALLBACK_PARAMETERS))
+            for asset in assets
+        ]).T
+        dt = max(self.interval, 1e-6) * self.time_scale / self.SECONDS_PER_YEAR
+        log_drift = (drift - 0.5 * volatility ** 2) * dt
+        log_scale = volatility * math.sqrt(dt)
+        published = np.round(prices, 2)
+        
+        while True:
+            prices *= np.exp(log_drift + log_scale * self._rng.standard_normal(len(symbols)))
+            rounded = np.maximum(np.round(prices, 2), 0.01)
+            changed = np.nonzero(rounded != published)[0]
+            published[changed] = rounded[changed]
+            yield self.interval, {symbols[index]: Decimal(f"{rounded[index]:.2f}") for index in changed}
+
+
+class ReplayFeed(MarketDataFeed):
+    """
+    Riproduzione di tick registrati da file CSV o binario.
+    Raggruppa i tick con lo stesso timestamp e rispetta gli intervalli originali divisi per speed.
+    Con speed a zero riproduce il file alla massima velocità possibile.
+    """
+    
+    
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        if speed < 0:
+            raise ValueError("Speed cannot be negative")
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+    
+    def batches(self) -> Iterator[TickBatch]:
+        
+        while True:
+            previous_timestamp = None
+            for timestamp, price_updates in self._grouped_ticks():
+                delay = 0.0
+                if previous_timestamp is not None and self.speed > 0:
+                    delay = max(0.0, (timestamp - previous_timestamp) / 1e9 / self.speed)
+                previous_timestamp = timestamp
+                yield delay, price_updates
+            if not self.loop:
+                return
+    
+    def _grouped_ticks(self) -> Iterator[Tuple[int, Dict[str, Decimal]]]:
+        
+        ticks = self._read_binary() if self._is_binary() else self._read_csv()
+        current_timestamp, current_updates = None, {}
+        for timestamp, symbol, price in ticks:
+            if timestamp != current_timestamp and current_updates:
+                yield current_timestamp, current_updates
+                current_updates = {}
+            current_timestamp = timestamp
+            current_updates[symbol] = price
+        if current_updates:
+            yield current_timestamp, current_updates
+    
+    def _is_binary(self) -> bool:
+        
+        with open(self.path, 'rb') as handle:
+            return handle.read(len(TICK_FILE_MAGIC)) == TICK_FILE_MAGIC
+    
+    def _read_csv(self) -> Iterator[Tuple[int, str, Decimal]]:
+        
+        # colonne: timestamp (secondi epoch, anche frazionari), symbol, price
+        with open(self.path, newline='') as handle:
+            for row in csv.DictReader(handle):
+                yield int(Decimal(row['timestamp']) * 1_000_000_000), row['symbol'], Decimal(row['price'])
+    
+    def _read_binary(self) -> Iterator[Tuple[int, str, Decimal]]:
+        
+        with open(self.path, 'rb') as handle:
+            symbols = read_tick_file_header(handle)
+            scale = Decimal(PRICE_SCALE)
+            while True:
+                chunk = handle.read(TICK_RECORD.size * 4096)
+                if not chunk:
+                    return
+                for symbol_index, timestamp, price in TICK_RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % TICK_RECORD.size]):
+                    yield timestamp, symbols[symbol_index], Decimal(price) / scale
+
+
+def read_tick_file_header(handle: BinaryIO) -> List[str]:
+    
+    if handle.read(len(TICK_FILE_MAGIC)) != TICK_FILE_MAGIC:
+        raise ValueError("Not a tick file")
+    return json.loads(handle.readline())
+
+
+class TickFileWriter:
+    """
+    Registratore dei tick applicati in formato binario compatibile con ReplayFeed.
+    Si registra come listener dei prezzi e scrive un record per simbolo aggiornato.
+    L'elenco simboli è fissato all'apertura del file.
+    """
+    
+    
+    def __init__(self, path: str, symbols: List[str]):
+        self.symbols = list(symbols)
+        self._indexes = {symbol: index for index, symbol in enumerate(self.symbols)}
+        self._handle = open(path, 'wb')
+        self._handle.write(TICK_FILE_MAGIC)
+        self._handle.write(json.dumps(self.symbols).encode() + b"\n")
+        self._lock = threading.Lock()
+    
+    def record_prices(self, snapshot, price_updates: Dict[str, Decimal]) -> None:
+        
+        timestamp = int(snapshot.created_at.timestamp() * 1_000_000_000)
+        records = b"".join(
+            TICK_RECORD.pack(self._indexes[symbol], timestamp, int(price * PRICE_SCALE))
+            for symbol, price in price_updates.items()
+            if symbol in self._indexes
+        )
+        with self._lock:
+            self._handle.write(records)
+            self._handle.flush()
+    
+    def close(self) -> None:
+        
+        with self._lock:
+            self._handle.close()
+
+
+class MarketDataRunner:
+    """
+    Esecutore di un feed di mercato su un thread dedicato.
+    Applica ogni batch tramite il servizio investimenti rispettando una tabella di marcia assoluta.
+    Traccia batch, tick, ritardo accumulato ed errori per il monitoraggio.
+    """
+    
+    
+    def __init__(self, feed: MarketDataFeed, investment_service, error_backoff: float = 60.0):
+        self.feed = feed
+        self.investment_service = investment_service
+        self.error_backoff = error_backoff
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.ticks = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self.started_at: Optional[float] = None
+        self.finished = False
+    
+    def start(self) -> None:
+        
+        self._thread = threading.Thread(target=self.run, name="market-data", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None) -> None:
+        
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def run(self, max_batches: Optional[int] = None) -> None:
+        
+        # scadenze calcolate da un'origine fissa: i ritardi non si accumulano batch dopo batch
+        self.started_at = time.monotonic()
+        deadline = self.started_at
+        for delay, price_updates in self.feed.batches():
+            if self._stop.is_set() or (max_batches is not None and self.batches >= max_batches):
+                break
+            deadline += delay
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                if self._stop.wait(remaining):
+                    break
+            elif delay > 0:
+                self.max_lag = max(self.max_lag, -remaining)
+            if price_updates:
+                try:
+                    self.investment_service.update_prices(price_updates)
+                except Exception as error:
+                    self.errors += 1
+                    print(f"Error updating prices: {error}")
+                    if self._stop.wait(self.error_backoff):
+                        break
+                    deadline = time.monotonic()
+                    continue
+            if price_updates:
+                self.batches += 1
+                self.ticks += len(price_updates)
+        self.finished = True
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        elapsed = time.monotonic() - self.started_at if self.started_at is not None else 0.0
+        return {
+            "feed": type(self.feed).__name__,
+            "batches": self.batches,
+            "ticks": self.ticks,
+            "ticks_per_second": (self.ticks / elapsed) if elapsed > 0 else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "errors": self.errors,
+            "finished": self.finished,
+            **self.feed.get_stats()
+        }
+
+
+def create_market_data_feed(kind: str, available_asset_repository: AvailableAssetRepository,
+                            interval: Optional[float] = None, seed: Optional[int] = None,
+                            path: Optional[str] = None, speed: float = 1.0, loop: bool = False,
+                            time_scale: float = 1.0) -> Optional[MarketDataFeed]:
+    
+    if kind == 'off':
+        return None
+    if kind == 'random_walk':
+        return RandomWalkFeed(available_asset_repository, 30.0 if interval is None else interval, seed=seed)
+    if kind == 'gbm':
+        return GBMFeed(available_asset_repository, 1.0 if interval is None else interval,
+                       time_scale=time_scale, seed=seed)
+    if kind == 'replay':
+        if not path:
+            raise ValueError("A tick file is required for replay")
+        return ReplayFeed(path, speed=speed, loop=loop)
+    if kind == 'ingest':
+        if not path:
+            raise ValueError("A tick source is required for ingestion")
+        from services.tick_ingestion import BinaryTickFeed
+        return BinaryTickFeed(path)
+    raise ValueError(f"Unknown market data feed {kind}")
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+from models.order import InvestmentOrder
+
+
+class OrderPipeline:
+    """
+    Pipeline degli ordini di compravendita eseguiti in micro-batch.
+    Accoda gli ordini in arrivo e li esegue a gruppi con un solo snapshot prezzi per batch.
+    Ogni chiamante riceve un Future risolto con il proprio eseguito o con l'errore.
+    """
+    
+    
+    def __init__(self, investment_service, batch_interval: float = 0.002, max_batch_size: int = 512):
+        if batch_interval < 0:
+            raise ValueError("Batch interval cannot be negative")
+        if max_batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        self.investment_service = investment_service
+        self.batch_interval = batch_interval
+        self.max_batch_size = max_batch_size
+        self._queue: "queue.Queue[Tuple[InvestmentOrder, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.filled = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.batches = 0
+        self.largest_batch = 0
+    
+    def submit(self, side: str, user_id: str, symbol: str, shares: str, account_id: str,
+               lot_method: Optional[str] = None) -> Future:
+        
+        try:
+            shares = Decimal(shares)
+        except InvalidOperation:
+            raise ValueError("Shares must be a number")
+        # ordine validato qui: un valore non numerico non arriva al batch condiviso con altri utenti
+        order = InvestmentOrder(side, user_id, symbol, shares, account_id, lot_method=lot_method)
+        future: Future = Future()
+        self._ensure_worker()
+        with self._stats_lock:
+            self.submitted += 1
+        self._queue.put((order, future))
+        return future
+    
+    def execute(self, side: str, user_id: str, symbol: str, shares: str, account_id: str,
+                lot_method: Optional[str] = None, timeout: Optional[float] = 10.0) -> Dict[str, Any]:
+        
+        future = self.submit(side, user_id, symbol, shares, account_id, lot_method)
+        try:
+            return {**future.result(timeout), "status": "filled"}
+        except TimeoutError:
+            pass
+        # tempo scaduto: l'ordine ancora in coda viene annullato, quello già nel batch in esecuzione resta valido
+        cancelled = future.cancel()
+        with self._stats_lock:
+            self.timed_out += 1
+            self.cancelled += cancelled
+        if cancelled:
+            return {"status": "cancelled", "message": "Ordine annullato: pipeline ordini sovraccarica, riprovare"}
+        return {"status": "pending", "message": "Ordine in esecuzione: l'esito sarà visibile negli investimenti del conto"}
+    
+    def _ensure_worker(self) -> None:
+        
+        # avvio pigro: il thread nasce nel processo che riceve il primo ordine
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="order-pipeline", daemon=True)
+                self._worker.start()
+    
+    def _run(self) -> None:
+        
+        while True:
+            batch = [self._queue.get()]
+            # finestra di raccolta: gli ordini arrivati entro batch_interval entrano nello stesso batch
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute_batch(batch)
+    
+    def _execute_batch(self, batch: List[Tuple[InvestmentOrder, Future]]) -> None:
+        
+        live = [(order, future) for order, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        try:
+            outcomes = self.investment_service.execute_orders([order for order, _ in live])
+        except Exception as error:
+            for _, future in live:
+                future.set_exception(error)
+            with self._stats_lock:
+                self.batches += 1
+                self.rejected += len(live)
+            return
+        
+        filled = 0
+        for (_, future), (result, error) in zip(live, outcomes):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+                filled += 1
+        with self._stats_lock:
+            self.batches += 1
+            self.filled += filled
+            self.rejected += len(live) - filled
+            self.largest_batch = max(self.largest_batch, len(live))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._stats_lock:
+            executed = self.filled + self.rejected
+            return {
+                "submitted": self.submitted,
+                "filled": self.filled,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "cancelled": self.cancelled,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "largest_batch": self.largest_batch,
+                "average_batch": (executed / self.batches) if self.batches else 0.0
+            }
@@ -0,0 +1,299 @@
+import threading
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_DOWN
+from functools import reduce
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from repositories.investment_repository import InvestmentRepository, AvailableAssetRepository
+from repositories.price_history_repository import PriceHistoryRepository
+
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+@dataclass(frozen=True)
+class CovarianceEstimate:
+    """
+    Stima di rendimenti attesi e covarianza annualizzati dell'universo investibile.
+    È legata alla versione dello storico prezzi da cui è stata calcolata.
+    Gli array sono in sola lettura e condivisi tra le richieste.
+    """
+    
+    history_version: int
+    symbols: Tuple[str, ...]
+    expected_returns: np.ndarray
+    covariance: np.ndarray
+    shrinkage: float
+    observations: int
+    periods_per_year: float
+
+
+class PortfolioOptimizationService:
+    """
+    Servizio di ottimizzazione media-varianza del portafoglio sul catalogo asset.
+    Stima la covarianza dallo storico prezzi con shrinkage Ledoit-Wolf e la memorizza per versione.
+    Risolve allocazioni long-only e calcola le operazioni rispetto alle posizioni correnti.
+    """
+    
+    MODES = ('max_sharpe', 'min_variance', 'target_volatility', 'frontier')
+    SHARE_QUANTUM = Decimal('0.0001')
+    
+    
+    def __init__(self,
+                 price_history_repository: PriceHistoryRepository,
+                 available_asset_repository: AvailableAssetRepository,
+                 investment_repository: InvestmentRepository,
+                 min_amount: Decimal,
+                 max_amount: Decimal,
+                 min_observations: int = 30,
+                 seconds_per_year: float = SECONDS_PER_YEAR,
+                 risk_free_rate: float = 0.02):
+        self.price_history_repository = price_history_repository
+        self.available_asset_repository = available_asset_repository
+        self.investment_repository = investment_repository
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.min_observations = min_observations
+        self.seconds_per_year = seconds_per_year
+        self.risk_free_rate = risk_free_rate
+        self._estimate: Optional[CovarianceEstimate] = None
+        self._lock = threading.Lock()
+        self.estimations = 0
+    
+    def get_estimate(self) -> CovarianceEstimate:
+        
+        # ricalcolo solo se lo storico è cambiato dall'ultima stima
+        version = self.price_history_repository.version
+        estimate = self._estimate
+        if estimate is not None and estimate.history_version == version:
+            return estimate
+        with self._lock:
+            estimate = self._estimate
+            if estimate is None or estimate.history_version != version:
+                estimate = self._estimate_covariance(version)
+                self._estimate = estimate
+                self.estimations += 1
+            return estimate
+    
+    def optimize(self, user_id: str, amount: Decimal = Decimal('0'), mode: str = 'max_sharpe',
+                 target_volatility: Optional[float] = None, max_weight: float = 1.0,
+                 points: int = 20) -> Dict[str, Any]:
+        
+        if mode not in self.MODES:
+            raise ValueError(f"Mode must be one of {', '.join(self.MODES)}")
+        if amount < 0:
+            raise ValueError("Amount cannot be negative")
+        if amount > 0 and not self.min_amount <= amount <= self.max_amount:
+            raise ValueError(f"Amount must be between {self.min_amount} and {self.max_amount}")
+        if mode == 'target_volatility' and (target_volatility is None or target_volatility <= 0):
+            raise ValueError("Target volatility must be positive")
+        if not 2 <= points <= 100:
+            raise ValueError("Points must be between 2 and 100")
+        
+        estimate = self.get_estimate()
+        symbol_count = len(estimate.symbols)
+        if not 1.0 / symbol_count <= max_weight <= 1.0:
+            raise ValueError(f"Max weight must be between {1.0 / symbol_count:.4f} and 1")
+        caps = np.full(symbol_count, max_weight)
+        
+        frontier = None
+        if mode == 'min_variance':
+            weights = self._solve(estimate, None, caps)
+        elif mode == 'target_volatility':
+            weights = self._solve_target_volatility(estimate, target_volatility / 100, caps)
+        else:
+            frontier = self._frontier(estimate, caps, points)
+            weights = max(frontier, key=lambda point: point[3])[0]
+        
+        result = self._allocation(estimate, weights)
+        result.update(self._trades(user_id, estimate, weights, amount))
+        result.update({
+            "mode": mode,
+            "history_version": estimate.history_version,
+            "observations": estimate.observations,
+            "periods_per_year": round(estimate.periods_per_year, 1),
+            "shrinkage": round(estimate.shrinkage, 4)
+        })
+        if mode == 'frontier':
+            result["frontier"] = [self._allocation(estimate, point[0]) for point in frontier]
+        return result
+    
+    def _estimate_covariance(self, version: int) -> CovarianceEstimate:
+        
+        # tick allineati per timestamp: ogni tick pubblica lo stesso istante per tutti i simboli aggiornati
+        series = {}
+        for asset in self.available_asset_repository.get_all():
+            ticks = self.price_history_repository.get_ticks(asset.symbol)
+            if len(ticks["price"]) > self.min_observations:
+                series[asset.symbol] = (np.asarray(ticks["timestamp"]), np.asarray(ticks["price"]))
+        if len(series) < 2:
+            raise ValueError("Not enough price history to estimate covariance")
+        
+        common = reduce(np.intersect1d, (timestamps for timestamps, _ in series.values()))
+        if common.size <= self.min_observations:
+            raise ValueError("Not enough aligned price history to estimate covariance")
+        symbols = tuple(series)
+        prices = np.column_stack([
+            prices[np.searchsorted(timestamps, common)] for timestamps, prices in series.values()
+        ])
+        returns = np.diff(np.log(prices), axis=0)
+        
+        observations, symbol_count = returns.shape
+        centered = returns - returns.mean(axis=0)
+        sample = centered.T @ centered / observations
+        
+        # shrinkage di Ledoit-Wolf verso l'identità scalata dalla varianza media
+        target_variance = np.trace(sample) / symbol_count
+        dispersion = np.sum((sample - target_variance * np.eye(symbol_count)) ** 2)
+        row_norms = np.sum(centered ** 2, axis=1)
+        estimation_error = (np.sum(row_norms ** 2) / observations - np.sum(sample ** 2)) / observations
+        shrinkage = float(min(1.0, estimation_error / dispersion)) if dispersion > 0 else 1.0
+        covariance = shrinkage * target_variance * np.eye(symbol_count) + (1 - shrinkage) * sample
+        
+        # rendimenti tra tick consecutivi: periodi annui dall'intervallo medio tra i timestamp allineati
+        span = float(common[-1] - common[0])
+        if span <= 0:
+            raise ValueError("Not enough aligned price history to estimate covariance")
+        periods_per_year = self.seconds_per_year * observations / span
+        expected_returns = returns.mean(axis=0) * periods_per_year
+        covariance = covariance * periods_per_year
+        expected_returns.setflags(write=False)
+        covariance.setflags(write=False)
+        return CovarianceEstimate(
+            history_version=version,
+            symbols=symbols,
+            expected_returns=expected_returns,
+            covariance=covariance,
+            shrinkage=shrinkage,
+            observations=observations,
+            periods_per_year=periods_per_year
+        )
+    
+    def _solve(self, estimate: CovarianceEstimate, risk_aversion: Optional[float], caps: np.ndarray,
+               start: Optional[np.ndarray] = None, iterations: int = 500) -> np.ndarray:
+        
+        # gradiente proiettato accelerato su max μ'w - λ/2 w'Σw; λ assente = minima varianza
+        covariance = estimate.covariance
+        linear = np.zeros_like(estimate.expected_returns) if risk_aversion is None else estimate.expected_returns
+        curvature = 1.0 if risk_aversion is None else risk_aversion
+        step = 1.0 / (curvature * np.linalg.eigvalsh(covariance)[-1])
+        
+        weights = self._project(np.full(len(caps), 1.0 / len(caps)) if start is None else start, caps)
+        momentum = weights
+        momentum_weight = 1.0
+        for _ in range(iterations):
+            gradient = linear - curvature * covariance @ momentum
+            updated = self._project(momentum + step * gradient, caps)
+            next_weight = (1 + np.sqrt(1 + 4 * momentum_weight ** 2)) / 2
+            momentum = updated + ((momentum_weight - 1) / next_weight) * (updated - weights)
+            if np.max(np.abs(updated - weights)) < 1e-10:
+                weights = updated
+                break
+            weights, momentum_weight = updated, next_weight
+        return weights
+    
+    def _solve_target_volatility(self, estimate: CovarianceEstimate, target: float, caps: np.ndarray) -> np.ndarray:
+        
+        # bisezione sull'avversione al rischio: la volatilità ottima decresce al crescere di λ
+        weights = self._solve(estimate, None, caps)
+        if self._volatility(estimate, weights) >= target:
+            return weights
+        low, high = np.log(1e-2), np.log(1e4)
+        best = weights
+        for _ in range(40):
+            middle = (low + high) / 2
+            candidate = self._solve(estimate, float(np.exp(middle)), caps, start=best)
+            if self._volatility(estimate, candidate) > target:
+                low = middle
+            else:
+                best = candidate
+                high = middle
+        return best
+    
+    def _frontier(self, estimate: CovarianceEstimate, caps: np.ndarray,
+                  points: int) -> List[Tuple[np.ndarray, float, float, float]]:
+        
+        frontier = []
+        weights = None
+        for risk_aversion in np.logspace(4, -2, points):
+            weights = self._solve(estimate, float(risk_aversion), caps, start=weights)
+            expected_return = float(estimate.expected_returns @ weights)
+            volatility = self._volatility(estimate, weights)
+            sharpe_ratio = (expected_return - self.risk_free_rate) / volatility if volatility > 0 else 0.0
+            frontier.append((weights, expected_return, volatility, sharpe_ratio))
+        return frontier
+    
+    @staticmethod
+    def _project(values: np.ndarray, caps: np.ndarray) -> np.ndarray:
+        
+        # proiezione euclidea sul simplesso con limiti superiori: bisezione sulla soglia τ
+        low, high = np.min(values) - 1.0, np.max(values)
+        for _ in range(60):
+            threshold = (low + high) / 2
+            if np.clip(values - threshold, 0.0, caps).sum() > 1.0:
+                low = threshold
+            else:
+                high = threshold
+        return np.clip(values - (low + high) / 2, 0.0, caps)
+    
+    @staticmethod
+    def _volatility(estimate: CovarianceEstimate, weights: np.ndarray) -> float:
+        
+        return float(np.sqrt(max(weights @ estimate.covariance @ weights, 0.0)))
+    
+    def _allocation(self, estimate: CovarianceEstimate, weights: np.ndarray) -> Dict[str, Any]:
+        
+        expected_return = float(estimate.expected_returns @ weights)
+        volatility = self._volatility(estimate, weights)
+        return {
+            "expected_return": round(expected_return * 100, 4),
+            "volatility": round(volatility * 100, 4),
+            "sharpe_ratio": round((expected_return - self.risk_free_rate) / volatility, 4) if volatility > 0 else 0.0,
+            "weights": {
+                symbol: round(float(weight), 6)
+                for symbol, weight in zip(estimate.symbols, weights)
+            }
+        }
+    
+    def _trades(self, user_id: str, estimate: CovarianceEstimate, weights: np.ndarray,
+                amount: Decimal) -> Dict[str, Any]:
+        
+        snapshot = self.available_asset_repository.price_snapshot()
+        holdings = {investment.symbol: investment.shares for investment in self.investment_repository.find_by_user_id(user_id)}
+        current_values = {
+            symbol: holdings.get(symbol, Decimal('0')) * (snapshot.get(symbol) or Decimal('0'))
+            for symbol in estimate.symbols
+        }
+        # le posizioni fuori dall'universo stimato restano invariate
+        total_value = sum(current_values.values(), Decimal('0')) + amount
+        
+        trades = []
+        for symbol, weight in zip(estimate.symbols, weights):
+            price = snapshot.get(symbol)
+            if not price:
+                continue
+            target_value = total_value * Decimal(str(round(float(weight), 6)))
+            difference = target_value - current_values[symbol]
+            shares = (abs(difference) / price).quantize(self.SHARE_QUANTUM, rounding=ROUND_DOWN)
+            if difference < 0:
+                shares = min(shares, holdings.get(symbol, Decimal('0')))
+            if shares == 0:
+                continue
+            trades.append({
+                "symbol": symbol,
+                "action": "buy" if difference > 0 else "sell",
+                "shares": str(shares),
+                "price": price,
+                "amount": (shares * price).quantize(Decimal('0.01')),
+                "current_value": current_values[symbol].quantize(Decimal('0.01')),
+                "target_value": target_value.quantize(Decimal('0.01'))
+            })
+        
+        return {
+            "total_value": total_value.quantize(Decimal('0.01')),
+            "price_version": snapshot.version,
+            "excluded_holdings": sorted(set(holdings) - set(estimate.symbols)),
+            "trades": trades
+        }
@@ -0,0 +1,143 @@
+import json
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from models.price import PriceSnapshot
+
+
+class PriceSubscription:
+    """
+    Coda di consegna di un singolo client dello stream prezzi.
+    Conserva al più un frame in attesa: i tick successivi vengono fusi per simbolo.
+    Un client lento riceve solo l'ultimo prezzo di ogni simbolo, mai un arretrato crescente.
+    """
+    
+    
+    def __init__(self):
+        self._condition = threading.Condition()
+        # frame già serializzato in attesa e relativi prezzi, per un'eventuale fusione
+        self._frame: Optional[bytes] = None
+        self._prices: Optional[Dict[str, float]] = None
+        self._version = 0
+        self._merged = False
+        self.closed = False
+        self.coalesced = 0
+    
+    def offer(self, frame: bytes, prices: Dict[str, float], version: int) -> None:
+        
+        with self._condition:
+            if self._prices is None:
+                self._frame, self._prices = frame, prices
+            else:
+                # il frame precedente non è stato ancora letto: si fonde invece di accodare
+                if not self._merged:
+                    self._prices = dict(self._prices)
+                    self._merged = True
+                self._prices.update(prices)
+                self._frame = None
+                self.coalesced += 1
+            self._version = version
+            self._condition.notify()
+    
+    def take(self, timeout: float) -> Optional[bytes]:
+        
+        # None allo scadere del timeout: il chiamante invia un heartbeat
+        with self._condition:
+            if self._prices is None and not self.closed:
+                self._condition.wait(timeout)
+            if self._prices is None:
+                return None
+            frame = self._frame or PriceStreamBroadcaster.encode(self._prices, self._version)
+            self._frame, self._prices, self._merged = None, None, False
+            return frame
+    
+    def close(self) -> None:
+        
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class PriceStreamBroadcaster:
+    """
+    Diffusione dei tick di prezzo ai client connessi tramite Server-Sent Events.
+    Ogni tick viene serializzato una sola volta e consegnato a tutti gli iscritti.
+    Limita il numero di connessioni per processo e tiene le statistiche di consegna.
+    """
+    
+    HEARTBEAT_FRAME = b": heartbeat\n\n"
+    
+    
+    def __init__(self, max_subscribers: int = 100, heartbeat_interval: float = 15.0, retry_ms: int = 3000):
+        if max_subscribers <= 0:
+            raise ValueError("Max subscribers must be positive")
+        self.max_subscribers = max_subscribers
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_ms = retry_ms
+        self._subscribers: Dict[int, PriceSubscription] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.rejected = 0
+        self._closed_coalesced = 0
+    
+    @staticmethod
+    def encode(prices: Dict[str, float], version: int) -> bytes:
+        
+        data = json.dumps({"version": version, "prices": prices}, separators=(',', ':'))
+        return f"id: {version}\nevent: prices\ndata: {data}\n\n".encode()
+    
+    def subscribe(self) -> Optional[PriceSubscription]:
+        
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscription = PriceSubscription()
+            self._subscribers[id(subscription)] = subscription
+            return subscription
+    
+    def unsubscribe(self, subscription: PriceSubscription) -> None:
+        
+        subscription.close()
+        with self._lock:
+            if self._subscribers.pop(id(subscription), None) is not None:
+                self._closed_coalesced += subscription.coalesced
+    
+    def publish(self, snapshot: PriceSnapshot, price_updates: Dict[str, Decimal]) -> None:
+        
+        # listener dei tick: una sola serializzazione condivisa da tutti gli iscritti
+        prices = {
+            symbol: float(price)
+            for symbol in price_updates
+            if (price := snapshot.get(symbol)) is not None
+        }
+        if not prices:
+            return
+        frame = self.encode(prices, snapshot.version)
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+            self.published += 1
+        for subscription in subscribers:
+            subscription.offer(frame, prices, snapshot.version)
+    
+    def stream(self, subscription: PriceSubscription, snapshot: PriceSnapshot):
+        
+        # primo frame con tutti i prezzi correnti, poi solo variazioni o heartbeat
+        try:
+            yield f"retry: {self.retry_ms}\n".encode()
+            yield self.encode({symbol: float(price) for symbol, price in snapshot.prices.items()}, snapshot.version)
+            while not subscription.closed:
+                yield subscription.take(self.heartbeat_interval) or self.HEARTBEAT_FRAME
+        finally:
+            self.unsubscribe(subscription)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "published": self.published,
+                "rejected": self.rejected,
+                "coalesced": self._closed_coalesced + sum(s.coalesced for s in self._subscribers.values())
+            }
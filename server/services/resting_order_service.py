@@ -0,0 +1,126 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+from models.order import InvestmentOrder, RestingOrder
+from models.price import PriceSnapshot
+from repositories.resting_order_repository import RestingOrderRepository
+
+
+class RestingOrderService:
+    """
+    Servizio per gli ordini limite e stop attivati dai tick di prezzo.
+    Valida e registra gli ordini, e a ogni tick esegue solo quelli la cui soglia è attraversata.
+    L'esecuzione passa per il normale flusso ordini del servizio investimenti.
+    """
+    
+    ORDER_LABELS = {
+        ('buy', 'limit'): "acquisto limite",
+        ('sell', 'limit'): "vendita limite",
+        ('buy', 'stop'): "acquisto stop",
+        ('sell', 'stop'): "vendita stop"
+    }
+    
+    
+    def __init__(self,
+                 resting_order_repository: RestingOrderRepository,
+                 investment_service,
+                 notification_service):
+        self.resting_order_repository = resting_order_repository
+        self.investment_service = investment_service
+        self.notification_service = notification_service
+        self.fired = 0
+        self.filled = 0
+        self.rejected = 0
+    
+    def place_order(self, user_id: str, account_id: str, symbol: str, side: str, order_type: str,
+                    trigger_price: Decimal, shares: Decimal) -> RestingOrder:
+        
+        account = self.investment_service.account_repository.get_by_id(account_id)
+        if not account or account.user_id != user_id:
+            raise ValueError("Account not found or access denied")
+        if not self.investment_service.available_asset_repository.find_by_symbol(symbol):
+            raise ValueError(f"Asset {symbol} not available for trading")
+        if side == 'sell':
+            investment = self.investment_service.investment_repository.find_by_symbol(user_id, symbol)
+            if not investment or investment.shares < shares:
+                raise ValueError("Insufficient shares to sell")
+        
+        order = RestingOrder(
+            id=str(uuid4()),
+            user_id=user_id,
+            account_id=account_id,
+            symbol=symbol,
+            side=side,
+            order_type=order_type,
+            trigger_price=trigger_price,
+            shares=shares,
+            created_at=datetime.now()
+        )
+        self.resting_order_repository.create(order)
+        
+        # soglia già attraversata al prezzo corrente: l'ordine viene eseguito subito
+        snapshot = self.investment_service.get_price_snapshot()
+        self.on_prices(snapshot, {symbol: snapshot.get(symbol)})
+        return order
+    
+    def cancel_order(self, order_id: str, user_id: str) -> RestingOrder:
+        
+        order = self.resting_order_repository.get_by_id(order_id)
+        if not order or order.user_id != user_id:
+            raise ValueError("Order not found or access denied")
+        cancelled = self.resting_order_repository.cancel(order_id)
+        if cancelled is None:
+            raise ValueError(f"Order is already {order.status}")
+        return cancelled
+    
+    def get_user_orders(self, user_id: str, status: Optional[str] = None) -> List[RestingOrder]:
+        
+        return self.resting_order_repository.find_by_user_id(user_id, status)
+    
+    def on_prices(self, snapshot: PriceSnapshot, price_updates: Dict[str, Decimal]) -> None:
+        
+        # listener dei tick: gli ordini scattati sono eseguiti in un unico batch al prezzo del tick
+        triggered: List[RestingOrder] = []
+        for symbol in price_updates:
+            price = snapshot.get(symbol)
+            if price is not None:
+                triggered.extend(self.resting_order_repository.pop_triggered(symbol, price))
+        if not triggered:
+            return
+        
+        outcomes = self.investment_service.execute_orders(
+            [InvestmentOrder(order.side, order.user_id, order.symbol, order.shares, order.account_id) for order in triggered],
+            price_snapshot=snapshot
+        )
+        now = datetime.now()
+        for order, (result, error) in zip(triggered, outcomes):
+            order.triggered_at = now
+            order.price_version = snapshot.version
+            if error is None:
+                order.status = 'filled'
+                order.fill_price = snapshot.get(order.symbol)
+                order.transaction_id = result["transaction"].id
+                self.filled += 1
+            else:
+                order.status = 'rejected'
+                order.rejection_reason = str(error)
+                self.rejected += 1
+                self.notification_service.create_notification(
+                    user_id=order.user_id,
+                    title="Ordine Non Eseguito",
+                    message=f"Ordine di {self.ORDER_LABELS[(order.side, order.order_type)]} su {order.symbol} "
+                            f"a €{order.trigger_price:.2f} non eseguito: {error}",
+                    notification_type="warning"
+                )
+            self.resting_order_repository.update(order.id, order)
+        self.fired += len(triggered)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        return {
+            "open": self.resting_order_repository.count_open(),
+            "fired": self.fired,
+            "filled": self.filled,
+            "rejected": self.rejected
+        }
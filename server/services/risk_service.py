@@ -0,0 +1,229 @@
+import math
+import threading
+from array import array
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Tuple
+from models.investment import AvailableAsset
+from models.price import PriceSnapshot
+from repositories.investment_repository import InvestmentRepository, AvailableAssetRepository
+
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+class RollingWindowStats:
+    """
+    Media e varianza su una finestra scorrevole di rendimenti con l'algoritmo di Welford.
+    Ogni osservazione entra ed esce dalla finestra con un aggiornamento O(1).
+    Non conserva i valori: quello in uscita viene fornito dal chiamante.
+    """
+    
+    
+    def __init__(self, size: int):
+        if size < 2:
+            raise ValueError("Window size must be at least 2")
+        self.size = size
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+    
+    def push(self, value: float, evicted: Optional[float]) -> None:
+        
+        if evicted is not None:
+            # rimozione inversa di Welford del valore uscito dalla finestra
+            if self.count == 1:
+                self.count, self.mean, self._m2 = 0, 0.0, 0.0
+            else:
+                self.count -= 1
+                delta = evicted - self.mean
+                self.mean -= delta / self.count
+                self._m2 -= delta * (evicted - self.mean)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self._m2 < 0.0:
+            # l'errore di arrotondamento delle rimozioni non deve produrre varianze negative
+            self._m2 = 0.0
+    
+    @property
+    def variance(self) -> float:
+        
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class RiskTracker:
+    """
+    Metriche di rischio correnti di una serie di rendimenti (asset o portafoglio).
+    Mantiene statistiche scorrevoli per più finestre, picco e drawdown massimo dell'indice.
+    Un buffer circolare condiviso fornisce a ogni finestra il rendimento in uscita e l'istante dei tick.
+    """
+    
+    
+    def __init__(self, windows: Tuple[int, ...]):
+        self.stats = {size: RollingWindowStats(size) for size in windows}
+        self.capacity = max(windows)
+        self._returns = array('d', bytes(8 * self.capacity))
+        self._timestamps = array('d', bytes(8 * self.capacity))
+        self._next = 0
+        self.observations = 0
+        # indice di ricchezza a base 1: il drawdown non risente di acquisti e vendite
+        self.index = 1.0
+        self.peak = 1.0
+        self.max_drawdown = 0.0
+        self.last_return = 0.0
+    
+    def observe(self, value: float, timestamp: float) -> None:
+        
+        for size, stats in self.stats.items():
+            evicted = self._returns[(self._next - size) % self.capacity] if self.observations >= size else None
+            stats.push(value, evicted)
+        self._returns[self._next] = value
+        self._timestamps[self._next] = timestamp
+        self._next = self._next + 1 if self._next + 1 < self.capacity else 0
+        self.observations += 1
+        self.last_return = value
+        
+        self.index *= 1.0 + value
+        if self.index > self.peak:
+            self.peak = self.index
+        drawdown = 1.0 - self.index / self.peak
+        if drawdown > self.max_drawdown:
+            self.max_drawdown = drawdown
+    
+    def periods_per_year(self, count: int, seconds_per_year: float) -> float:
+        
+        # i rendimenti sono per tick, non giornalieri: periodi annui dall'intervallo medio tra i tick della finestra
+        if count < 2:
+            return 0.0
+        newest = (self._next - 1) % self.capacity
+        oldest = (self._next - count) % self.capacity
+        span = self._timestamps[newest] - self._timestamps[oldest]
+        return seconds_per_year * (count - 1) / span if span > 0 else 0.0
+    
+    def to_dict(self, seconds_per_year: float, risk_free_rate: float) -> Dict[str, Any]:
+        
+        windows = {}
+        for size, stats in self.stats.items():
+            deviation = math.sqrt(stats.variance)
+            periods_per_year = self.periods_per_year(stats.count, seconds_per_year)
+            sharpe_ratio = 0.0
+            if deviation > 0 and periods_per_year > 0:
+                sharpe_ratio = (stats.mean - risk_free_rate / periods_per_year) / deviation * math.sqrt(periods_per_year)
+            windows[str(size)] = {
+                "observations": stats.count,
+                "periods_per_year": round(periods_per_year, 1),
+                "mean_return": round(stats.mean * 100, 6),
+                "volatility": round(deviation * 100, 6),
+                "annualized_volatility": round(deviation * math.sqrt(periods_per_year) * 100, 4),
+                "sharpe_ratio": round(sharpe_ratio, 4)
+            }
+        return {
+            "observations": self.observations,
+            "last_return": round(self.last_return * 100, 6),
+            "current_drawdown": round((1.0 - self.index / self.peak) * 100, 4),
+            "max_drawdown": round(self.max_drawdown * 100, 4),
+            "windows": windows
+        }
+
+
+class RiskMetricsService:
+    """
+    Servizio delle metriche di rischio aggiornate a ogni tick di prezzo.
+    Calcola volatilità, Sharpe e drawdown scorrevoli per asset e portafogli utente.
+    Il rendimento di portafoglio è ponderato sulle quote detenute e ignora i flussi di cassa.
+    """
+    
+    
+    def __init__(self,
+                 investment_repository: InvestmentRepository,
+                 available_asset_repository: AvailableAssetRepository,
+                 windows: Iterable[int] = (20, 100),
+                 seconds_per_year: float = SECONDS_PER_YEAR,
+                 risk_free_rate: float = 0.02):
+        self.investment_repository = investment_repository
+        self.available_asset_repository = available_asset_repository
+        self.windows = tuple(sorted(set(windows)))
+        if not self.windows:
+            raise ValueError("At least one window is required")
+        self.seconds_per_year = seconds_per_year
+        self.risk_free_rate = risk_free_rate
+        self._asset_trackers: Dict[str, RiskTracker] = {}
+        self._portfolio_trackers: Dict[str, RiskTracker] = {}
+        # ultimo prezzo osservato per simbolo: base dei rendimenti del tick successivo
+        self._last_prices: Dict[str, Decimal] = {}
+        self._lock = threading.Lock()
+        available_asset_repository.add_listener(self._on_asset_event)
+    
+    def _on_asset_event(self, event: str, asset: Optional[AvailableAsset]) -> None:
+        
+        # gli 'updated' dei tick sono gestiti da record_prices con il prezzo precedente
+        with self._lock:
+            if event == 'created':
+                self._last_prices[asset.symbol] = asset.current_price
+            elif event == 'deleted':
+                self._last_prices.pop(asset.symbol, None)
+                self._asset_trackers.pop(asset.symbol, None)
+            elif event == 'cleared':
+                self._last_prices.clear()
+                self._asset_trackers.clear()
+                self._portfolio_trackers.clear()
+    
+    def record_prices(self, snapshot: PriceSnapshot, price_updates: Dict[str, Decimal]) -> None:
+        
+        # listener dei tick: una osservazione per asset aggiornato e per detentore interessato
+        timestamp = snapshot.created_at.timestamp()
+        with self._lock:
+            price_deltas: Dict[str, Decimal] = {}
+            for symbol in price_updates:
+                new_price = snapshot.get(symbol)
+                if new_price is None:
+                    continue
+                old_price = self._last_prices.get(symbol)
+                self._last_prices[symbol] = new_price
+                if not old_price:
+                    continue
+                tracker = self._asset_trackers.get(symbol)
+                if tracker is None:
+                    tracker = self._asset_trackers[symbol] = RiskTracker(self.windows)
+                tracker.observe(float(new_price / old_price) - 1.0, timestamp)
+                price_deltas[symbol] = new_price - old_price
+            
+            # variazione di valore per utente dovuta ai soli prezzi: Δprezzo × quote
+            value_changes: Dict[str, Decimal] = {}
+            for symbol, price_delta in price_deltas.items():
+                for investment in self.investment_repository.find_holders(symbol):
+                    value_changes[investment.user_id] = (
+                        value_changes.get(investment.user_id, Decimal('0')) + investment.shares * price_delta
+                    )
+            
+            for user_id, value_change in value_changes.items():
+                # i totali del repository riflettono già il tick: il valore precedente è valore - variazione
+                market_value = self.investment_repository.get_total_value(user_id)
+                previous_value = market_value - value_change
+                if previous_value <= 0:
+                    continue
+                tracker = self._portfolio_trackers.get(user_id)
+                if tracker is None:
+                    tracker = self._portfolio_trackers[user_id] = RiskTracker(self.windows)
+                tracker.observe(float(value_change / previous_value), timestamp)
+    
+    def get_asset_risk(self, symbol: str) -> Optional[Dict[str, Any]]:
+        
+        with self._lock:
+            tracker = self._asset_trackers.get(symbol)
+            return tracker.to_dict(self.seconds_per_year, self.risk_free_rate) if tracker else None
+    
+    def get_portfolio_risk(self, user_id: str) -> Optional[Dict[str, Any]]:
+        
+        with self._lock:
+            tracker = self._portfolio_trackers.get(user_id)
+            return tracker.to_dict(self.seconds_per_year, self.risk_free_rate) if tracker else None
+    
+    def get_tracked_counts(self) -> Dict[str, int]:
+        
+        with self._lock:
+            return {
+                "assets": len(self._asset_trackers),
+                "portfolios": len(self._portfolio_trackers)
+            }
@@ -0,0 +1,190 @@
+import secrets
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from models.simulation import InvestmentSimulation
+from repositories.simulation_repository import SimulationRepository
+from repositories.price_history_repository import PriceHistoryRepository
+
+
+class SimulationService:
+    """
+    Servizio di simulazione Monte Carlo per le proiezioni di investimento.
+    Genera in blocco decine di migliaia di percorsi GBM o ricampionati dallo storico prezzi.
+    Calcola bande percentili, probabilità di perdita, Sharpe e max drawdown dai percorsi.
+    """
+    
+    # rendimento atteso e volatilità annui per livello di rischio
+    RISK_PROFILES = {
+        "conservative": (0.055, 0.082),
+        "moderate": (0.085, 0.125),
+        "aggressive": (0.12, 0.187)
+    }
+    RISK_FREE_RATE = 0.02
+    PERCENTILES = (5, 25, 50, 75, 95)
+    MAX_PATHS = 200000
+    # percorsi per blocco: limita la memoria a poche decine di MB anche su orizzonti lunghi
+    CHUNK_PATHS = 25000
+    
+    
+    def __init__(self,
+                 simulation_repository: SimulationRepository,
+                 price_history_repository: PriceHistoryRepository):
+        self.simulation_repository = simulation_repository
+        self.price_history_repository = price_history_repository
+    
+    def get_user_simulations(self, user_id: str) -> List[InvestmentSimulation]:
+        
+        return self.simulation_repository.find_by_user_id(user_id)
+    
+    def get_simulation(self, simulation_id: str) -> Optional[InvestmentSimulation]:
+        
+        return self.simulation_repository.get_by_id(simulation_id)
+    
+    def run_simulation(self, user_id: str, asset: str, amount: Decimal, strategy: str, risk_level: str,
+                       timeframe_years: int, paths: int = 10000, seed: Optional[int] = None,
+                       method: str = 'auto', steps_per_year: int = 12) -> InvestmentSimulation:
+        
+        if not amount.is_finite() or amount <= 0:
+            raise ValueError("Amount must be positive")
+        if not 1 <= timeframe_years <= 50:
+            raise ValueError("Timeframe must be between 1 and 50 years")
+        if not 100 <= paths <= self.MAX_PATHS:
+            raise ValueError(f"Paths must be between 100 and {self.MAX_PATHS}")
+        if method not in ('auto', 'gbm', 'bootstrap'):
+            raise ValueError("Method must be one of auto, gbm, bootstrap")
+        
+        seed = seed if seed is not None else secrets.randbits(63)
+        drift, volatility = self.RISK_PROFILES.get(risk_level, self.RISK_PROFILES['moderate'])
+        
+        
+        empirical_returns = None
+        symbol = asset if asset in self.price_history_repository.symbols() else None
+        if method != 'gbm' and symbol:
+            empirical_returns = self._empirical_step_returns(symbol, steps_per_year)
+        if method == 'bootstrap' and empirical_returns is None:
+            raise ValueError(f"Not enough price history for {asset} to bootstrap")
+        used_method = 'bootstrap' if empirical_returns is not None else 'gbm'
+        
+        yearly_values, max_drawdowns = self._simulate_paths(
+            float(amount), timeframe_years, paths, seed, steps_per_year,
+            drift, volatility, empirical_returns
+        )
+        
+        projected_returns, risk_metrics, simulated_volatility = self._summarize(
+            float(amount), yearly_values, max_drawdowns
+        )
+        expected_return = float(np.mean(yearly_values[:, -1] / float(amount)) ** (1 / timeframe_years) - 1)
+        
+        simulation = InvestmentSimulation(
+            id=str(uuid4()),
+            user_id=user_id,
+            asset=asset,
+            amount=amount,
+            strategy=strategy,
+            risk_level=risk_level,
+            timeframe_years=timeframe_years,
+            method=used_method,
+            paths=paths,
+            seed=seed,
+            expected_return=expected_return,
+            volatility=simulated_volatility,
+            projected_returns=projected_returns,
+            risk_metrics=risk_metrics,
+            submitted_date=datetime.now(),
+            symbol=symbol
+        )
+        return self.simulation_repository.create(simulation)
+    
+    def _simulate_paths(self, amount: float, years: int, paths: int, seed: int, steps_per_year: int,
+                        drift: float, volatility: float,
+                        empirical_returns: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        
+        rng = np.random.default_rng(seed)
+        steps = years * steps_per_year
+        dt = 1.0 / steps_per_year
+        
+        yearly_log_values = np.empty((years, paths), dtype=np.float64)
+        max_drawdowns = np.empty(paths, dtype=np.float64)
+        
+        for start in range(0, paths, self.CHUNK_PATHS):
+            count = min(self.CHUNK_PATHS, paths - start)
+            
+            # layout (passi, percorsi): ogni passo è un vettore contiguo su tutti i percorsi del blocco
+            if empirical_returns is None:
+                # GBM: incrementi logaritmici ~ N((mu - sigma²/2)dt, sigma·sqrt(dt))
+                increments = rng.standard_normal((steps, count), dtype=np.float32)
+                increments *= np.float32(volatility * np.sqrt(dt))
+                increments += np.float32((drift - 0.5 * volatility ** 2) * dt)
+            else:
+                increments = empirical_returns[rng.integers(0, empirical_returns.size, (steps, count))]
+            
+            # valore logaritmico, picco e drawdown massimo aggiornati passo per passo senza matrici intermedie
+            log_value = np.zeros(count, dtype=np.float32)
+            peak = np.zeros(count, dtype=np.float32)
+            drawdown = np.zeros(count, dtype=np.float32)
+            gap = np.empty(count, dtype=np.float32)
+            for step in range(steps):
+                log_value += increments[step]
+                np.maximum(peak, log_value, out=peak)
+                np.subtract(peak, log_value, out=gap)
+                np.maximum(drawdown, gap, out=drawdown)
+                if (step + 1) % steps_per_year == 0:
+                    yearly_log_values[(step + 1) // steps_per_year - 1, start:start + count] = log_value
+            max_drawdowns[start:start + count] = drawdown
+        
+        yearly_values = amount * np.exp(yearly_log_values.T)
+        return yearly_values, -np.expm1(-max_drawdowns)
+    
+    def _summarize(self, amount: float, yearly_values: np.ndarray,
+                   max_drawdowns: np.ndarray) -> Tuple[List[Dict[str, Any]], Dict[str, Any], float]:
+        
+        # percentili per rango tramite selezione parziale, senza ordinare ogni colonna
+        ranks = [round(percentile / 100 * (yearly_values.shape[0] - 1)) for percentile in self.PERCENTILES]
+        bands = np.partition(yearly_values, ranks, axis=0)[ranks]
+        mean_values = yearly_values.mean(axis=0)
+        
+        projected_returns = []
+        for year in range(yearly_values.shape[1]):
+            median = bands[self.PERCENTILES.index(50), year]
+            projected_returns.append({
+                "year": year + 1,
+                "value": str(round(float(median), 2)),
+                "annualReturn": str(round(((median / amount) ** (1 / (year + 1)) - 1) * 100, 2)),
+                "mean": round(float(mean_values[year]), 2),
+                "percentiles": {
+                    f"p{percentile}": round(float(bands[index, year]), 2)
+                    for index, percentile in enumerate(self.PERCENTILES)
+                }
+            })
+        
+        # rendimenti annuali semplici di ogni percorso
+        previous = np.concatenate((np.full((yearly_values.shape[0], 1), amount), yearly_values[:, :-1]), axis=1)
+        annual_returns = yearly_values / previous - 1
+        volatility = float(annual_returns.std())
+        mean_return = float(annual_returns.mean())
+        sharpe_ratio = (mean_return - self.RISK_FREE_RATE) / volatility if volatility > 0 else 0.0
+        
+        risk_metrics = {
+            "volatility": f"{volatility * 100:.2f}",
+            "sharpeRatio": f"{sharpe_ratio:.2f}",
+            "maxDrawdown": f"{float(np.partition(max_drawdowns, ranks[2])[ranks[2]]) * 100:.2f}",
+            "maxDrawdownP95": f"{float(np.partition(max_drawdowns, ranks[-1])[ranks[-1]]) * 100:.2f}",
+            "probabilityOfLoss": f"{float(np.mean(yearly_values[:, -1] < amount)) * 100:.2f}"
+        }
+        return projected_returns, risk_metrics, volatility
+    
+    def _empirical_step_returns(self, symbol: str, steps_per_year: int) -> Optional[np.ndarray]:
+        
+        # rendimenti logaritmici sovrapposti su finestre di ~252/steps_per_year giorni di borsa
+        closes = np.asarray(self.price_history_repository.get_bars(symbol, '1d')['close'], dtype=np.float64)
+        window = max(1, round(252 / steps_per_year))
+        if closes.size < 2 * window + 1 or np.any(closes <= 0):
+            return None
+        log_closes = np.log(closes)
+        step_returns = log_closes[window:] - log_closes[:-window]
+        return step_returns.astype(np.float32)
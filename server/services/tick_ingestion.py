@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from services.market_data import MarketDataFeed, PRICE_SCALE, TICK_FILE_MAGIC, TICK_RECORD, TickBatch
+
+
+# vista strutturata sui record '<IqQ': nessun oggetto Python per campo, solo array sul buffer
+TICK_DTYPE = np.dtype([('symbol', '<u4'), ('timestamp', '<i8'), ('price', '<u8')])
+
+
+ReadInto = Callable[[memoryview], int]
+
+
+def open_tick_source(address: str, timeout: float = 1.0) -> Tuple[Any, ReadInto]:
+    
+    # 'unix:/percorso' per un socket Unix, altrimenti un file di tick; si legge sempre nel buffer del chiamante
+    if address.startswith('unix:'):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(address[len('unix:'):])
+        connection.settimeout(timeout)
+        return connection, connection.recv_into
+    handle = open(address, 'rb', buffering=0)
+    return handle, handle.readinto
+
+
+class BinaryTickFeed(MarketDataFeed):
+    """
+    Feed di mercato alimentato da record binari a larghezza fissa da socket Unix o file.
+    Legge in un buffer riutilizzato e decodifica i record con viste numpy senza copie.
+    Per ogni lettura applica solo l'ultimo prezzo di ciascun simbolo e misura ritardo e scarti.
+    """
+    
+    
+    def __init__(self, address: str, buffer_records: int = 65536):
+        if buffer_records <= 0:
+            raise ValueError("Buffer size must be positive")
+        self.address = address
+        self._buffer = bytearray(TICK_RECORD.size * buffer_records)
+        self._lock = threading.Lock()
+        self.symbols: List[str] = []
+        self.records = 0
+        self.reads = 0
+        self.coalesced = 0
+        self.dropped_invalid = 0
+        self.dropped_stale = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+    
+    def batches(self) -> Iterator[TickBatch]:
+        
+        source, read_into = open_tick_source(self.address)
+        with source:
+            self.symbols = self._read_header(read_into)
+            scale = Decimal(PRICE_SCALE)
+            # ultimo timestamp applicato per simbolo: i record più vecchi sono scartati
+            last_timestamps = np.full(len(self.symbols), np.iinfo(np.int64).min, dtype=np.int64)
+            view = memoryview(self._buffer)
+            pending = 0
+            
+            while True:
+                try:
+                    received = read_into(view[pending:])
+                except (socket.timeout, TimeoutError):
+                    # nessun dato: batch vuoto per permettere al runner di verificare lo stop
+                    yield 0.0, {}
+                    continue
+                if not received:
+                    return
+                filled = pending + received
+                complete = filled - filled % TICK_RECORD.size
+                if complete:
+                    price_updates = self._decode(view[:complete], last_timestamps, scale)
+                else:
+                    price_updates = {}
+                # il record incompleto in coda viene spostato all'inizio del buffer
+                pending = filled - complete
+                if pending:
+                    view[:pending] = view[complete:filled]
+                if complete:
+                    yield 0.0, price_updates
+    
+    def _read_header(self, read_into: ReadInto) -> List[str]:
+        
+        # intestazione letta byte per byte: i record successivi restano tutti per il buffer
+        if self._read_exact(read_into, len(TICK_FILE_MAGIC)) != TICK_FILE_MAGIC:
+            raise ValueError("Not a tick stream")
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            line += self._read_exact(read_into, 1)
+        return json.loads(line)
+    
+    @staticmethod
+    def _read_exact(read_into: ReadInto, size: int) -> bytes:
+        
+        data = bytearray(size)
+        view = memoryview(data)
+        filled = 0
+        while filled < size:
+            try:
+                received = read_into(view[filled:])
+            except (socket.timeout, TimeoutError):
+                continue
+            if not received:
+                raise ValueError("Tick stream closed before header")
+            filled += received
+        return bytes(data)
+    
+    def _decode(self, data: memoryview, last_timestamps: np.ndarray, scale: Decimal) -> Dict[str, Decimal]:
+        
+        records = np.frombuffer(data, dtype=TICK_DTYPE)
+        symbol_ids = records['symbol']
+        timestamps = records['timestamp']
+        count = len(records)
+        
+        valid = symbol_ids < len(self.symbols)
+        invalid = count - int(np.count_nonzero(valid))
+        if invalid:
+            records = records[valid]
+            symbol_ids, timestamps = records['symbol'], records['timestamp']
+        fresh = timestamps >= last_timestamps[symbol_ids]
+        stale = len(records) - int(np.count_nonzero(fresh))
+        if stale:
+            records = records[fresh]
+            symbol_ids, timestamps = records['symbol'], records['timestamp']
+        
+        price_updates = {}
+        if len(records):
+            # tick più recente di ciascun simbolo nel blocco letto (a parità di timestamp l'ultimo arrivato)
+            order = np.lexsort((timestamps, symbol_ids))
+            sorted_ids = symbol_ids[order]
+            positions = order[np.append(sorted_ids[1:] != sorted_ids[:-1], True)]
+            unique_ids = symbol_ids[positions]
+            last_timestamps[unique_ids] = timestamps[positions]
+            prices = records['price'][positions]
+            price_updates = {
+                self.symbols[symbol_id]: Decimal(int(price)) / scale
+                for symbol_id, price in zip(unique_ids.tolist(), prices.tolist())
+            }
+            lag_ms = (time.time_ns() - int(timestamps.max())) / 1e6
+        else:
+            lag_ms = self.last_lag_ms
+        
+        with self._lock:
+            self.reads += 1
+            self.records += count
+            self.dropped_invalid += invalid
+            self.dropped_stale += stale
+            self.coalesced += len(records) - len(price_updates)
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        return price_updates
+    
+    def get_stats(self) -> Dict[str, Any]:
+        
+        with self._lock:
+            return {
+                "source": self.address,
+                "records": self.records,
+                "reads": self.reads,
+                "coalesced": self.coalesced,
+                "dropped_invalid": self.dropped_invalid,
+                "dropped_stale": self.dropped_stale,
+                "last_tick_lag_ms": round(self.last_lag_ms, 3),
+                "max_tick_lag_ms": round(self.max_lag_ms, 3)
+            }
+
+
+def generate_ticks(symbols: List[str], prices: List[float], rate: int, batch_records: int = 4096,
+                   seed: Optional[int] = None) -> Iterator[bytes]:
+    
+    # passeggiata casuale in tick interi, un blocco di record già serializzato per iterazione
+    rng = np.random.default_rng(seed)
+    levels = np.array([round(price * PRICE_SCALE) for price in prices], dtype=np.int64)
+    records = np.empty(batch_records, dtype=TICK_DTYPE)
+    interval = batch_records / rate if rate > 0 else 0.0
+    deadline = time.monotonic()
+    while True:
+        symbol_ids = rng.integers(0, len(symbols), batch_records)
+        steps = rng.integers(-5, 6, batch_records)
+        np.add.at(levels, symbol_ids, steps)
+        np.maximum(levels, 1, out=levels)
+        records['symbol'] = symbol_ids
+        records['timestamp'] = time.time_ns()
+        records['price'] = levels[symbol_ids]
+        yield records.tobytes()
+        deadline += interval
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def serve_ticks(address: str, symbols: List[str], prices: List[float], rate: int,
+                seed: Optional[int] = None, limit: Optional[int] = None) -> None:
+    
+    header = TICK_FILE_MAGIC + json.dumps(symbols).encode() + b"\n"
+    blocks = generate_ticks(symbols, prices, rate, seed=seed)
+    block_count = None if limit is None else max(1, limit // 4096)
+    
+    if not address.startswith('unix:'):
+        with open(address, 'wb') as handle:
+            handle.write(header)
+            for _ in range(block_count or 1):
+                handle.write(next(blocks))
+        return
+    
+    path = address[len('unix:'):]
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    print(f"Serving ticks on {path} at {rate} ticks/s")
+    while True:
+        connection, _ = server.accept()
+        try:
+            connection.sendall(header)
+            sent = 0
+            while block_count is None or sent < block_count:
+                connection.sendall(next(blocks))
+                sent += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            connection.close()
+        if block_count is not None:
+            break
+    server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generatore locale di tick binari per BinaryTickFeed")
+    parser.add_argument('address', help="unix:/percorso/socket oppure percorso di un file di tick")
+    parser.add_argument('--rate', type=int, default=200000, help="tick al secondo (0 = massima velocità)")
+    parser.add_argument('--symbols', default="ENI,ENEL,UCG,ISP,TIT,RACE,G,FTSE-MIB,BTP-10Y,CCT-5Y")
+    parser.add_argument('--prices', default="13.45,6.20,28.90,3.15,0.24,385.00,23.50,26.80,98.50,101.20")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--limit', type=int, default=None, help="numero di tick da produrre")
+    arguments = parser.parse_args()
+    serve_ticks(
+        arguments.address,
+        arguments.symbols.split(','),
+        [float(price) for price in arguments.prices.split(',')],
+        arguments.rate,
+        seed=arguments.seed,
+        limit=arguments.limit
+    )
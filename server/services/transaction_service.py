@@ -48,8 +48,7 @@ class TransactionService:
         created_transaction = self.transaction_repository.create(transaction)
         
         
-        new_balance = account.balance + amount
-        self.account_repository.update_balance(account_id, new_balance)
+        self.account_repository.adjust_balance(account_id, amount)
         
         
         if abs(amount) >= Decimal('1000'):